@@ -1,5 +1,6 @@
 import os
 
+import numpy as np
 from dotenv import load_dotenv
 from neo4j import GraphDatabase
 
@@ -7,7 +8,21 @@ load_dotenv()
 NEO4J_URI=os.getenv("NEO4J_URI")
 NEO4J_USERNAME=os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD=os.getenv("NEO4J_PASSWORD")
+# optional: int8 or binary, to also store a quantized copy of each product text embedding
+EMBEDDING_QUANTIZATION=os.getenv("EMBEDDING_QUANTIZATION")
 
+if EMBEDDING_QUANTIZATION not in (None, "", "int8", "binary"):
+    raise ValueError(f"EMBEDDING_QUANTIZATION must be int8 or binary, got {EMBEDDING_QUANTIZATION}")
+
+
+def quantize_embeddings(vectors, method):
+    # same codes as the app reads: int8 scales each vector so its largest component is +-127, binary packs the sign
+    # bits 8 per byte
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if method == "int8":
+        max_abs = np.abs(vectors).max(axis=1, keepdims=True)
+        return np.round(vectors / np.where(max_abs == 0, 1, max_abs) * 127).astype(np.int8)
+    return np.packbits(vectors > 0, axis=1)
 
 
 # Connect to the Neo4j database
@@ -54,6 +69,24 @@ OPTIONS {indexConfig: {
 # wait for index to come online
 driver.execute_query('CALL db.awaitIndex("product_text_embeddings", 300)')
 
+# store quantized copies of the text embeddings as byte arrays, for two-phase retrieval: candidates are found on the
+# compact copies (1 byte or 1 bit per dimension) and rescored against the full vectors, see patterns-app/quantization.py
+if EMBEDDING_QUANTIZATION:
+    print(f"Storing {EMBEDDING_QUANTIZATION} Product Text Embeddings")
+    records, _, _ = driver.execute_query('''
+    MATCH (n:Product) WHERE n.textEmbedding IS NOT NULL
+    RETURN elementId(n) AS id, n.textEmbedding AS embedding
+    ''')
+    codes = quantize_embeddings([r['embedding'] for r in records], EMBEDDING_QUANTIZATION)
+    quantized_property = "textEmbedding" + EMBEDDING_QUANTIZATION.capitalize()
+    rows = [{'id': r['id'], 'code': code.tobytes()} for r, code in zip(records, codes)]
+    for start in range(0, len(rows), 1000):
+        driver.execute_query(f'''
+        UNWIND $rows AS row
+        MATCH (n) WHERE elementId(n) = row.id
+        SET n.{quantized_property} = row.code,
+            n.{quantized_property}Hash = apoc.util.md5(n.textEmbedding)
+        ''', rows=rows[start:start + 1000])
 
 driver.close()
 
@@ -1,6 +1,7 @@
 import streamlit as st
 
 
+from resources import DATASET_CHAINS, warm_up
 from ui_utils import render_header_svg
 
 st.set_page_config(page_icon="images/logo-mark-fullcolor-RGB-transBG.svg", layout="wide")
@@ -12,3 +13,14 @@ render_header_svg("images/bottom-header.svg", 200)
 st.header('Sample Application Stack:')
 
 st.image('images/stack.png', width=600)
+
+# builds the page chains once per process, later reruns and page visits reuse them
+with st.spinner('Warming up the databases...'):
+    for dataset in DATASET_CHAINS:
+        try:
+            status = warm_up(dataset)
+        except Exception as e:
+            st.warning(f'The {dataset} database is not ready: {e}')
+        else:
+            st.caption(f"{dataset}: connected, vector indexes {', '.join(status['vectorIndexes'])} ONLINE, "
+                       f"{status['plannedQueries']} retrieval queries planned")
@@ -0,0 +1,265 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+from neo4j import Driver, RoutingControl
+from neo4j.exceptions import DriverError, Neo4jError
+
+_MISSING = object()
+
+LAST_COMMITTED_TX_QUERY = """SHOW DATABASES YIELD name, lastCommittedTxn
+WHERE name = $name
+RETURN max(lastCommittedTxn) AS txId"""
+
+
+class LRUCache:
+    """Thread-safe, bounded LRU cache with an optional time-to-live per entry."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._data),
+                'maxsize': self.maxsize}
+
+
+def query_cache_key(*parts: Any, params: Optional[Dict] = None) -> str:
+    """Stable cache key for a query and its parameters."""
+    return json.dumps([*parts, params or {}], sort_keys=True, default=str)
+
+
+class TransactionWatermark:
+    """Tracks a database's last committed transaction id so caches can tell when data may have changed.
+
+    The id is read from `SHOW DATABASES` on the system database at most once per `refresh_interval` seconds. If it
+    can't be read (older server, missing privileges, an unavailable server or any other driver error) `current`
+    returns None instead of failing the cache lookup, so caches fall back to their TTL. The read is retried after
+    `retry_backoff` seconds, doubling up to `max_retry_backoff` while it keeps failing.
+    """
+
+    def __init__(self, driver: Driver, database: str, refresh_interval: float = 1.0, retry_backoff: float = 5.0,
+                 max_retry_backoff: float = 300.0):
+        self.driver = driver
+        self.database = database
+        self.refresh_interval = refresh_interval
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self._tx_id: Optional[int] = None
+        self._read_at = float('-inf')
+        self._failures = 0
+        self._retry_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            records, _, _ = self.driver.execute_query(LAST_COMMITTED_TX_QUERY,
+                                                      name=self.database,
+                                                      database_='system',
+                                                      routing_=RoutingControl.READ)
+        except (Neo4jError, DriverError) as e:
+            backoff = min(self.retry_backoff * 2 ** self._failures, self.max_retry_backoff)
+            if self._failures == 0:
+                logging.warning(f"Can't read the last committed transaction id of {self.database}, caches will rely "
+                                f"on TTL only, retrying in {backoff:g}s: {e}")
+            self._failures += 1
+            self._retry_at = time.monotonic() + backoff
+            self._tx_id = None
+            return
+        if self._failures:
+            logging.info(f'Read the last committed transaction id of {self.database} again after '
+                         f'{self._failures} failed attempts')
+            self._failures = 0
+        self._tx_id = records[0]['txId'] if records else None
+
+    def current(self) -> Optional[int]:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._read_at >= self.refresh_interval and now >= self._retry_at:
+                self._read()
+                self._read_at = time.monotonic()
+            return self._tx_id
+
+
+class TransactionAwareCache:
+    """LRU/TTL cache whose entries are only valid for the transaction id they were computed at.
+
+    Callers read the transaction id *before* running the query they cache, so a write that commits while the query
+    runs invalidates the entry rather than hiding behind it.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, tx_id: Optional[int]) -> Any:
+        entry = self._cache.get(key)
+        if entry is not None:
+            value, entry_tx_id = entry
+            if entry_tx_id == tx_id:
+                self.hits += 1
+                return value
+            self._cache.pop(key)
+            self.invalidations += 1
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: Any, tx_id: Optional[int]):
+        self._cache.put(key, (value, tx_id))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._cache),
+                'maxsize': self._cache.maxsize}
+
+
+class SemanticCache:
+    """Bounded nearest-neighbour cache mapping embeddings to values, e.g. question embeddings to generated Cypher.
+
+    Vectors are kept L2-normalized in one preallocated numpy matrix, so a lookup is a single matrix-vector product.
+    `get` returns the value of the most similar entry in the same namespace if its cosine similarity is at least
+    `threshold`. When full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 512, threshold: float = 0.97):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._vectors: Optional[np.ndarray] = None
+        self._namespaces: List[Hashable] = [None] * maxsize
+        self._values: List[Any] = [None] * maxsize
+        self._last_used = np.zeros(maxsize, dtype=np.int64)
+        self._used = np.zeros(maxsize, dtype=bool)
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1)
+
+    def _nearest(self, namespace: Hashable, vector: np.ndarray) -> Optional[int]:
+        if self._vectors is None or not self._used.any():
+            return None
+        similarities = self._vectors @ vector
+        mask = self._used & np.array([ns == namespace for ns in self._namespaces])
+        if not mask.any():
+            return None
+        similarities[~mask] = -np.inf
+        best = int(np.argmax(similarities))
+        return best if similarities[best] >= self.threshold else None
+
+    def _touch(self, slot: int):
+        self._clock += 1
+        self._last_used[slot] = self._clock
+
+    def get(self, vector: Sequence[float], namespace: Hashable = None, default: Any = None) -> Any:
+        vector = self._normalize(vector)
+        with self._lock:
+            slot = self._nearest(namespace, vector)
+            if slot is None:
+                self.misses += 1
+                return default
+            self._touch(slot)
+            self.hits += 1
+            return self._values[slot]
+
+    def put(self, vector: Sequence[float], value: Any, namespace: Hashable = None):
+        vector = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, len(vector)), dtype=np.float32)
+            # replace a near-duplicate rather than storing the same question twice
+            slot = self._nearest(namespace, vector)
+            if slot is None:
+                free = np.flatnonzero(~self._used)
+                if len(free):
+                    slot = int(free[0])
+                else:
+                    slot = int(np.argmin(self._last_used))
+                    self.evictions += 1
+            self._vectors[slot] = vector
+            self._namespaces[slot] = namespace
+            self._values[slot] = value
+            self._used[slot] = True
+            self._touch(slot)
+
+    def clear(self):
+        with self._lock:
+            self._used[:] = False
+            self._namespaces = [None] * self.maxsize
+            self._values = [None] * self.maxsize
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def __len__(self) -> int:
+        return int(self._used.sum())
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+                'size': len(self),
+                'maxsize': self.maxsize}
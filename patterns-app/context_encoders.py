@@ -0,0 +1,152 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_TOKENIZER_ENCODING = 'cl100k_base'
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(encoding_name: str = DEFAULT_TOKENIZER_ENCODING) -> Callable[[str], int]:
+    """Counts tokens with a local tiktoken encoding, or estimates ~4 characters per token if it is unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens
+    try:
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logging.warning(f"Could not load tiktoken encoding {encoding_name}, estimating token counts instead: {e}")
+        return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+@dataclass
+class EncodedContext:
+    text: str
+    tokens: int
+    records: int
+    dropped_records: int = 0
+    # tokens of the same records as indented JSON, only counted when the stats are read
+    count_baseline_tokens: Callable[[], int] = field(default=lambda: 0, repr=False)
+
+    @cached_property
+    def baseline_tokens(self) -> int:
+        return self.count_baseline_tokens()
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.baseline_tokens - self.tokens
+
+    def stats(self) -> Dict:
+        return {'tokens': self.tokens,
+                'baselineTokens': self.baseline_tokens,
+                'tokensSaved': self.tokens_saved,
+                'records': self.records,
+                'droppedRecords': self.dropped_records}
+
+
+class ContextEncoder:
+    """Serializes retrieved records into the context string placed in the prompt."""
+
+    def __init__(self, count_tokens: Optional[Callable[[str], int]] = None):
+        self._count_tokens = count_tokens
+
+    def count_tokens(self, text: str) -> int:
+        if self._count_tokens is None:
+            self._count_tokens = get_token_counter()
+        return self._count_tokens(text)
+
+    def serialize(self, records: Any) -> str:
+        raise NotImplementedError
+
+    def _baseline_counter(self, records: Any, text: str, tokens: int) -> Callable[[], int]:
+        def count_baseline_tokens() -> int:
+            baseline_text = json.dumps(records, indent=1, default=str)
+            return tokens if baseline_text == text else self.count_tokens(baseline_text)
+        return count_baseline_tokens
+
+    def encode(self, records: Any) -> EncodedContext:
+        text = self.serialize(records)
+        tokens = self.count_tokens(text)
+        return EncodedContext(text=text,
+                              tokens=tokens,
+                              records=len(records) if isinstance(records, list) else 1,
+                              count_baseline_tokens=self._baseline_counter(records, text, tokens))
+
+
+class JsonContextEncoder(ContextEncoder):
+    """The original indented JSON context."""
+
+    def serialize(self, records: Any) -> str:
+        return json.dumps(records, indent=1)
+
+
+def _is_record_list(x: Any) -> bool:
+    return isinstance(x, list) and len(x) > 0 and all(isinstance(i, dict) for i in x)
+
+
+def to_columnar(x: Any) -> Any:
+    """Turns lists of dicts (at any depth) into {"columns": [...], "rows": [[...]]} so each key appears once."""
+    if _is_record_list(x):
+        columns = list(dict.fromkeys(k for record in x for k in record))
+        return {'columns': columns,
+                'rows': [[to_columnar(record.get(c)) for c in columns] for record in x]}
+    if isinstance(x, dict):
+        return {k: to_columnar(v) for k, v in x.items()}
+    if isinstance(x, list):
+        return [to_columnar(i) for i in x]
+    return x
+
+
+class CompactContextEncoder(ContextEncoder):
+    """Minified, columnar JSON with an optional hard token budget.
+
+    When the context exceeds `max_tokens`, the lowest scoring records are dropped (records without a score are
+    assumed to be in descending relevance order) until it fits. The original record order is kept.
+    """
+
+    def __init__(self,
+                 max_tokens: Optional[int] = None,
+                 score_key: str = 'score',
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        super().__init__(count_tokens)
+        self.max_tokens = max_tokens
+        self.score_key = score_key
+
+    def serialize(self, records: Any) -> str:
+        return json.dumps(to_columnar(records), separators=(',', ':'), default=str)
+
+    def _keep_best(self, records: List[Dict], n: int) -> List[Dict]:
+        ranked = sorted(range(len(records)),
+                        key=lambda i: (-(records[i].get(self.score_key) or 0), i))
+        keep = set(ranked[:n])
+        return [record for i, record in enumerate(records) if i in keep]
+
+    def encode(self, records: Any) -> EncodedContext:
+        encoded = super().encode(records)
+        if self.max_tokens is None or encoded.tokens <= self.max_tokens or not _is_record_list(records):
+            return encoded
+        # binary search the largest number of best scoring records that fits the budget
+        low, high = 0, len(records) - 1
+        best_text, best_tokens = self.serialize([]), self.count_tokens(self.serialize([]))
+        while low <= high:
+            mid = (low + high) // 2
+            text = self.serialize(self._keep_best(records, mid))
+            tokens = self.count_tokens(text)
+            if tokens <= self.max_tokens:
+                best_text, best_tokens, low = text, tokens, mid + 1
+            else:
+                high = mid - 1
+        # not even the empty context fits a budget below its couple of tokens
+        kept = max(low - 1, 0)
+        return EncodedContext(text=best_text,
+                              tokens=best_tokens,
+                              records=kept,
+                              dropped_records=len(records) - kept,
+                              count_baseline_tokens=encoded.count_baseline_tokens)
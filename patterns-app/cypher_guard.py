@@ -0,0 +1,226 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from neo4j import AsyncDriver, Driver, Query, RoutingControl
+
+DEFAULT_MAX_ESTIMATED_ROWS = 1_000_000
+DEFAULT_MAX_CARTESIAN_PRODUCTS = 0
+DEFAULT_MAX_LIMIT = 100
+DEFAULT_TIMEOUT_SECONDS = 10.0
+
+_LITERAL_PATTERN = re.compile(r"'(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\"|`[^`]*`|//[^\n]*|/\*.*?\*/", re.DOTALL)
+_TRAILING_LIMIT_PATTERN = re.compile(r'\bLIMIT\s+(\d+)\s*$', re.IGNORECASE)
+_NODE_VARIABLE_PATTERN = re.compile(r'(?<![\w`])\(\s*([A-Za-z_]\w*)\s*(?=[:){])')
+_RELATIONSHIP_VARIABLE_PATTERN = re.compile(r'-\s*\[\s*([A-Za-z_]\w*)\s*(?=[:\]{*])')
+_RETURN_ITEMS_END_PATTERN = re.compile(r'\b(?:ORDER\s+BY|SKIP|LIMIT|UNION)\b', re.IGNORECASE)
+_NAME = r'(?:`[^`]+`|[A-Za-z_]\w*)'
+_BARE_ITEM_PATTERN = re.compile(rf'^([A-Za-z_]\w*)(?:\s+AS\s+({_NAME}))?$', re.IGNORECASE)
+_ALIAS_PATTERN = re.compile(r'\bAS\s+([A-Za-z_]\w*)', re.IGNORECASE)
+_YIELD_ITEMS_PATTERN = re.compile(r'\bYIELD\s+((?:[A-Za-z_]\w*\s*,\s*)*[A-Za-z_]\w*)', re.IGNORECASE)
+_COLLECT_ITEM_PATTERN = re.compile(rf'^collect\s*\(\s*(DISTINCT\s+)?([A-Za-z_]\w*)\s*\)(?:\s+AS\s+({_NAME}))?$',
+                                   re.IGNORECASE)
+
+
+class CypherGuardError(ValueError):
+    """Raised when a generated query is rejected before it reaches the database."""
+
+    def __init__(self, message: str, report: 'GuardReport'):
+        super().__init__(message)
+        self.report = report
+
+
+@dataclass
+class GuardReport:
+    """What the guard found in, and changed about, one query."""
+    original_query: str
+    query: str
+    estimated_rows: Optional[float] = None
+    cartesian_products: Optional[int] = None
+    query_type: Optional[str] = None
+    changes: List[str] = field(default_factory=list)
+
+    def stats(self) -> Dict:
+        return {'estimatedRows': self.estimated_rows,
+                'cartesianProducts': self.cartesian_products,
+                'queryType': self.query_type,
+                'changes': self.changes}
+
+
+def mask_literals(query: str) -> str:
+    """Blanks out strings, escaped names and comments (keeping offsets) so keyword searches don't match inside them."""
+    return _LITERAL_PATTERN.sub(lambda m: ' ' * len(m.group()), query)
+
+
+def _top_level_positions(masked: str, pattern: str) -> List[re.Match]:
+    return [m for m in re.finditer(pattern, masked, re.IGNORECASE)
+            if masked.count('{', 0, m.start()) == masked.count('}', 0, m.start())]
+
+
+def _split_items(masked: str, start: int, end: int) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the comma separated items in masked[start:end], ignoring nested commas."""
+    items, depth, item_start = [], 0, start
+    for i in range(start, end):
+        c = masked[i]
+        if c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            items.append((item_start, i))
+            item_start = i + 1
+    items.append((item_start, end))
+    return items
+
+
+def pattern_variables(query: str) -> Set[str]:
+    """Variables bound to nodes or relationships in the query's patterns, e.g. `p` and `r` in `(p:Product)-[r]->()`."""
+    masked = mask_literals(query)
+    return set(_NODE_VARIABLE_PATTERN.findall(masked)) | set(_RELATIONSHIP_VARIABLE_PATTERN.findall(masked))
+
+
+def rebound_variables(masked: str) -> Set[str]:
+    """Names (re)bound by `AS` or `YIELD` in a masked query, e.g. `n` in `WITH n.productName AS n`."""
+    names = set(_ALIAS_PATTERN.findall(masked))
+    for items in _YIELD_ITEMS_PATTERN.findall(masked):
+        names.update(name.strip() for name in items.split(','))
+    return names
+
+
+def exclude_properties_from_returns(query: str, properties: List[str]) -> str:
+    """Rewrites returned pattern variables into map projections without `properties`, so they never leave the server.
+
+    `RETURN p, collect(o) AS orders` becomes `RETURN p {.*, `textEmbedding`: Null} AS p,
+    collect(o {.*, `textEmbedding`: Null}) AS orders`. Other return items are left as they are, and so are
+    variables that may no longer hold a node or relationship at the RETURN because a WITH, UNWIND or YIELD before it
+    binds the same name, e.g. `WITH n.productName AS n RETURN n`.
+    """
+    if not properties:
+        return query
+    variables = pattern_variables(query)
+    if not variables:
+        return query
+    masked = mask_literals(query)
+    exclusions = ', '.join(f'`{p}`: Null' for p in properties)
+    replacements = []
+    for return_match in _top_level_positions(masked, r'\bRETURN\b'):
+        bound = variables - rebound_variables(masked[:return_match.start()])
+        items_start = return_match.end()
+        distinct = re.match(r'\s+DISTINCT\b', masked[items_start:], re.IGNORECASE)
+        if distinct:
+            items_start += distinct.end()
+        items_end = len(masked)
+        for m in _RETURN_ITEMS_END_PATTERN.finditer(masked, items_start):
+            if masked.count('{', items_start, m.start()) == masked.count('}', items_start, m.start()):
+                items_end = m.start()
+                break
+        for start, end in _split_items(masked, items_start, items_end):
+            item = query[start:end].strip()
+            bare, collected = _BARE_ITEM_PATTERN.match(item), _COLLECT_ITEM_PATTERN.match(item)
+            if bare and bare.group(1) in bound:
+                var, alias = bare.group(1), bare.group(2) or bare.group(1)
+                new_item = f'{var} {{.*, {exclusions}}} AS {alias}'
+            elif collected and collected.group(2) in bound:
+                var, alias = collected.group(2), collected.group(3) or f'`{item}`'
+                new_item = f'collect({collected.group(1) or ""}{var} {{.*, {exclusions}}}) AS {alias}'
+            else:
+                continue
+            offset = start + len(query[start:end]) - len(query[start:end].lstrip())
+            replacements.append((offset, offset + len(item), new_item))
+    for start, end, new_item in sorted(replacements, reverse=True):
+        query = query[:start] + new_item + query[end:]
+    return query
+
+
+def walk_plan(plan: Dict) -> Iterator[Dict]:
+    yield plan
+    for child in plan.get('children', []):
+        yield from walk_plan(child)
+
+
+def operator_name(operator: Dict) -> str:
+    # Neo4j 5 suffixes operators with the runtime, e.g. `CartesianProduct@neo4j`
+    return operator.get('operatorType', '').split('@')[0]
+
+
+class CypherGuard:
+    """Pre-flight checks for LLM generated Cypher.
+
+    `prepare` injects a `LIMIT max_limit` into the final RETURN, or clamps a larger literal limit. `preflight` runs
+    EXPLAIN and rejects non read-only queries and plans whose largest row estimate or number of CartesianProduct
+    operators exceed the thresholds. `execute` runs the query in a read transaction with a server-side timeout.
+    """
+
+    def __init__(self,
+                 max_estimated_rows: float = DEFAULT_MAX_ESTIMATED_ROWS,
+                 max_cartesian_products: int = DEFAULT_MAX_CARTESIAN_PRODUCTS,
+                 max_limit: Optional[int] = DEFAULT_MAX_LIMIT,
+                 timeout: Optional[float] = DEFAULT_TIMEOUT_SECONDS):
+        self.max_estimated_rows = max_estimated_rows
+        self.max_cartesian_products = max_cartesian_products
+        self.max_limit = max_limit
+        self.timeout = timeout
+
+    def prepare(self, query: str) -> GuardReport:
+        report = GuardReport(original_query=query, query=query)
+        if self.max_limit is None:
+            return report
+        query = query.strip().rstrip(';').rstrip()
+        masked = mask_literals(query)
+        if re.search(r'\bUNION\b', masked, re.IGNORECASE):
+            report.changes.append('LIMIT not enforced on UNION query')
+            return report
+        returns = _top_level_positions(masked, r'\bRETURN\b')
+        if not returns:
+            return report
+        limit = _TRAILING_LIMIT_PATTERN.search(masked, returns[-1].end())
+        if limit is None:
+            if re.search(r'\bLIMIT\b', masked[returns[-1].end():], re.IGNORECASE):
+                report.changes.append('LIMIT is not a literal and was left as is')
+                return report
+            report.query = f'{query}\nLIMIT {self.max_limit}'
+            report.changes.append(f'Injected LIMIT {self.max_limit}')
+        elif int(limit.group(1)) > self.max_limit:
+            report.query = f'{query[:limit.start(1)]}{self.max_limit}'
+            report.changes.append(f'Clamped LIMIT {limit.group(1)} to {self.max_limit}')
+        return report
+
+    def _check_plan(self, report: GuardReport, summary):
+        operators = list(walk_plan(summary.plan or {}))
+        report.query_type = summary.query_type
+        report.estimated_rows = max((o.get('arguments', {}).get('EstimatedRows', 0) for o in operators), default=0)
+        report.cartesian_products = sum(operator_name(o) == 'CartesianProduct' for o in operators)
+        if report.query_type != 'r':
+            raise CypherGuardError(f'Only read queries are allowed, got query type {report.query_type!r}', report)
+        if report.cartesian_products > self.max_cartesian_products:
+            raise CypherGuardError(f'Plan has {report.cartesian_products} cartesian products, '
+                                   f'at most {self.max_cartesian_products} allowed', report)
+        if report.estimated_rows > self.max_estimated_rows:
+            raise CypherGuardError(f'Plan estimates {report.estimated_rows:,.0f} rows, '
+                                   f'at most {self.max_estimated_rows:,.0f} allowed', report)
+
+    def preflight(self, driver: Driver, report: GuardReport, database: str) -> GuardReport:
+        _, summary, _ = driver.execute_query(f'EXPLAIN {report.query}',
+                                             database_=database,
+                                             routing_=RoutingControl.READ)
+        self._check_plan(report, summary)
+        return report
+
+    async def apreflight(self, driver: AsyncDriver, report: GuardReport, database: str) -> GuardReport:
+        _, summary, _ = await driver.execute_query(f'EXPLAIN {report.query}',
+                                                   database_=database,
+                                                   routing_=RoutingControl.READ)
+        self._check_plan(report, summary)
+        return report
+
+    def execute(self, driver: Driver, report: GuardReport, database: str) -> List[Dict]:
+        records, _, _ = driver.execute_query(Query(report.query, timeout=self.timeout),
+                                             database_=database,
+                                             routing_=RoutingControl.READ)
+        return [record.data() for record in records]
+
+    async def aexecute(self, driver: AsyncDriver, report: GuardReport, database: str) -> List[Dict]:
+        records, _, _ = await driver.execute_query(Query(report.query, timeout=self.timeout),
+                                                   database_=database,
+                                                   routing_=RoutingControl.READ)
+        return [record.data() for record in records]
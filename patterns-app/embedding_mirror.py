@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from langchain_neo4j import Neo4jGraph
+
+GROWTH_FACTOR = 1.5
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    # readers take the row map and the matrix it indexes together, so a reload can't pair one with the other's
+    rows: Dict[str, int]
+    matrix: Optional[np.memmap]
+
+
+class EmbeddingMirror:
+    """Local, memory-mapped float32 copy of node embeddings for in-process similarity scoring.
+
+    Rows are stored L2-normalized in `<path>.f32` next to a `<path>.json` elementId -> row map. Readers open the
+    matrix read-only, so every worker process on a host shares the same pages through the OS page cache. `sync`
+    appends new nodes, frees rows of deleted ones and re-reads any ids passed as changed. Scoring reads one immutable
+    snapshot of the row map and matrix, which `reload_if_changed` and `sync` replace in a single assignment.
+    """
+
+    def __init__(self,
+                 path: str,
+                 dimension: int = 1536,
+                 label: str = 'Product',
+                 embedding_property: str = 'textEmbedding',
+                 writable: bool = False):
+        self.path = path
+        self.dimension = dimension
+        self.label = label
+        self.embedding_property = embedding_property
+        self.writable = writable
+        self.rows: Dict[str, int] = dict()
+        self.free_rows: List[int] = []
+        self.row_count = 0
+        self.capacity = 0
+        self._matrix: Optional[np.memmap] = None
+        self._snapshot = _Snapshot(dict(), None)
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def matrix_path(self) -> str:
+        return self.path + '.f32'
+
+    @property
+    def index_path(self) -> str:
+        return self.path + '.json'
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path) as f:
+            index = json.load(f)
+        if index['dimension'] != self.dimension:
+            raise ValueError(f"Mirror at {self.path} has dimension {index['dimension']}, expected {self.dimension}")
+        self.rows = index['rows']
+        self.free_rows = index['freeRows']
+        self.row_count = index['rowCount']
+        self.capacity = index['capacity']
+        self._loaded_mtime = os.path.getmtime(self.index_path)
+        self._open_matrix()
+        # only a writable mirror changes `rows` in place, readers can share the loaded map
+        self._snapshot = _Snapshot(dict(self.rows) if self.writable else self.rows, self._matrix)
+
+    def _open_matrix(self):
+        if self.capacity == 0:
+            self._matrix = None
+            return
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r+' if self.writable else 'r',
+                                 shape=(self.capacity, self.dimension))
+
+    def reload_if_changed(self):
+        """Picks up a sync done by another process."""
+        if os.path.exists(self.index_path) and os.path.getmtime(self.index_path) != self._loaded_mtime:
+            with self._lock:
+                if os.path.getmtime(self.index_path) != self._loaded_mtime:
+                    self._load()
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'dimension': self.dimension,
+                       'rows': self.rows,
+                       'freeRows': self.free_rows,
+                       'rowCount': self.row_count,
+                       'capacity': self.capacity}, f)
+        os.replace(tmp_path, self.index_path)
+        self._loaded_mtime = os.path.getmtime(self.index_path)
+
+    def _ensure_capacity(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        new_capacity = max(capacity, int(self.capacity * GROWTH_FACTOR))
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self.matrix_path, 'ab') as f:
+            f.truncate(new_capacity * self.dimension * np.dtype(np.float32).itemsize)
+        self.capacity = new_capacity
+        self._open_matrix()
+
+    def _write(self, ids: List[str], embeddings: List[List[float]]):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        rows = []
+        for element_id in ids:
+            row = self.rows.get(element_id)
+            if row is None:
+                row = self.free_rows.pop() if self.free_rows else self.row_count
+                if row == self.row_count:
+                    self.row_count += 1
+                self.rows[element_id] = row
+            rows.append(row)
+        self._ensure_capacity(self.row_count)
+        self._matrix[rows] = vectors
+
+    def sync(self, graph: 'Neo4jGraph', changed_ids: Iterable[str] = (), batch_size: int = 1000) -> Dict:
+        """Incrementally syncs the mirror with the graph, keyed by `elementId`."""
+        if not self.writable:
+            raise ValueError('EmbeddingMirror must be opened with writable=True to sync')
+        with self._lock:
+            stats = self._sync(graph, changed_ids, batch_size)
+            self._snapshot = _Snapshot(dict(self.rows), self._matrix)
+        return stats
+
+    def _sync(self, graph: 'Neo4jGraph', changed_ids: Iterable[str], batch_size: int) -> Dict:
+        db_ids = [r['id'] for r in graph.query(
+            f"MATCH (n:`{self.label}`) WHERE n.`{self.embedding_property}` IS NOT NULL RETURN elementId(n) AS id")]
+        db_id_set = set(db_ids)
+        deleted_ids = [i for i in self.rows if i not in db_id_set]
+        for element_id in deleted_ids:
+            row = self.rows.pop(element_id)
+            self._matrix[row] = 0
+            self.free_rows.append(row)
+        changed_ids = set(changed_ids)
+        to_fetch = [i for i in db_ids if i not in self.rows or i in changed_ids]
+        for start in range(0, len(to_fetch), batch_size):
+            records = graph.query(
+                f"MATCH (n) WHERE elementId(n) IN $ids RETURN elementId(n) AS id, n.`{self.embedding_property}` AS embedding",
+                params={'ids': to_fetch[start:start + batch_size]})
+            if records:
+                self._write([r['id'] for r in records], [r['embedding'] for r in records])
+        if self._matrix is not None:
+            self._matrix.flush()
+        self._save_index()
+        return {'fetched': len(to_fetch), 'deleted': len(deleted_ids), 'size': len(self.rows)}
+
+    def scores(self, ids: List[str], query_vector: List[float]) -> np.ndarray:
+        """Cosine scores for `ids`, normalized to [0, 1] like `vector.similarity.cosine`. Ids not synced yet score
+        NaN."""
+        snapshot = self._snapshot
+        scores = np.full(len(ids), np.nan, dtype=np.float32)
+        positions = [i for i, element_id in enumerate(ids) if element_id in snapshot.rows]
+        if not positions or snapshot.matrix is None:
+            return scores
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        rows = [snapshot.rows[ids[i]] for i in positions]
+        scores[positions] = (1 + snapshot.matrix[rows] @ query) / 2
+        return scores
+
+    def top_k(self, ids: List[str], query_vector: List[float], k: int) -> List[Tuple[int, Optional[float]]]:
+        """(position in `ids`, score) of the `k` best scoring ids, best first, followed by the ids that aren't synced
+        yet with a None score, for the caller to score some other way."""
+        scores = self.scores(ids, query_vector)
+        unknown = np.isnan(scores)
+        valid = np.flatnonzero(~unknown)
+        best = valid[np.argsort(-scores[valid], kind='stable')][:k]
+        return [(int(i), float(scores[i])) for i in best] + [(int(i), None) for i in np.flatnonzero(unknown)]
+
+    def __len__(self) -> int:
+        return len(self._snapshot.rows)
+
+
+if __name__ == '__main__':
+    from graphrag import Neo4jDriverRegistry
+    from jobs import add_neo4j_arguments, credentials_from_args
+
+    parser = argparse.ArgumentParser(description='Sync a local embedding mirror from Neo4j.')
+    parser.add_argument('path')
+    parser.add_argument('--dimension', type=int, default=1536)
+    parser.add_argument('--label', default='Product')
+    parser.add_argument('--embedding-property', default='textEmbedding')
+    add_neo4j_arguments(parser)
+    args = parser.parse_args()
+
+    mirror = EmbeddingMirror(args.path, args.dimension, args.label, args.embedding_property, writable=True)
+    registry = Neo4jDriverRegistry()
+    print(mirror.sync(registry.get_graph(credentials_from_args(args))))
+    registry.close()
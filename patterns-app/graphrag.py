@@ -1,26 +1,176 @@
+import asyncio
+import hashlib
 import json
+import os
+import re
+import threading
+import unicodedata
+import weakref
+from array import array
 from collections import OrderedDict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
 from operator import itemgetter
-from typing import Dict, List, Tuple, Optional
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Tuple, Optional, Union
 
-from langchain.prompts.prompt import PromptTemplate
-from langchain_neo4j import Neo4jGraph
-from langchain_neo4j import Neo4jVector
+from langchain_core.prompts import PromptTemplate
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+from langchain_core.runnables import Runnable, RunnableConfig, RunnablePassthrough, RunnableLambda
+from neo4j import AsyncDriver, AsyncGraphDatabase, Driver, RoutingControl
+
+from caching import LRUCache, SemanticCache, TransactionAwareCache, TransactionWatermark, query_cache_key
+from context_encoders import ContextEncoder, EncodedContext, JsonContextEncoder
+from cypher_guard import CypherGuard, GuardReport, exclude_properties_from_returns
+from instrumentation import Instrumentation, LLMTimingCallback, default_instrumentation
+from models import get_chat_model, get_embeddings, get_provider_name, register_dependent_cache
+from quantization import QuantizedEmbeddingIndex, RefreshingQuantizedEmbeddingIndex
+from reranking import Reranker
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+    from langchain_neo4j import Neo4jGraph
+    from embedding_mirror import EmbeddingMirror
+
+EMBEDDING_MODEL = 'text-embedding-ada-002'
+LLM_MODEL = 'gpt-4o'
+T2C_LLM_MODEL = 'gpt-4'
+EMBEDDING_CACHE_MAXSIZE = 4096
+EMBEDDING_CACHE_TTL_SECONDS = 60 * 60
+T2C_CYPHER_CACHE_MAXSIZE = 1024
+T2C_RESULT_CACHE_MAXSIZE = 256
+T2C_RESULT_CACHE_TTL_SECONDS = 10 * 60
+RETRIEVAL_CACHE_MAXSIZE = 1024
+RETRIEVAL_CACHE_TTL_SECONDS = 10 * 60
+PREFILTER_CANDIDATE_CACHE_MAXSIZE = 4096
+PREFILTER_CANDIDATE_CACHE_TTL_SECONDS = 30 * 60
+T2C_SEMANTIC_CACHE_MAXSIZE = 512
+T2C_SEMANTIC_CACHE_THRESHOLD = 0.97
 
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 
-embedding_model = OpenAIEmbeddings(model="text-embedding-ada-002")
-llm = ChatOpenAI(temperature=0, model_name='gpt-4o', streaming=True)
-t2c_llm = ChatOpenAI(temperature=0, model_name='gpt-4', streaming=True)
+def normalize_text(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def normalize_question(question: str) -> str:
+    return normalize_text(question).casefold()
+
+
+# quoted strings, numbers and capitalized words that don't start a sentence (e.g. USA, Beverages)
+_QUESTION_LITERAL_PATTERN = re.compile(r'"([^"]+)"|“([^”]+)”|‘([^’]+)’|(?<!\w)\'([^\']+)\'(?!\w)'
+                                       r'|(?<![\w.])(\d+(?:\.\d+)?)|(?<=\s)(?<![.?!]\s)([A-Z][\w\'-]*)')
+
+
+def question_literals(question: str) -> Tuple[str, ...]:
+    """Values a question's Cypher is likely to depend on literally, such as a LIMIT or a product name. Paraphrases
+    only share generated Cypher when these are the same, so "top 5 products" never reuses the Cypher of "top 10"."""
+    return tuple(next(group for group in m.groups() if group is not None)
+                 for m in _QUESTION_LITERAL_PATTERN.finditer(normalize_text(question)))
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embeddings client with a shared cache keyed by model name and normalized text.
+
+    Every chain embeds the same prompt for retrieval and again for the browser/full retrieval queries,
+    so caching here turns those repeat calls into a single embeddings round trip.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: LRUCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = getattr(embeddings, 'model', None) or type(embeddings).__name__
+
+    def _key(self, text: str) -> Tuple[str, str]:
+        return self.model_name, normalize_text(text)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(key[1])
+            self.cache.put(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors = {key: self.cache.get(key) for key in keys}
+        missing = [key for key, vector in vectors.items() if vector is None]
+        if missing:
+            for key, vector in zip(missing, self.embeddings.embed_documents([key[1] for key in missing])):
+                self.cache.put(key, vector)
+                vectors[key] = vector
+        return [vectors[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(key[1])
+            self.cache.put(key, vector)
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors = {key: self.cache.get(key) for key in keys}
+        missing = [key for key, vector in vectors.items() if vector is None]
+        if missing:
+            for key, vector in zip(missing, await self.embeddings.aembed_documents([key[1] for key in missing])):
+                self.cache.put(key, vector)
+                vectors[key] = vector
+        return [vectors[key] for key in keys]
+
+
+embedding_cache = LRUCache(maxsize=EMBEDDING_CACHE_MAXSIZE, ttl=EMBEDDING_CACHE_TTL_SECONDS)
+
+
+@lru_cache(maxsize=None)
+def _cached_embedding_model(provider: str) -> CachedEmbeddings:
+    return CachedEmbeddings(get_embeddings(EMBEDDING_MODEL, provider), embedding_cache)
+
+
+register_dependent_cache(_cached_embedding_model.cache_clear)
+
+
+def get_embedding_model() -> CachedEmbeddings:
+    return _cached_embedding_model(get_provider_name())
+
+
+def get_llm() -> 'BaseChatModel':
+    return get_chat_model(LLM_MODEL)
+
+
+def get_t2c_llm() -> 'BaseChatModel':
+    return get_chat_model(T2C_LLM_MODEL, text2cypher=True)
+
+
+def __getattr__(name: str):
+    # models used to be built at import time as module attributes, they are now created on first use
+    factories = {'embedding_model': get_embedding_model, 'llm': get_llm, 't2c_llm': get_t2c_llm}
+    if name in factories:
+        return factories[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# process-wide so they survive Streamlit reruns, which rebuild the chains
+t2c_cypher_cache = LRUCache(maxsize=T2C_CYPHER_CACHE_MAXSIZE)
+t2c_semantic_cache = SemanticCache(maxsize=T2C_SEMANTIC_CACHE_MAXSIZE, threshold=T2C_SEMANTIC_CACHE_THRESHOLD)
+t2c_result_cache = TransactionAwareCache(maxsize=T2C_RESULT_CACHE_MAXSIZE, ttl=T2C_RESULT_CACHE_TTL_SECONDS)
+retrieval_cache = TransactionAwareCache(maxsize=RETRIEVAL_CACHE_MAXSIZE, ttl=RETRIEVAL_CACHE_TTL_SECONDS)
+prefilter_candidate_cache = TransactionAwareCache(maxsize=PREFILTER_CANDIDATE_CACHE_MAXSIZE,
+                                                  ttl=PREFILTER_CANDIDATE_CACHE_TTL_SECONDS)
 
 VECTOR_QUERY_HEAD = """CALL db.index.vector.queryNodes($index, $k, $embedding)
 YIELD node, score
 """
 
+# exact rescoring of a candidate shortlist found on quantized embeddings, in place of the vector index search
+RESCORE_QUERY_HEAD = """UNWIND $candidates AS candidateId
+MATCH (node) WHERE elementId(node) = candidateId
+WITH node, vector.similarity.cosine($embedding, node.`{embedding_property}`) AS score
+ORDER BY score DESC LIMIT toInteger($k)
+"""
+
 PROMPT_CONTEXT_TEMPLATE = """
 
 # Question
@@ -96,6 +246,39 @@ def remove_key_from_dict(x, keys_to_remove):
     return x_clean
 
 
+_WITH_CLAUSE_PATTERN = re.compile(r'(?<![\w.`])(?<!STARTS\s)(?<!ENDS\s)WITH(\s+DISTINCT)?\s+(?!\*)', re.IGNORECASE)
+
+
+def build_batch_query(query_template: str, query_params_list: List[Dict], query_vectors: List[List[float]]):
+    """Wraps a single-prompt retrieval query in `UNWIND $batch AS item CALL {...}` so N prompts share one round trip.
+
+    Per-prompt values (the embedding and the query params) move onto the batch item: `$name` references become
+    `item.name` and every WITH clause carries `item` along. Shared params such as `$index` and `$k` stay as
+    parameters since LIMIT cannot read variables.
+    """
+    item_keys = {'embedding'}.union(*[params.keys() for params in query_params_list])
+    body = re.sub(r'\$(\w+)',
+                  lambda m: f'item.`{m.group(1)}`' if m.group(1) in item_keys else m.group(0),
+                  query_template)
+    body = _WITH_CLAUSE_PATTERN.sub(lambda m: f"WITH{m.group(1) or ''} item, ", body)
+    query = f"""UNWIND $batch AS item
+CALL {{
+WITH item
+{body}
+}}
+RETURN item.batchIndex AS batchIndex, text, score, metadata"""
+    batch = [{**params, 'embedding': query_vector, 'batchIndex': i}
+             for i, (params, query_vector) in enumerate(zip(query_params_list, query_vectors))]
+    return query, {'batch': batch}
+
+
+def split_batch_results(rows: List[Dict], batch_size: int) -> List[List[Dict]]:
+    results = [[] for _ in range(batch_size)]
+    for row in rows:
+        results[row.pop('batchIndex')].append(row)
+    return results
+
+
 @dataclass(frozen=True)
 class Neo4jCredentials:
     uri: str
@@ -103,8 +286,319 @@ class Neo4jCredentials:
     username: str = "neo4j"
     database: str = "neo4j"
 
+    @classmethod
+    def resolve(cls,
+                uri: Optional[str] = None,
+                username: Optional[str] = None,
+                password: Optional[str] = None,
+                database: Optional[str] = None) -> 'Neo4jCredentials':
+        """Build credentials from chain arguments, falling back to the same env vars langchain_neo4j reads."""
+        return cls(uri=uri or os.environ.get('NEO4J_URI'),
+                   password=password or os.environ.get('NEO4J_PASSWORD'),
+                   username=username or os.environ.get('NEO4J_USERNAME', 'neo4j'),
+                   database=database or os.environ.get('NEO4J_DATABASE', 'neo4j'))
+
+
+class Neo4jDriverRegistry:
+    """Hands out one shared, thread-safe driver per credentials/database so connection pools don't multiply per chain.
+
+    Sync access goes through a shared `Neo4jGraph` (schema refresh disabled) whose driver is also passed to
+    `Neo4jVector` via its `graph` argument. An async driver is bound to the event loop it was created on, so there is
+    one per running loop. They are dropped with their loop, and `aclose` closes those of the calling loop.
+    """
+
+    def __init__(self, max_connection_pool_size: int = 100, max_connection_lifetime: float = 3600):
+        self.driver_config = {'max_connection_pool_size': max_connection_pool_size,
+                              'max_connection_lifetime': max_connection_lifetime}
+        self._graphs: Dict[Neo4jCredentials, 'Neo4jGraph'] = {}
+        # event loop -> {credentials: AsyncDriver}
+        self._async_drivers = weakref.WeakKeyDictionary()
+        self._watermarks: Dict[Neo4jCredentials, TransactionWatermark] = {}
+        self._lock = threading.Lock()
+
+    def get_graph(self, credentials: Neo4jCredentials) -> 'Neo4jGraph':
+        from langchain_neo4j import Neo4jGraph
+        with self._lock:
+            graph = self._graphs.get(credentials)
+            if graph is None:
+                graph = Neo4jGraph(url=credentials.uri,
+                                   username=credentials.username,
+                                   password=credentials.password,
+                                   database=credentials.database,
+                                   refresh_schema=False,
+                                   driver_config=self.driver_config)
+                self._graphs[credentials] = graph
+            return graph
+
+    def get_driver(self, credentials: Neo4jCredentials) -> Driver:
+        return self.get_graph(credentials)._driver
+
+    def get_async_driver(self, credentials: Neo4jCredentials) -> AsyncDriver:
+        """The async driver for `credentials` on the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for closed in [other for other in self._async_drivers if other.is_closed()]:
+                # their connections can't be closed without a loop, dropping them lets the sockets be collected
+                del self._async_drivers[closed]
+            drivers = self._async_drivers.setdefault(loop, {})
+            driver = drivers.get(credentials)
+            if driver is None:
+                driver = AsyncGraphDatabase.driver(credentials.uri,
+                                                   auth=(credentials.username, credentials.password),
+                                                   **self.driver_config)
+                drivers[credentials] = driver
+            return driver
+
+    def get_transaction_watermark(self, credentials: Neo4jCredentials) -> TransactionWatermark:
+        driver = self.get_driver(credentials)
+        with self._lock:
+            watermark = self._watermarks.get(credentials)
+            if watermark is None:
+                watermark = TransactionWatermark(driver, credentials.database)
+                self._watermarks[credentials] = watermark
+            return watermark
+
+    async def async_query(self, credentials: Neo4jCredentials, query: str, params: Optional[Dict] = None) -> List[Dict]:
+        records, _, _ = await self.get_async_driver(credentials).execute_query(
+            query,
+            parameters_=params,
+            database_=credentials.database,
+            routing_=RoutingControl.READ)
+        return [record.data() for record in records]
+
+    def close(self):
+        with self._lock:
+            for graph in self._graphs.values():
+                graph.close()
+            self._graphs.clear()
+            self._watermarks.clear()
+
+    async def aclose(self):
+        with self._lock:
+            drivers = self._async_drivers.pop(asyncio.get_running_loop(), {})
+        for driver in drivers.values():
+            await driver.close()
+
+
+driver_registry = Neo4jDriverRegistry()
+
+
+def retrieval_cache_key(credentials: Neo4jCredentials,
+                        query_template: str,
+                        params: Dict,
+                        query_vector: Optional[List[float]] = None) -> str:
+    """Key for one retrieval: database, query template hash, query vector hash and the remaining parameters
+    (index name, k, filters such as customerId)."""
+    vector_hash = hashlib.sha256(array('f', query_vector).tobytes()).hexdigest() if query_vector else None
+    return query_cache_key(credentials.uri, credentials.database,
+                           hashlib.sha256(query_template.encode()).hexdigest(), vector_hash,
+                           params={k: v for k, v in params.items() if k != 'embedding'})
+
+
+def cached_retrieval(cache: Optional[TransactionAwareCache],
+                     registry: Neo4jDriverRegistry,
+                     credentials: Neo4jCredentials,
+                     key: str,
+                     fetch: Callable[[], Any],
+                     span: Dict,
+                     hit_metric: str = 'cacheHit') -> Any:
+    """Returns the cached result for `key` if the database hasn't committed a transaction since, else `fetch()`."""
+    if cache is None:
+        return fetch()
+    tx_id = registry.get_transaction_watermark(credentials).current()
+    res = cache.get(key, tx_id)
+    span[hit_metric] = int(res is not None)
+    if res is None:
+        res = fetch()
+        cache.put(key, res, tx_id)
+    return res
+
+
+async def acached_retrieval(cache: Optional[TransactionAwareCache],
+                            registry: Neo4jDriverRegistry,
+                            credentials: Neo4jCredentials,
+                            key: str,
+                            fetch: Callable[[], Awaitable[Any]],
+                            span: Dict,
+                            hit_metric: str = 'cacheHit') -> Any:
+    if cache is None:
+        return await fetch()
+    tx_id = await asyncio.to_thread(registry.get_transaction_watermark(credentials).current)
+    res = cache.get(key, tx_id)
+    span[hit_metric] = int(res is not None)
+    if res is None:
+        res = await fetch()
+        cache.put(key, res, tx_id)
+    return res
+
+
+GRAPHRAG_RESULT_KEY = 'graphrag_result'
+
+
+@dataclass
+class GraphRAGResult:
+    """What one chain invocation answered and the context, query and per-stage timings (ms) it came from.
+
+    The chains fill the result passed with an invocation instead of keeping the last one on themselves, so a single
+    chain instance can be shared across sessions and threads."""
+    answer: Optional[str] = None
+    context: Optional[str] = None
+    encoded_context: Optional[EncodedContext] = None
+    retrieval_query: Optional[str] = None
+    retrieval_query_params: Optional[Dict] = None
+    guard_report: Optional[GuardReport] = None
+    k: Optional[int] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def context_stats(self) -> Optional[Dict]:
+        # computed on read, so only callers that show them pay for tokenizing the baseline
+        return None if self.encoded_context is None else self.encoded_context.stats()
+
+    def get_browser_queries(self) -> Dict:
+        params_string = json.dumps(self.retrieval_query_params)
+        params_query = f":params {params_string}"
+        return {'params_query': params_query,
+                'params_url_query': f'/browser?cmd=params&arg={params_string}',
+                'query_body': self.retrieval_query}
+
+
+def run_config(result: GraphRAGResult, instrumentation: Instrumentation, chain: str) -> RunnableConfig:
+    return {'callbacks': [LLMTimingCallback(instrumentation, chain, result.timings)],
+            'configurable': {GRAPHRAG_RESULT_KEY: result}}
+
+
+def result_from_config(config: Optional[RunnableConfig]) -> GraphRAGResult:
+    """The result of the invocation a step runs in, or a throwaway one when e.g. a retriever is called directly."""
+    result = ((config or {}).get('configurable') or {}).get(GRAPHRAG_RESULT_KEY)
+    return GraphRAGResult() if result is None else result
+
+
+class GraphRAGChainBase:
+    """Plumbing the chains share: running `self.chain` into a `GraphRAGResult`, encoding the retrieved context and
+    re-ranking it. Subclasses build `self.chain` and set the attributes below."""
+    name: str
+    instrumentation: Instrumentation
+    chain: Runnable
+    context_encoder: ContextEncoder
+    reranker: Optional[Reranker] = None
+
+    def _context_items(self, docs) -> List:
+        return [format_res_dicts(doc) for doc in docs]
+
+    def _format_context(self, docs, config: RunnableConfig) -> str:
+        result = result_from_config(config)
+        with self.instrumentation.span(self.name, 'context', result.timings) as span:
+            encoded = self.context_encoder.encode(self._context_items(docs))
+            span.update(bytes=len(encoded.text.encode()), tokens=encoded.tokens)
+        result.context = encoded.text
+        result.encoded_context = encoded
+        return encoded.text
+
+    def _rerank(self, res: List[Dict], result: GraphRAGResult, query_vector: List[float]) -> List[Dict]:
+        if self.reranker is None:
+            return res
+        with self.instrumentation.span(self.name, 'rerank', result.timings) as span:
+            res = self.reranker.rerank(res, query_vector, self.store.query)
+            span['rows'] = len(res)
+        return res
+
+    async def _arerank(self, res: List[Dict], result: GraphRAGResult, query_vector: List[float]) -> List[Dict]:
+        if self.reranker is None:
+            return res
+        with self.instrumentation.span(self.name, 'rerank', result.timings) as span:
+            res = await self.reranker.arerank(res, query_vector,
+                                              partial(self.driver_registry.async_query, self.credentials))
+            span['rows'] = len(res)
+        return res
+
+    def _rerank_batch(self, results: List[List[Dict]], query_vectors: List[List[float]]) -> List[List[Dict]]:
+        if self.reranker is None:
+            return results
+        return [self.reranker.rerank(res, query_vector, self.store.query)
+                for res, query_vector in zip(results, query_vectors)]
+
+    def _invoke(self, chain_input, result: Optional[GraphRAGResult], return_result: bool):
+        result = GraphRAGResult() if result is None else result
+        with self.instrumentation.span(self.name, 'total', result.timings):
+            result.answer = self.chain.invoke(chain_input, config=run_config(result, self.instrumentation, self.name))
+        return result if return_result else result.answer
+
+    def _stream(self, chain_input, result: Optional[GraphRAGResult]) -> Iterator[str]:
+        result = GraphRAGResult() if result is None else result
+        chunks = []
+        with self.instrumentation.span(self.name, 'total', result.timings):
+            for chunk in self.chain.stream(chain_input, config=run_config(result, self.instrumentation, self.name)):
+                chunks.append(chunk)
+                yield chunk
+        result.answer = ''.join(chunks)
+
+    async def _ainvoke(self, chain_input, result: Optional[GraphRAGResult], return_result: bool):
+        result = GraphRAGResult() if result is None else result
+        with self.instrumentation.span(self.name, 'total', result.timings):
+            result.answer = await self.chain.ainvoke(chain_input,
+                                                     config=run_config(result, self.instrumentation, self.name))
+        return result if return_result else result.answer
+
+    async def _astream(self, chain_input, result: Optional[GraphRAGResult]) -> AsyncIterator[str]:
+        result = GraphRAGResult() if result is None else result
+        chunks = []
+        with self.instrumentation.span(self.name, 'total', result.timings):
+            async for chunk in self.chain.astream(chain_input,
+                                                  config=run_config(result, self.instrumentation, self.name)):
+                chunks.append(chunk)
+                yield chunk
+        result.answer = ''.join(chunks)
+
+    def invoke(self, prompt: str, result: Optional[GraphRAGResult] = None, return_result: bool = False):
+        """Returns the answer, or with `return_result=True` the `GraphRAGResult` holding it and its trace."""
+        return self._invoke(prompt, result, return_result)
+
+    def stream(self, prompt: str, result: Optional[GraphRAGResult] = None) -> Iterator[str]:
+        """Yields answer tokens as they arrive. The retrieval trace is set on `result` before the first token."""
+        return self._stream(prompt, result)
+
+    async def ainvoke(self, prompt: str, result: Optional[GraphRAGResult] = None, return_result: bool = False):
+        return await self._ainvoke(prompt, result, return_result)
+
+    def astream(self, prompt: str, result: Optional[GraphRAGResult] = None) -> AsyncIterator[str]:
+        return self._astream(prompt, result)
+
+
+class ParameterizedGraphRAGChain(GraphRAGChainBase):
+    """A chain whose retrieval searches for `retrieval_search_text` (the prompt by default) with extra
+    `query_params` for its Cypher, e.g. a `customerId`."""
+
+    @staticmethod
+    def _chain_input(prompt: str, retrieval_search_text: str = None, query_params: Dict = None) -> Dict:
+        if retrieval_search_text is None:
+            retrieval_search_text = prompt
+        if query_params is None:
+            query_params = dict()
+        return {'retrieverInput': {'searchPrompt': retrieval_search_text, 'queryParams': query_params},
+                'prompt': prompt}
+
+    def invoke(self, prompt: str, retrieval_search_text: str = None, query_params: Dict = None,
+               result: Optional[GraphRAGResult] = None, return_result: bool = False):
+        """Returns the answer, or with `return_result=True` the `GraphRAGResult` holding it and its trace."""
+        return self._invoke(self._chain_input(prompt, retrieval_search_text, query_params), result, return_result)
+
+    def stream(self, prompt: str, retrieval_search_text: str = None, query_params: Dict = None,
+               result: Optional[GraphRAGResult] = None) -> Iterator[str]:
+        """Yields answer tokens as they arrive. The retrieval trace is set on `result` before the first token."""
+        return self._stream(self._chain_input(prompt, retrieval_search_text, query_params), result)
+
+    async def ainvoke(self, prompt: str, retrieval_search_text: str = None, query_params: Dict = None,
+                      result: Optional[GraphRAGResult] = None, return_result: bool = False):
+        return await self._ainvoke(self._chain_input(prompt, retrieval_search_text, query_params), result,
+                                   return_result)
+
+    def astream(self, prompt: str, retrieval_search_text: str = None, query_params: Dict = None,
+                result: Optional[GraphRAGResult] = None) -> AsyncIterator[str]:
+        return self._astream(self._chain_input(prompt, retrieval_search_text, query_params), result)
 
-class GraphRAGChain:
+
+class GraphRAGChain(GraphRAGChainBase):
     def __init__(self,
                  vector_index_name: str,
                  prompt_instructions: str,
@@ -113,14 +607,25 @@ class GraphRAGChain:
                  neo4j_uri: Optional[str] = None,
                  neo4j_username: Optional[str] = None,
                  neo4j_password: Optional[str] = None,
-                 neo4j_database: Optional[str] = None
+                 neo4j_database: Optional[str] = None,
+                 neo4j_driver_registry: Optional[Neo4jDriverRegistry] = None,
+                 context_encoder: Optional[ContextEncoder] = None,
+                 name: Optional[str] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 retrieval_cache: Optional[TransactionAwareCache] = retrieval_cache
                  ):
+        """Retrieval results are shared across chains through `retrieval_cache` until they expire or the database
+        commits a new transaction. Pass None to disable it."""
+        from langchain_neo4j import Neo4jVector
+        self.name = name or type(self).__name__
+        self.retrieval_cache = retrieval_cache
+        self.instrumentation = instrumentation or default_instrumentation
+        self.credentials = Neo4jCredentials.resolve(neo4j_uri, neo4j_username, neo4j_password, neo4j_database)
+        self.driver_registry = neo4j_driver_registry or driver_registry
+
         self.store = Neo4jVector.from_existing_index(
-            embedding=embedding_model,
-            url=neo4j_uri,
-            username=neo4j_username,
-            password=neo4j_password,
-            database=neo4j_database,
+            embedding=get_embedding_model(),
+            graph=self.driver_registry.get_graph(self.credentials),
             index_name=vector_index_name,
             retrieval_query=graph_retrieval_query)
 
@@ -128,12 +633,14 @@ class GraphRAGChain:
 
         self.prompt = PromptTemplate.from_template(prompt_instructions + PROMPT_CONTEXT_TEMPLATE)
 
-        self.chain = ({'context': self.retriever | self._format_and_save_context, 'input': RunnablePassthrough()}
+        self.chain = ({'context': RunnableLambda(self._retrieve, afunc=self._aretrieve)
+                                  | self._format_context,
+                       'input': RunnablePassthrough()}
                       | self.prompt
-                      | llm
+                      | get_llm()
                       | StrOutputParser())
 
-        self.last_used_context = None
+        self.context_encoder = context_encoder or JsonContextEncoder()
 
         self.k = k
 
@@ -146,13 +653,49 @@ class GraphRAGChain:
             self.store.retrieval_query if self.store.retrieval_query else default_retrieval
         )
 
-    def _format_and_save_context(self, docs) -> str:
-        res = json.dumps([format_doc(d) for d in docs], indent=1)
-        self.last_used_context = res
-        return res
-
-    def invoke(self, prompt: str):
-        return self.chain.invoke(prompt)
+    def _context_items(self, docs: List[Document]) -> List[Dict]:
+        return [format_doc(d) for d in docs]
+
+    @staticmethod
+    def _documents(records: List[Dict]) -> List[Document]:
+        return [Document(page_content=record['text'],
+                         metadata={k: v for k, v in record['metadata'].items() if v is not None})
+                for record in records]
+
+    def _retrieval_query(self, query_vector: List[float], result: GraphRAGResult) -> Tuple[str, Dict, str]:
+        """The retrieval query, its parameters and its cache key. The sync and async paths run the same query, so they
+        can share cache entries."""
+        params = {'index': self.store.index_name, 'k': self.k}
+        result.retrieval_query = self.get_full_retrieval_query_template()
+        result.retrieval_query_params = {**params, 'embedding': query_vector}
+        key = retrieval_cache_key(self.credentials, result.retrieval_query, params, query_vector)
+        return result.retrieval_query, result.retrieval_query_params, key
+
+    def _retrieve(self, prompt: str, config: RunnableConfig) -> List[Document]:
+        result = result_from_config(config)
+        with self.instrumentation.span(self.name, 'embedding', result.timings):
+            query_vector = self.store.embedding.embed_query(prompt)
+        query, params, key = self._retrieval_query(query_vector, result)
+        with self.instrumentation.span(self.name, 'retrieval', result.timings) as span:
+            docs = cached_retrieval(self.retrieval_cache, self.driver_registry, self.credentials, key,
+                                    lambda: self._documents(self.store.query(query, params=params)), span)
+            span['rows'] = len(docs)
+        return docs
+
+    async def _aretrieve(self, prompt: str, config: RunnableConfig) -> List[Document]:
+        result = result_from_config(config)
+        with self.instrumentation.span(self.name, 'embedding', result.timings):
+            query_vector = await self.store.embedding.aembed_query(prompt)
+        query, params, key = self._retrieval_query(query_vector, result)
+
+        async def fetch() -> List[Document]:
+            return self._documents(await self.driver_registry.async_query(self.credentials, query, params))
+
+        with self.instrumentation.span(self.name, 'retrieval', result.timings) as span:
+            docs = await acached_retrieval(self.retrieval_cache, self.driver_registry, self.credentials, key, fetch,
+                                           span)
+            span['rows'] = len(docs)
+        return docs
 
     def get_full_retrieval_query_template(self):
         query_head = """CALL db.index.vector.queryNodes($index, $k, $embedding)
@@ -160,6 +703,10 @@ YIELD node, score
 """
         return query_head + self.retrieval_query
 
+    def retrieval_query_templates(self) -> List[str]:
+        """Parameterized queries this chain runs, e.g. to plan them with EXPLAIN at startup."""
+        return [self.get_full_retrieval_query_template()]
+
     def get_full_retrieval_query(self, prompt: str):
         query_head = f"""WITH {self.store.embedding.embed_query(prompt)}
     AS queryVector
@@ -176,50 +723,203 @@ YIELD node, score
         return {'params_query': params_query, 'query_body': query_head + self.retrieval_query}
 
 
-class GraphRAGText2CypherChain:
+class GraphRAGText2CypherChain(GraphRAGChainBase):
     def __init__(self,
                  prompt_instructions: str,
                  properties_to_remove_from_cypher_res: List = None,
                  neo4j_uri: Optional[str] = None,
                  neo4j_username: Optional[str] = None,
                  neo4j_password: Optional[str] = None,
-                 neo4j_database: Optional[str] = None
+                 neo4j_database: Optional[str] = None,
+                 neo4j_driver_registry: Optional[Neo4jDriverRegistry] = None,
+                 context_encoder: Optional[ContextEncoder] = None,
+                 name: Optional[str] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 cypher_cache: Optional[LRUCache] = t2c_cypher_cache,
+                 semantic_cache: Optional[SemanticCache] = t2c_semantic_cache,
+                 result_cache: Optional[TransactionAwareCache] = t2c_result_cache,
+                 cypher_guard: Optional[CypherGuard] = None
                  ):
-        self.store = Neo4jGraph(
-            url=neo4j_uri,
-            username=neo4j_username,
-            password=neo4j_password,
-            database=neo4j_database
-        )
+        """Generated Cypher is cached per normalized question in `cypher_cache` and per question embedding in
+        `semantic_cache`, so paraphrases of a previous question reuse its Cypher (only once it has run successfully).
+        A semantic match also needs the same `question_literals`, since questions differing only in a number or
+        name embed almost identically but need different Cypher.
+        Query results are cached per Cypher in `result_cache` until they expire or the database commits a new
+        transaction. Pass None to disable any level.
+
+        With a `cypher_guard`, generated Cypher gets a bounded LIMIT and is EXPLAINed before it runs. Rejected queries
+        raise `CypherGuardError`."""
+        self.name = name or type(self).__name__
+        self.instrumentation = instrumentation or default_instrumentation
+        self.credentials = Neo4jCredentials.resolve(neo4j_uri, neo4j_username, neo4j_password, neo4j_database)
+        self.driver_registry = neo4j_driver_registry or driver_registry
+        self.store = self.driver_registry.get_graph(self.credentials)
+        self.cypher_cache = cypher_cache
+        self.semantic_cache = semantic_cache
+        self.cypher_guard = cypher_guard
+        self.result_cache = result_cache
+        t2c_llm = get_t2c_llm()
+        self.cypher_cache_namespace = (getattr(t2c_llm, 'model_name', type(t2c_llm).__name__),
+                                       hashlib.sha256(prompt_instructions.encode()).hexdigest())
         self.t2c_prompt = PromptTemplate.from_template(prompt_instructions + T2C_PROMPT_TEMPLATE)
+        self.t2c_chain = self.t2c_prompt | t2c_llm.with_config(tags=['text2cypher']) | StrOutputParser()
         self.prompt = PromptTemplate.from_template(T2C_RESPONSE_PROMPT_TEMPLATE)
         self.chain = ({
-                          'context': self.t2c_prompt | t2c_llm | StrOutputParser() | self._format_and_save_query | self.store.query | self._format_and_save_context,
+                          'context': RunnableLambda(self._retrieve, afunc=self._aretrieve)
+                                     | self._format_context,
                           'input': RunnablePassthrough()
                       }
                       | self.prompt
-                      | llm
+                      | get_llm()
                       | StrOutputParser())
-        self.last_used_context = None
-        self.last_retrieval_query = None
+        self.context_encoder = context_encoder or JsonContextEncoder()
         self.properties_to_remove_from_cypher_res = properties_to_remove_from_cypher_res
 
-    def _format_and_save_context(self, docs) -> str:
+    def _context_items(self, docs: List[Dict]) -> List[Dict]:
         if self.properties_to_remove_from_cypher_res is not None:
             docs = remove_key_from_dict(docs, self.properties_to_remove_from_cypher_res)
-        res = json.dumps(docs, indent=1)
-        self.last_used_context = res
+        return docs
+
+    def _cypher_cache_key(self, question: str) -> str:
+        return query_cache_key(*self.cypher_cache_namespace, normalize_question(question))
+
+    def _result_cache_key(self, query: str) -> str:
+        return query_cache_key(self.credentials.uri, self.credentials.database, query)
+
+    def _cached_cypher(self, question: str) -> Optional[str]:
+        if self.cypher_cache is None:
+            return None
+        cypher = self.cypher_cache.get(self._cypher_cache_key(question))
+        self.instrumentation.observe(self.name, 'text2cypher', 'cacheHit', int(cypher is not None))
+        return cypher
+
+    def _semantic_cache_namespace(self, question: str) -> Tuple:
+        return (*self.cypher_cache_namespace, question_literals(question))
+
+    def _semantic_cached_cypher(self, question: str, question_vector: Optional[List[float]]) -> Optional[str]:
+        if question_vector is None:
+            return None
+        cypher = self.semantic_cache.get(question_vector, namespace=self._semantic_cache_namespace(question))
+        self.instrumentation.observe(self.name, 'text2cypher', 'semanticCacheHit', int(cypher is not None))
+        return cypher
+
+    def _save_cypher(self, question: str, question_vector: Optional[List[float]], cypher: str):
+        if self.cypher_cache is not None:
+            self.cypher_cache.put(self._cypher_cache_key(question), cypher)
+        if question_vector is not None:
+            self.semantic_cache.put(question_vector, cypher, namespace=self._semantic_cache_namespace(question))
+
+    def _embed_question(self, question: str, timings: Dict[str, float]) -> Optional[List[float]]:
+        if self.semantic_cache is None:
+            return None
+        with self.instrumentation.span(self.name, 'embedding', timings):
+            return get_embedding_model().embed_query(question)
+
+    async def _aembed_question(self, question: str, timings: Dict[str, float]) -> Optional[List[float]]:
+        if self.semantic_cache is None:
+            return None
+        with self.instrumentation.span(self.name, 'embedding', timings):
+            return await get_embedding_model().aembed_query(question)
+
+    def _current_tx_id(self) -> Optional[int]:
+        return self.driver_registry.get_transaction_watermark(self.credentials).current()
+
+    def retrieval_query_templates(self) -> List[str]:
+        # the queries are generated per question
+        return []
+
+    def _retrieve(self, question: str, config: RunnableConfig) -> List[Dict]:
+        result = result_from_config(config)
+        question_vector = None
+        cypher = self._cached_cypher(question)
+        if cypher is None:
+            question_vector = self._embed_question(question, result.timings)
+            cypher = self._semantic_cached_cypher(question, question_vector)
+        if cypher is None:
+            cypher = self.t2c_chain.invoke(question, config=config)
+        result.retrieval_query, result.guard_report = self._prepare_query(cypher)
+        res = self._query(result.retrieval_query, result.guard_report, result.timings)
+        self._save_cypher(question, question_vector, cypher)
         return res
 
-    def _format_and_save_query(self, s) -> str:
-        self.last_retrieval_query = s
-        return s
+    async def _aretrieve(self, question: str, config: RunnableConfig) -> List[Dict]:
+        result = result_from_config(config)
+        question_vector = None
+        cypher = self._cached_cypher(question)
+        if cypher is None:
+            question_vector = await self._aembed_question(question, result.timings)
+            cypher = self._semantic_cached_cypher(question, question_vector)
+        if cypher is None:
+            cypher = await self.t2c_chain.ainvoke(question, config=config)
+        result.retrieval_query, result.guard_report = self._prepare_query(cypher)
+        res = await self._aquery(result.retrieval_query, result.guard_report, result.timings)
+        self._save_cypher(question, question_vector, cypher)
+        return res
 
-    def invoke(self, prompt: str):
-        return self.chain.invoke(prompt)
+    def _prepare_query(self, cypher: str) -> Tuple[str, Optional[GuardReport]]:
+        query = cypher
+        if self.properties_to_remove_from_cypher_res:
+            # keeps e.g. embeddings on the server, remove_key_from_dict still catches what the rewrite can't
+            query = exclude_properties_from_returns(cypher, self.properties_to_remove_from_cypher_res)
+        if self.cypher_guard is None:
+            return query, None
+        report = self.cypher_guard.prepare(query)
+        report.original_query = cypher
+        if query != cypher:
+            report.changes.insert(0, 'Excluded ' + ', '.join(self.properties_to_remove_from_cypher_res)
+                                  + ' from returned nodes and relationships')
+        return report.query, report
+
+    def _execute(self, query: str, report: Optional[GuardReport], timings: Dict[str, float]) -> List[Dict]:
+        if self.cypher_guard is None:
+            return self.store.query(query)
+        driver = self.driver_registry.get_driver(self.credentials)
+        with self.instrumentation.span(self.name, 'guard', timings):
+            self.cypher_guard.preflight(driver, report, self.credentials.database)
+        return self.cypher_guard.execute(driver, report, self.credentials.database)
+
+    async def _aexecute(self, query: str, report: Optional[GuardReport], timings: Dict[str, float]) -> List[Dict]:
+        if self.cypher_guard is None:
+            return await self.driver_registry.async_query(self.credentials, query)
+        driver = self.driver_registry.get_async_driver(self.credentials)
+        with self.instrumentation.span(self.name, 'guard', timings):
+            await self.cypher_guard.apreflight(driver, report, self.credentials.database)
+        return await self.cypher_guard.aexecute(driver, report, self.credentials.database)
+
+    def _query(self, query: str, report: Optional[GuardReport], timings: Dict[str, float]) -> List[Dict]:
+        with self.instrumentation.span(self.name, 'retrieval', timings) as span:
+            tx_id = None
+            if self.result_cache is not None:
+                tx_id = self._current_tx_id()
+                res = self.result_cache.get(self._result_cache_key(query), tx_id)
+                span['cacheHit'] = int(res is not None)
+                if res is not None:
+                    span['rows'] = len(res)
+                    return res
+            res = self._execute(query, report, timings)
+            span['rows'] = len(res)
+        if self.result_cache is not None:
+            self.result_cache.put(self._result_cache_key(query), res, tx_id)
+        return res
+
+    async def _aquery(self, query: str, report: Optional[GuardReport], timings: Dict[str, float]) -> List[Dict]:
+        with self.instrumentation.span(self.name, 'retrieval', timings) as span:
+            tx_id = None
+            if self.result_cache is not None:
+                tx_id = await asyncio.to_thread(self._current_tx_id)
+                res = self.result_cache.get(self._result_cache_key(query), tx_id)
+                span['cacheHit'] = int(res is not None)
+                if res is not None:
+                    span['rows'] = len(res)
+                    return res
+            res = await self._aexecute(query, report, timings)
+            span['rows'] = len(res)
+        if self.result_cache is not None:
+            self.result_cache.put(self._result_cache_key(query), res, tx_id)
+        return res
 
 
-class GraphRAGPreFilterChain:
+class GraphRAGPreFilterChain(ParameterizedGraphRAGChain):
     def __init__(self,
                  vector_index_name: str,
                  prompt_instructions: str = '',
@@ -228,24 +928,39 @@ class GraphRAGPreFilterChain:
                  neo4j_uri: Optional[str] = None,
                  neo4j_username: Optional[str] = None,
                  neo4j_password: Optional[str] = None,
-                 neo4j_database: Optional[str] = None
+                 neo4j_database: Optional[str] = None,
+                 neo4j_driver_registry: Optional[Neo4jDriverRegistry] = None,
+                 embedding_mirror: Optional['EmbeddingMirror'] = None,
+                 context_encoder: Optional[ContextEncoder] = None,
+                 name: Optional[str] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 retrieval_cache: Optional[TransactionAwareCache] = retrieval_cache,
+                 candidate_cache: Optional[TransactionAwareCache] = prefilter_candidate_cache,
+                 reranker: Optional[Reranker] = None
                  ):
+        """Retrieval results are shared across chains through `retrieval_cache` until they expire or the database
+        commits a new transaction. Pass None to disable it.
+
+        The candidates `graph_prefilter_query` returns for a set of query parameters (e.g. one `customerId`) are kept
+        in `candidate_cache` the same way, as element ids and `prefilterMetadata`. Repeat parameters then skip the
+        graph traversal and only score their candidates. Pass None to run the full query every time.
+
+        With a `reranker`, retrieved rows are re-ranked in-process and only its best `top_m` reach the prompt."""
+        from langchain_neo4j import Neo4jVector
+        self.name = name or type(self).__name__
+        self.retrieval_cache = retrieval_cache
+        self.instrumentation = instrumentation or default_instrumentation
+        self.credentials = Neo4jCredentials.resolve(neo4j_uri, neo4j_username, neo4j_password, neo4j_database)
+        self.driver_registry = neo4j_driver_registry or driver_registry
+
+        self.store = self.driver_registry.get_graph(self.credentials)
+
         self.vectorStore = Neo4jVector.from_existing_index(
-            embedding=embedding_model,
-            url=neo4j_uri,
-            username=neo4j_username,
-            password=neo4j_password,
-            database=neo4j_database,
+            embedding=get_embedding_model(),
+            graph=self.store,
             index_name=vector_index_name)
 
-        self.store = Neo4jGraph(
-            url=neo4j_uri,
-            username=neo4j_username,
-            password=neo4j_password,
-            database=neo4j_database
-        )
-
-        self.embedding_model = embedding_model
+        self.embedding_model = get_embedding_model()
 
         self.vector_search_template = f"""
 WITH node, prefilterMetadata, vector.similarity.cosine($embedding, node.`{self.vectorStore.embedding_node_property}`) AS score
@@ -260,56 +975,136 @@ ORDER by score DESC LIMIT toInteger($k)
 
         self.retrieval_query_template = graph_prefilter_query + '\n' + self.vector_search_template
 
+        # with a candidate cache or a local embedding mirror the pre-filter query only returns candidates, which are
+        # then looked up again by element id and scored in the graph or by the mirror
+        self.embedding_mirror = embedding_mirror
+        self.candidate_cache = candidate_cache
+        self.candidate_ids_template = graph_prefilter_query + '\nRETURN elementId(node) AS id, prefilterMetadata'
+        self.candidate_scoring_template = """UNWIND $candidates AS candidate
+MATCH (node) WHERE elementId(node) = candidate.id
+WITH node, candidate.prefilterMetadata AS prefilterMetadata""" + self.vector_search_template
+        # candidates the mirror hasn't synced yet come without a score and are scored in the graph
+        self.candidate_details_template = f"""UNWIND $candidates AS candidate
+MATCH (node) WHERE elementId(node) = candidate.id
+WITH node, candidate,
+    coalesce(candidate.score, vector.similarity.cosine($embedding, node.`{self.vectorStore.embedding_node_property}`)) AS score
+WHERE score IS NOT NULL
+RETURN node.`{self.vectorStore.text_node_property}` AS text,
+    score,
+    apoc.map.merge(node {{.*, `{self.vectorStore.text_node_property}`: Null, `{self.vectorStore.embedding_node_property}`: Null, id: Null}}, candidate.prefilterMetadata) AS metadata
+ORDER BY score DESC LIMIT toInteger($k)"""
+
         self.prompt = PromptTemplate.from_template(prompt_instructions + PROMPT_CONTEXT_TEMPLATE)
 
         self.chain = ({
-                          'context': (lambda x: x['retrieverInput']) | RunnableLambda(
-                              self.retriever) | self._format_and_save_context,
+                          'context': (lambda x: x['retrieverInput'])
+                                     | RunnableLambda(self.retriever, afunc=self.aretriever)
+                                     | self._format_context,
                           'input': (lambda x: x['prompt'])
                       }
                       | self.prompt
-                      | llm
+                      | get_llm()
                       | StrOutputParser())
 
-        self.last_used_context = None
-        self.last_retrieval_query = None
-        self.last_retrieval_query_params = None
+        self.context_encoder = context_encoder or JsonContextEncoder()
         self.k = k
-
-    def _format_and_save_context(self, docs) -> str:
-        res = json.dumps([format_res_dicts(doc) for doc in docs], indent=1)
-        self.last_used_context = res
-        return res
-
-    def _format_and_save_query(self, template: str, params: Dict):
-        self.last_retrieval_query = template
-        self.last_retrieval_query_params = params
-
-    def get_last_browser_queries(self):
-        params_string = json.dumps(self.last_retrieval_query_params)
-        params_query = f":params {params_string}"
-        return {'params_query': params_query,
-                'params_url_query': f'/browser?cmd=params&arg={params_string}',
-                'query_body': self.last_retrieval_query}
-
-    def retriever(self, x):
-        query_vector = self.embedding_model.embed_query(x['searchPrompt'])
-        params = {**x['queryParams'], **{'index': self.vectorStore.index_name, 'k': self.k, 'embedding': query_vector}}
-        res = self.store.query(self.retrieval_query_template, params=params)
-        self._format_and_save_query(self.retrieval_query_template, params)
-        return res
-
-    def invoke(self, prompt: str, retrieval_search_text: str = None, query_params: Dict = None):
-        if retrieval_search_text is None:
-            retrieval_search_text = prompt
-        if query_params is None:
-            query_params = dict()
-        return self.chain.invoke(
-            {'retrieverInput': {'searchPrompt': retrieval_search_text, 'queryParams': query_params},
-             'prompt': prompt})
-
-
-class DynamicGraphRAGChain:
+        self.reranker = reranker
+
+    def _candidate_key(self, query_params: Dict) -> str:
+        return retrieval_cache_key(self.credentials, self.candidate_ids_template, query_params)
+
+    def _candidate_scoring_query(self, candidates: List[Dict], query_vector: List[float]) -> Tuple[str, Dict]:
+        if self.embedding_mirror is None:
+            return self.candidate_scoring_template, {'candidates': candidates, 'embedding': query_vector, 'k': self.k}
+        self.embedding_mirror.reload_if_changed()
+        top_k = self.embedding_mirror.top_k([c['id'] for c in candidates], query_vector, self.k)
+        scored = [{**candidates[i], 'score': score} for i, score in top_k]
+        return self.candidate_details_template, {'candidates': scored, 'embedding': query_vector, 'k': self.k}
+
+    def prefill_candidates(self, query_params_list: List[Dict]) -> int:
+        """Fills `candidate_cache` ahead of requests, e.g. for active customers. Returns the number of sets stored."""
+        if self.candidate_cache is None:
+            return 0
+        watermark = self.driver_registry.get_transaction_watermark(self.credentials)
+        for query_params in query_params_list:
+            tx_id = watermark.current()
+            self.candidate_cache.put(self._candidate_key(query_params),
+                                     self.store.query(self.candidate_ids_template, params=query_params), tx_id)
+        return len(query_params_list)
+
+    def retrieval_query_templates(self) -> List[str]:
+        """Parameterized queries this chain runs, e.g. to plan them with EXPLAIN at startup."""
+        if self.candidate_cache is None and self.embedding_mirror is None:
+            return [self.retrieval_query_template]
+        scoring_template = (self.candidate_scoring_template if self.embedding_mirror is None
+                            else self.candidate_details_template)
+        return [self.candidate_ids_template, scoring_template]
+
+    def _fetch(self, query_params: Dict, params: Dict, query_vector: List[float],
+               span: Dict) -> Tuple[str, Dict, List[Dict]]:
+        """The query that produced the rows, its parameters and the rows. They are cached together, so a cache hit
+        reports the query its rows came from."""
+        if self.candidate_cache is None and self.embedding_mirror is None:
+            return self.retrieval_query_template, params, self.store.query(self.retrieval_query_template, params=params)
+        candidates = cached_retrieval(self.candidate_cache, self.driver_registry, self.credentials,
+                                      self._candidate_key(query_params),
+                                      lambda: self.store.query(self.candidate_ids_template, params=query_params),
+                                      span, 'candidateCacheHit')
+        span['candidates'] = len(candidates)
+        query, scoring_params = self._candidate_scoring_query(candidates, query_vector)
+        return query, scoring_params, self.store.query(query, params=scoring_params)
+
+    async def _afetch(self, query_params: Dict, params: Dict, query_vector: List[float],
+                      span: Dict) -> Tuple[str, Dict, List[Dict]]:
+        if self.candidate_cache is None and self.embedding_mirror is None:
+            return self.retrieval_query_template, params, await self.driver_registry.async_query(
+                self.credentials, self.retrieval_query_template, params)
+        candidates = await acached_retrieval(
+            self.candidate_cache, self.driver_registry, self.credentials, self._candidate_key(query_params),
+            lambda: self.driver_registry.async_query(self.credentials, self.candidate_ids_template, query_params),
+            span, 'candidateCacheHit')
+        span['candidates'] = len(candidates)
+        query, scoring_params = self._candidate_scoring_query(candidates, query_vector)
+        return query, scoring_params, await self.driver_registry.async_query(self.credentials, query, scoring_params)
+
+    def retriever(self, x, config: Optional[RunnableConfig] = None):
+        result = result_from_config(config)
+        with self.instrumentation.span(self.name, 'embedding', result.timings):
+            query_vector = self.embedding_model.embed_query(x['searchPrompt'])
+        with self.instrumentation.span(self.name, 'retrieval', result.timings) as span:
+            params = {**x['queryParams'], 'index': self.vectorStore.index_name, 'k': self.k, 'embedding': query_vector}
+            key = retrieval_cache_key(self.credentials, self.retrieval_query_template, params, query_vector)
+            result.retrieval_query, result.retrieval_query_params, res = cached_retrieval(
+                self.retrieval_cache, self.driver_registry, self.credentials, key,
+                lambda: self._fetch(x['queryParams'], params, query_vector, span), span)
+            span['rows'] = len(res)
+        return self._rerank(res, result, query_vector)
+
+    async def aretriever(self, x, config: Optional[RunnableConfig] = None):
+        result = result_from_config(config)
+        with self.instrumentation.span(self.name, 'embedding', result.timings):
+            query_vector = await self.embedding_model.aembed_query(x['searchPrompt'])
+        with self.instrumentation.span(self.name, 'retrieval', result.timings) as span:
+            params = {**x['queryParams'], 'index': self.vectorStore.index_name, 'k': self.k, 'embedding': query_vector}
+            key = retrieval_cache_key(self.credentials, self.retrieval_query_template, params, query_vector)
+            result.retrieval_query, result.retrieval_query_params, res = await acached_retrieval(
+                self.retrieval_cache, self.driver_registry, self.credentials, key,
+                lambda: self._afetch(x['queryParams'], params, query_vector, span), span)
+            span['rows'] = len(res)
+        return await self._arerank(res, result, query_vector)
+
+    def batch(self, prompts: List[str], query_params_list: List[Dict] = None) -> List[List[Dict]]:
+        """Retrieves context for many prompts using one embeddings call and one Cypher round trip."""
+        if query_params_list is None:
+            query_params_list = [dict() for _ in prompts]
+        query_vectors = self.embedding_model.embed_documents(prompts)
+        query, params = build_batch_query(self.retrieval_query_template, query_params_list, query_vectors)
+        params.update({'index': self.vectorStore.index_name, 'k': self.k})
+        results = split_batch_results(self.store.query(query, params=params), len(prompts))
+        return self._rerank_batch(results, query_vectors)
+
+
+class DynamicGraphRAGChain(ParameterizedGraphRAGChain):
     def __init__(self,
                  vector_index_name: str,
                  prompt_instructions: str = '',
@@ -318,38 +1113,72 @@ class DynamicGraphRAGChain:
                  neo4j_uri: Optional[str] = None,
                  neo4j_username: Optional[str] = None,
                  neo4j_password: Optional[str] = None,
-                 neo4j_database: Optional[str] = None
+                 neo4j_database: Optional[str] = None,
+                 neo4j_driver_registry: Optional[Neo4jDriverRegistry] = None,
+                 context_encoder: Optional[ContextEncoder] = None,
+                 name: Optional[str] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 retrieval_cache: Optional[TransactionAwareCache] = retrieval_cache,
+                 initial_k: Optional[int] = None,
+                 min_rows: Optional[int] = None,
+                 accept_row: Optional[Callable[[Dict], bool]] = None,
+                 reranker: Optional[Reranker] = None,
+                 quantized_index: Optional[Union[QuantizedEmbeddingIndex, RefreshingQuantizedEmbeddingIndex]] = None,
+                 shortlist_factor: int = 4
                  ):
+        """Retrieval results are shared across chains through `retrieval_cache` until they expire or the database
+        commits a new transaction. Pass None to disable it.
+
+        With `initial_k`, retrieval starts from that many vector candidates and doubles them, up to `k`, while fewer
+        than `min_rows` returned rows pass `accept_row` (all rows by default). Use it when the retrieval query filters
+        or ranks candidates by expensive graph patterns, so typical requests expand only a fraction of `k`. Stopping
+        early returns the same rows as `k` only when the query ranks rows by vector score. A query that ranks by a
+        graph signal, like the post-filter's `purchaseScore`, trades recall for the saved work: candidates past the
+        stopping point are never expanded, however well they would rank.
+
+        With a `reranker`, retrieved rows are re-ranked in-process and only its best `top_m` reach the prompt.
+
+        With a `quantized_index`, the vector index isn't searched. The `shortlist_factor * k` nearest nodes by their
+        compact codes are found in-process and rescored exactly against their full embeddings in Cypher. A
+        `RefreshingQuantizedEmbeddingIndex` reloads changed codes when the database commits new transactions."""
+        if initial_k is not None and min_rows is None:
+            raise ValueError('min_rows is required with initial_k')
+        from langchain_neo4j import Neo4jVector
+        self.name = name or type(self).__name__
+        self.retrieval_cache = retrieval_cache
+        self.instrumentation = instrumentation or default_instrumentation
+        self.credentials = Neo4jCredentials.resolve(neo4j_uri, neo4j_username, neo4j_password, neo4j_database)
+        self.driver_registry = neo4j_driver_registry or driver_registry
+
+        self.store = self.driver_registry.get_graph(self.credentials)
+
         self.vectorStore = Neo4jVector.from_existing_index(
-            embedding=embedding_model,
-            url=neo4j_uri,
-            username=neo4j_username,
-            password=neo4j_password,
-            database=neo4j_database,
+            embedding=get_embedding_model(),
+            graph=self.store,
             index_name=vector_index_name,
             retrieval_query=graph_retrieval_query)
 
-        self.store = Neo4jGraph(
-            url=neo4j_uri,
-            username=neo4j_username,
-            password=neo4j_password,
-            database=neo4j_database,
-        )
-
-        self.embedding_model = embedding_model
+        self.embedding_model = get_embedding_model()
 
         self.prompt = PromptTemplate.from_template(prompt_instructions + PROMPT_CONTEXT_TEMPLATE)
 
         self.chain = ({
-                          'context': (lambda x: x['retrieverInput']) | RunnableLambda(
-                              self.retriever) | self._format_and_save_context,
+                          'context': (lambda x: x['retrieverInput'])
+                                     | RunnableLambda(self.retriever, afunc=self.aretriever)
+                                     | self._format_context,
                           'input': (lambda x: x['prompt'])
                       }
                       | self.prompt
-                      | llm
+                      | get_llm()
                       | StrOutputParser())
 
         self.k = k
+        self.initial_k = initial_k
+        self.min_rows = min_rows
+        self.accept_row = accept_row
+        self.reranker = reranker
+        self.quantized_index = quantized_index
+        self.shortlist_factor = shortlist_factor
 
         default_retrieval = (
             f"RETURN node.`{self.vectorStore.text_node_property}` AS text, score, "
@@ -360,40 +1189,85 @@ class DynamicGraphRAGChain:
             self.vectorStore.retrieval_query if self.vectorStore.retrieval_query else default_retrieval
         )
 
-        self.full_retrieval_query_template = VECTOR_QUERY_HEAD + self.retrieval_query
-        self.last_used_context = None
-        self.last_retrieval_query = None
-        self.last_retrieval_query_params = None
-
-    def _format_and_save_context(self, docs) -> str:
-        res = json.dumps([format_res_dicts(doc) for doc in docs], indent=1)
-        self.last_used_context = res
-        return res
-
-    def _format_and_save_query(self, template: str, params: Dict):
-        self.last_retrieval_query = template
-        self.last_retrieval_query_params = params
-
-    def get_last_browser_queries(self):
-        params_string = json.dumps(self.last_retrieval_query_params)
-        params_query = f":params {params_string}"
-        return {'params_query': params_query,
-                'params_url_query': f'/browser?cmd=params&arg={params_string}',
-                'query_body': self.last_retrieval_query}
-
-    def retriever(self, x):
-        query_vector = self.embedding_model.embed_query(x['searchPrompt'])
-        params = {**x['queryParams'], **{'index': self.vectorStore.index_name, 'k': self.k, 'embedding': query_vector}}
-        res = self.store.query(self.full_retrieval_query_template, params=params)
-        self._format_and_save_query(self.full_retrieval_query_template, params)
-        return res
+        query_head = (VECTOR_QUERY_HEAD if quantized_index is None else
+                      RESCORE_QUERY_HEAD.format(embedding_property=self.vectorStore.embedding_node_property))
+        self.full_retrieval_query_template = query_head + self.retrieval_query
+        self.context_encoder = context_encoder or JsonContextEncoder()
+
+    def _candidate_ks(self) -> List[int]:
+        """`k` alone, or `initial_k` doubled until it reaches `k`, e.g. 25, 50, 100."""
+        if self.initial_k is None:
+            return [self.k]
+        ks = [min(self.initial_k, self.k)]
+        while ks[-1] < self.k:
+            ks.append(min(ks[-1] * 2, self.k))
+        return ks
+
+    def _vector_params(self, query_vector: List[float], k: int) -> Dict:
+        params = {'index': self.vectorStore.index_name, 'k': k, 'embedding': query_vector}
+        if self.quantized_index is not None:
+            params['candidates'] = self.quantized_index.shortlist(query_vector, k * self.shortlist_factor)
+        return params
+
+    def _has_enough_rows(self, res: List[Dict]) -> bool:
+        if self.min_rows is None:
+            return True
+        accepted = len(res) if self.accept_row is None else sum(1 for row in res if self.accept_row(row))
+        return accepted >= self.min_rows
+
+    def retrieval_query_templates(self) -> List[str]:
+        """Parameterized queries this chain runs, e.g. to plan them with EXPLAIN at startup."""
+        return [self.full_retrieval_query_template]
+
+    def retriever(self, x, config: Optional[RunnableConfig] = None):
+        result = result_from_config(config)
+        with self.instrumentation.span(self.name, 'embedding', result.timings):
+            query_vector = self.embedding_model.embed_query(x['searchPrompt'])
+        with self.instrumentation.span(self.name, 'retrieval', result.timings) as span:
+            for k in self._candidate_ks():
+                params = {**x['queryParams'], **self._vector_params(query_vector, k)}
+                key = retrieval_cache_key(self.credentials, self.full_retrieval_query_template, params, query_vector)
+                res = cached_retrieval(self.retrieval_cache, self.driver_registry, self.credentials, key,
+                                       lambda: self.store.query(self.full_retrieval_query_template, params=params),
+                                       span)
+                if self._has_enough_rows(res):
+                    break
+            span.update(rows=len(res), k=k)
+        result.k = k
+        result.retrieval_query, result.retrieval_query_params = self.full_retrieval_query_template, params
+        return self._rerank(res, result, query_vector)
+
+    async def aretriever(self, x, config: Optional[RunnableConfig] = None):
+        result = result_from_config(config)
+        with self.instrumentation.span(self.name, 'embedding', result.timings):
+            query_vector = await self.embedding_model.aembed_query(x['searchPrompt'])
+        with self.instrumentation.span(self.name, 'retrieval', result.timings) as span:
+            for k in self._candidate_ks():
+                params = {**x['queryParams'], **self._vector_params(query_vector, k)}
+                key = retrieval_cache_key(self.credentials, self.full_retrieval_query_template, params, query_vector)
+                res = await acached_retrieval(
+                    self.retrieval_cache, self.driver_registry, self.credentials, key,
+                    lambda: self.driver_registry.async_query(self.credentials, self.full_retrieval_query_template,
+                                                             params),
+                    span)
+                if self._has_enough_rows(res):
+                    break
+            span.update(rows=len(res), k=k)
+        result.k = k
+        result.retrieval_query, result.retrieval_query_params = self.full_retrieval_query_template, params
+        return await self._arerank(res, result, query_vector)
+
+    def batch(self, prompts: List[str], query_params_list: List[Dict] = None) -> List[List[Dict]]:
+        """Retrieves context for many prompts using one embeddings call and one Cypher round trip."""
+        if query_params_list is None:
+            query_params_list = [dict() for _ in prompts]
+        query_vectors = self.embedding_model.embed_documents(prompts)
+        if self.quantized_index is not None:
+            shortlist_k = self.k * self.shortlist_factor
+            query_params_list = [{**params, 'candidates': self.quantized_index.shortlist(query_vector, shortlist_k)}
+                                 for params, query_vector in zip(query_params_list, query_vectors)]
+        query, params = build_batch_query(self.full_retrieval_query_template, query_params_list, query_vectors)
+        params.update({'index': self.vectorStore.index_name, 'k': self.k})
+        results = split_batch_results(self.store.query(query, params=params), len(prompts))
+        return self._rerank_batch(results, query_vectors)
 
-    def invoke(self, prompt: str, retrieval_search_text: str = None, query_params: Dict = None):
-        if retrieval_search_text is None:
-            retrieval_search_text = prompt
-        if query_params is None:
-            query_params = dict()
-        return self.chain.invoke({
-            'retrieverInput': {'searchPrompt': retrieval_search_text, 'queryParams': query_params},
-            'prompt': prompt
-        })
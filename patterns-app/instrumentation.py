@@ -0,0 +1,144 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DEFAULT_MAX_SAMPLES = 10000
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Histogram:
+    """Keeps the most recent `max_samples` observations and summarizes them as p50/p95/p99."""
+
+    def __init__(self, max_samples: int = DEFAULT_MAX_SAMPLES):
+        self._values = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self._values.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self) -> Dict:
+        values = sorted(self._values)
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'max': values[-1] if values else 0.0}
+
+
+class Instrumentation:
+    """Per-stage latency and payload-size histograms for the GraphRAG chains.
+
+    Stages are timed with `span`, which records `<stage>.ms` plus any sizes the caller sets on the yielded dict,
+    e.g. `span['rows'] = len(res)`. Metrics are grouped by chain name and stage. Pass `timings` to also keep the
+    stage's ms for a single invocation.
+    """
+
+    def __init__(self, max_samples: int = DEFAULT_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self._histograms: Dict[str, Dict[str, Dict[str, Histogram]]] = \
+            defaultdict(lambda: defaultdict(dict))
+        self._lock = threading.Lock()
+
+    def observe(self, chain: str, stage: str, metric: str, value: float):
+        with self._lock:
+            histograms = self._histograms[chain][stage]
+            if metric not in histograms:
+                histograms[metric] = Histogram(self.max_samples)
+            histograms[metric].observe(value)
+
+    @contextmanager
+    def span(self, chain: str, stage: str, timings: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+        sizes: Dict[str, float] = dict()
+        start = time.perf_counter()
+        try:
+            yield sizes
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.observe(chain, stage, 'ms', ms)
+            if timings is not None:
+                timings[stage] = ms
+            for metric, value in sizes.items():
+                self.observe(chain, stage, metric, value)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {chain: {stage: {metric: h.summary() for metric, h in metrics.items()}
+                            for stage, metrics in stages.items()}
+                    for chain, stages in self._histograms.items()}
+
+    def to_json(self, indent: Optional[int] = 1) -> str:
+        return json.dumps(self.summary(), indent=indent)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+class LLMTimingCallback(BaseCallbackHandler):
+    """Records LLM time-to-first-token, total generation time and streamed token count for one chain invocation.
+
+    LLM runs tagged `text2cypher` are recorded under that stage, all others under `llm`. With `timings` the
+    invocation's generation and time-to-first-token ms are also kept there, as `<stage>` and `<stage>Ttft`.
+    """
+
+    def __init__(self, instrumentation: Instrumentation, chain: str, timings: Optional[Dict[str, float]] = None):
+        self.instrumentation = instrumentation
+        self.chain = chain
+        self.timings = timings
+        self._runs: Dict[UUID, Dict[str, Any]] = dict()
+
+    def _start(self, run_id: UUID, tags: Optional[List[str]]):
+        stage = 'text2cypher' if tags and 'text2cypher' in tags else 'llm'
+        self._runs[run_id] = {'stage': stage, 'start': time.perf_counter(), 'tokens': 0}
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, tags: Optional[List[str]] = None, **kwargs):
+        self._start(run_id, tags)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, tags: Optional[List[str]] = None,
+                            **kwargs):
+        self._start(run_id, tags)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        if run['tokens'] == 0:
+            ttft = (time.perf_counter() - run['start']) * 1000
+            self.instrumentation.observe(self.chain, run['stage'], 'ttftMs', ttft)
+            if self.timings is not None:
+                self.timings[run['stage'] + 'Ttft'] = ttft
+        run['tokens'] += 1
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        ms = (time.perf_counter() - run['start']) * 1000
+        self.instrumentation.observe(self.chain, run['stage'], 'ms', ms)
+        self.instrumentation.observe(self.chain, run['stage'], 'tokens', run['tokens'])
+        if self.timings is not None:
+            self.timings[run['stage']] = ms
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._runs.pop(run_id, None)
+
+
+default_instrumentation = Instrumentation()
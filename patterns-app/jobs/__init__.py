@@ -0,0 +1,25 @@
+"""Offline maintenance jobs that precompute graph data for the retrieval queries.
+
+Run them from the patterns-app directory, e.g. `python -m jobs.northwind_copurchase`.
+"""
+import argparse
+import os
+
+from graphrag import Neo4jCredentials
+
+
+def add_neo4j_arguments(parser: argparse.ArgumentParser, env_prefix: str = 'NEO4J', option_prefix: str = ''):
+    """Connection options falling back to `<env_prefix>_URI`, `_USERNAME`, `_PASSWORD` and `_DATABASE`.
+
+    Use `option_prefix` to take several connections, e.g. `hm-` adds `--hm-uri`, `--hm-username` and so on.
+    """
+    parser.add_argument(f'--{option_prefix}uri', default=os.environ.get(f'{env_prefix}_URI'))
+    parser.add_argument(f'--{option_prefix}username', default=os.environ.get(f'{env_prefix}_USERNAME', 'neo4j'))
+    parser.add_argument(f'--{option_prefix}password', default=os.environ.get(f'{env_prefix}_PASSWORD'))
+    parser.add_argument(f'--{option_prefix}database', default=os.environ.get(f'{env_prefix}_DATABASE', 'neo4j'))
+
+
+def credentials_from_args(args: argparse.Namespace, option_prefix: str = '') -> Neo4jCredentials:
+    prefix = option_prefix.replace('-', '_')
+    return Neo4jCredentials.resolve(getattr(args, f'{prefix}uri'), getattr(args, f'{prefix}username'),
+                                    getattr(args, f'{prefix}password'), getattr(args, f'{prefix}database'))
@@ -0,0 +1,103 @@
+import argparse
+import time
+from typing import Dict, List
+
+from neo4j import Driver, ManagedTransaction
+
+from graphrag import Neo4jDriverRegistry
+from jobs import add_neo4j_arguments, credentials_from_args
+
+ARTICLE_GRAPH_EMBEDDING_INDEX = 'article_graph_embeddings'
+# the page 2 query keeps the 10 nearest articles minus the article itself
+SIMILAR_TO_TOP_N = 9
+
+# Replacement for the page 2 retrieval query, one traversal over SIMILAR_TO instead of a vector search per article
+SIMILAR_TO_RETRIEVAL_QUERY = """WITH node AS searchProduct, score AS searchScore
+MATCH (searchProduct)<-[:VARIANT_OF]-(:Article)-[s:SIMILAR_TO]->(:Article)-[:VARIANT_OF]->(product)
+RETURN product.`text` AS text,
+    max(s.score) AS score,
+    product {.*, `text`: Null, `textEmbedding`: Null, id: Null} AS metadata
+ORDER by score DESC LIMIT 20"""
+
+# articles pointing at a changed or removed embedding have to look for new neighbours too
+MARK_DEPENDANTS_QUERY = """MATCH (changed:Article)
+WHERE changed.graphEmbedding IS NULL
+    OR changed.similarToEmbeddingHash IS NULL
+    OR changed.similarToEmbeddingHash <> apoc.util.md5(changed.graphEmbedding)
+MATCH (dependant:Article)-[:SIMILAR_TO]->(changed)
+WHERE dependant.similarToEmbeddingHash IS NOT NULL
+WITH DISTINCT dependant
+CALL { WITH dependant REMOVE dependant.similarToEmbeddingHash } IN TRANSACTIONS"""
+
+REMOVE_DROPPED_QUERY = """MATCH (a:Article)-[s:SIMILAR_TO]->()
+WHERE a.graphEmbedding IS NULL
+CALL { WITH a, s DELETE s REMOVE a.similarToEmbeddingHash } IN TRANSACTIONS"""
+
+# an article is stale when its embedding no longer matches the fingerprint stored with its SIMILAR_TO list
+PENDING_ARTICLES_QUERY = """MATCH (a:Article)
+WHERE a.graphEmbedding IS NOT NULL
+    AND (a.similarToEmbeddingHash IS NULL OR a.similarToEmbeddingHash <> apoc.util.md5(a.graphEmbedding))
+RETURN elementId(a) AS id"""
+
+UPDATE_SIMILAR_TO_QUERY = """UNWIND $articleIds AS articleId
+MATCH (a:Article)
+WHERE elementId(a) = articleId AND a.graphEmbedding IS NOT NULL
+CALL {
+    WITH a
+    OPTIONAL MATCH (a)-[old:SIMILAR_TO]->()
+    DELETE old
+}
+CALL {
+    WITH a
+    CALL db.index.vector.queryNodes($index, $topN + 1, a.graphEmbedding) YIELD node, score
+    WITH a, node, score
+    WHERE node <> a AND score < 1.0
+    ORDER BY score DESC LIMIT $topN
+    CREATE (a)-[:SIMILAR_TO {score: score}]->(node)
+}
+SET a.similarToEmbeddingHash = apoc.util.md5(a.graphEmbedding)"""
+
+RESET_QUERIES = ["MATCH ()-[s:SIMILAR_TO]->() CALL { WITH s DELETE s } IN TRANSACTIONS",
+                 """MATCH (a:Article) WHERE a.similarToEmbeddingHash IS NOT NULL
+CALL { WITH a REMOVE a.similarToEmbeddingHash } IN TRANSACTIONS"""]
+
+
+def _update_articles(tx: ManagedTransaction, article_ids: List[str], top_n: int):
+    tx.run(UPDATE_SIMILAR_TO_QUERY, articleIds=article_ids, index=ARTICLE_GRAPH_EMBEDDING_INDEX, topN=top_n).consume()
+
+
+def refresh(driver: Driver, database: str, batch_size: int = 500, top_n: int = SIMILAR_TO_TOP_N,
+            full: bool = False) -> Dict:
+    """Recomputes SIMILAR_TO for articles whose graph embedding is new or changed, and for their dependants.
+
+    Each article stores a fingerprint of the embedding its list was computed from, so an interrupted run can simply be
+    restarted. Articles that would newly rank among another article's neighbours are not picked up, and `top_n` only
+    applies to recomputed lists, use `full=True` to rebuild all lists after large embedding changes.
+    """
+    start = time.perf_counter()
+    with driver.session(database=database) as session:
+        if full:
+            for query in RESET_QUERIES:
+                session.run(query).consume()
+        dependants = session.run(MARK_DEPENDANTS_QUERY).consume().counters.properties_set
+        dropped = session.run(REMOVE_DROPPED_QUERY).consume().counters.relationships_deleted
+        article_ids = [r['id'] for r in session.run(PENDING_ARTICLES_QUERY)]
+        for i in range(0, len(article_ids), batch_size):
+            session.execute_write(_update_articles, article_ids[i:i + batch_size], top_n)
+    return {'articles': len(article_ids), 'dependants': dependants, 'droppedRelationships': dropped,
+            'seconds': round(time.perf_counter() - start, 2)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Materialize the nearest graph-embedding neighbours of H&M articles '
+                                                 'as SIMILAR_TO relationships for the single traversal retrieval query.')
+    add_neo4j_arguments(parser, env_prefix='HM_NEO4J')
+    parser.add_argument('--batch-size', type=int, default=500, help='articles per transaction')
+    parser.add_argument('--top-n', type=int, default=SIMILAR_TO_TOP_N, help='neighbours stored per article')
+    parser.add_argument('--full', action='store_true', help='drop all SIMILAR_TO lists and rebuild them')
+    args = parser.parse_args()
+
+    registry = Neo4jDriverRegistry()
+    credentials = credentials_from_args(args)
+    print(refresh(registry.get_driver(credentials), credentials.database, args.batch_size, args.top_n, args.full))
+    registry.close()
@@ -0,0 +1,122 @@
+import argparse
+import time
+from typing import Dict, List
+
+from neo4j import Driver, ManagedTransaction
+
+from graphrag import Neo4jDriverRegistry
+from jobs import add_neo4j_arguments, credentials_from_args
+
+# recommended products need a weight above this, like `copurchaseCount > 2` in the page 0 query
+COPURCHASE_WEIGHT_THRESHOLD = 2
+
+# Single-hop replacement for the page 0 retrieval query, reading what this job materializes
+COPURCHASE_RETRIEVAL_QUERY = f"""WITH node AS product, score
+MATCH (product)-[:SUPPLIED_BY]->(s:Supplier)
+CALL {{
+    WITH product
+    MATCH (product)<-[op:ORDERED_PRODUCT]-(c:Customer)
+    RETURN collect({{customerName:c.companyName, orderCount:op.orderCount}}) AS customerData
+}}
+CALL {{
+    WITH product
+    MATCH (product)-[w:CO_PURCHASED_WITH]-(recommendedProduct:Product)
+    WHERE w.weight > {COPURCHASE_WEIGHT_THRESHOLD}
+    RETURN collect({{recommendedProduct:recommendedProduct.productName, copurchaseCount:w.weight}}) AS recommendedProducts
+}}
+WITH product, score, s, customerData, recommendedProducts
+WHERE size(customerData) > 0 AND size(recommendedProducts) > 0
+RETURN  product.text AS text, 
+    score,
+    {{
+        productSupplierName: s.companyName, 
+        totalOrders: product.totalOrders, 
+        customerData: customerData, 
+        recommendedProducts: recommendedProducts
+    }} AS metadata
+"""
+
+# pages through orders by the orderID constraint index, so a run reads each order's line items once instead of every
+# batch scanning ORDER_CONTAINS relationships for unprocessed ones
+ORDER_PAGE_QUERY = """MATCH (o:Order) WHERE o.orderID > $after
+WITH o ORDER BY o.orderID LIMIT $batchSize
+RETURN o.orderID AS orderId,
+    elementId(o) AS id,
+    EXISTS { (o)-[r:ORDER_CONTAINS]->(:Product) WHERE r.copurchaseProcessedAt IS NULL } AS pending"""
+
+# every pair is counted once: a new line item pairs with already processed ones, and with new ones of a lower id
+UPDATE_COPURCHASE_QUERY = """UNWIND $orderIds AS orderId
+MATCH (o:Order)-[r:ORDER_CONTAINS]->(p:Product)
+WHERE elementId(o) = orderId AND r.copurchaseProcessedAt IS NULL
+MATCH (o)-[r2:ORDER_CONTAINS]->(q:Product)
+WHERE q <> p AND (r2.copurchaseProcessedAt IS NOT NULL OR elementId(r2) < elementId(r))
+WITH CASE WHEN elementId(p) < elementId(q) THEN [p, q] ELSE [q, p] END AS pair, count(*) AS orders
+WITH pair[0] AS a, pair[1] AS b, orders
+MERGE (a)-[w:CO_PURCHASED_WITH]->(b)
+ON CREATE SET w.weight = 0
+SET w.weight = w.weight + orders"""
+
+UPDATE_CUSTOMER_SUMMARY_QUERY = """UNWIND $orderIds AS orderId
+MATCH (c:Customer)-[:ORDERED]->(o:Order)-[r:ORDER_CONTAINS]->(p:Product)
+WHERE elementId(o) = orderId AND r.copurchaseProcessedAt IS NULL
+WITH c, p, count(*) AS orders
+MERGE (c)-[op:ORDERED_PRODUCT]->(p)
+ON CREATE SET op.orderCount = 0
+SET op.orderCount = op.orderCount + orders,
+    p.totalOrders = coalesce(p.totalOrders, 0) + orders"""
+
+MARK_PROCESSED_QUERY = """UNWIND $orderIds AS orderId
+MATCH (o:Order)-[r:ORDER_CONTAINS]->(:Product)
+WHERE elementId(o) = orderId AND r.copurchaseProcessedAt IS NULL
+SET r.copurchaseProcessedAt = datetime()"""
+
+RESET_QUERIES = ["MATCH ()-[w:CO_PURCHASED_WITH]->() CALL { WITH w DELETE w } IN TRANSACTIONS",
+                 "MATCH ()-[op:ORDERED_PRODUCT]->() CALL { WITH op DELETE op } IN TRANSACTIONS",
+                 "MATCH (p:Product) WHERE p.totalOrders IS NOT NULL CALL { WITH p REMOVE p.totalOrders } IN TRANSACTIONS",
+                 """MATCH ()-[r:ORDER_CONTAINS]->() WHERE r.copurchaseProcessedAt IS NOT NULL
+CALL { WITH r REMOVE r.copurchaseProcessedAt } IN TRANSACTIONS"""]
+
+
+def _process_orders(tx: ManagedTransaction, order_ids: List[str]):
+    # all updates and the processed marker commit together, so an interrupted run can simply be restarted
+    for query in (UPDATE_COPURCHASE_QUERY, UPDATE_CUSTOMER_SUMMARY_QUERY, MARK_PROCESSED_QUERY):
+        tx.run(query, orderIds=order_ids).consume()
+
+
+def refresh(driver: Driver, database: str, batch_size: int = 500, full: bool = False) -> Dict:
+    """Folds order line items added since the last run into CO_PURCHASED_WITH and ORDERED_PRODUCT.
+
+    Orders are read in `orderID` order, `batch_size` at a time, and whole orders are processed per transaction, so
+    line items of one order are never split across batches. Removed orders or line items are not subtracted, use
+    `full=True` to rebuild from scratch.
+    """
+    start = time.perf_counter()
+    with driver.session(database=database) as session:
+        if full:
+            for query in RESET_QUERIES:
+                session.run(query).consume()
+        orders, after = 0, ''
+        while True:
+            page = list(session.run(ORDER_PAGE_QUERY, after=after, batchSize=batch_size))
+            if not page:
+                break
+            after = page[-1]['orderId']
+            order_ids = [r['id'] for r in page if r['pending']]
+            if order_ids:
+                session.execute_write(_process_orders, order_ids)
+                orders += len(order_ids)
+    return {'orders': orders, 'seconds': round(time.perf_counter() - start, 2)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Materialize Northwind co-purchase relationships and customer '
+                                                 'order summaries for the single-hop retrieval query.')
+    add_neo4j_arguments(parser)
+    parser.add_argument('--batch-size', type=int, default=500, help='orders per transaction')
+    parser.add_argument('--full', action='store_true', help='drop materialized data and rebuild it from all orders')
+    args = parser.parse_args()
+
+    registry = Neo4jDriverRegistry()
+    credentials = credentials_from_args(args)
+    print(refresh(registry.get_driver(credentials), credentials.database, args.batch_size, args.full))
+    registry.close()
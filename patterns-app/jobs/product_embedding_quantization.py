@@ -0,0 +1,55 @@
+import argparse
+import time
+from typing import Dict
+
+from neo4j import Driver
+
+from graphrag import Neo4jDriverRegistry
+from jobs import add_neo4j_arguments, credentials_from_args
+from quantization import QUANTIZATION_METHODS, compact_property, quantize
+
+
+def refresh(driver: Driver, database: str, method: str, label: str = 'Product',
+            embedding_property: str = 'textEmbedding', batch_size: int = 1000, full: bool = False) -> Dict:
+    """Stores an int8 or binary copy of every node embedding as a byte array next to the full vector.
+
+    Each node keeps an `apoc.util.md5` fingerprint of the embedding its copy was made from, so re-runs only quantize
+    new or changed embeddings. Copies of removed embeddings are dropped. Use `full=True` to redo every copy.
+    """
+    start = time.perf_counter()
+    prop = compact_property(embedding_property, method)
+    with driver.session(database=database) as session:
+        session.run(f"""MATCH (n:`{label}`)
+WHERE n.`{embedding_property}` IS NULL AND n.`{prop}` IS NOT NULL
+CALL {{ WITH n REMOVE n.`{prop}`, n.`{prop}Hash` }} IN TRANSACTIONS""").consume()
+        pending = [r['id'] for r in session.run(f"""MATCH (n:`{label}`)
+WHERE n.`{embedding_property}` IS NOT NULL
+    AND ($full OR n.`{prop}Hash` IS NULL OR n.`{prop}Hash` <> apoc.util.md5(n.`{embedding_property}`))
+RETURN elementId(n) AS id""", full=full)]
+        for offset in range(0, len(pending), batch_size):
+            records = list(session.run(f"""MATCH (n) WHERE elementId(n) IN $ids
+RETURN elementId(n) AS id, n.`{embedding_property}` AS embedding""", ids=pending[offset:offset + batch_size]))
+            codes = quantize([r['embedding'] for r in records], method)
+            session.run(f"""UNWIND $rows AS row
+MATCH (n) WHERE elementId(n) = row.id
+SET n.`{prop}` = row.code, n.`{prop}Hash` = apoc.util.md5(n.`{embedding_property}`)""",
+                        rows=[{'id': r['id'], 'code': code.tobytes()} for r, code in zip(records, codes)]).consume()
+    return {'quantized': len(pending), 'property': prop, 'seconds': round(time.perf_counter() - start, 2)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Store int8 or binary quantized copies of product text embeddings '
+                                                 'for two-phase vector search.')
+    add_neo4j_arguments(parser)
+    parser.add_argument('method', choices=QUANTIZATION_METHODS)
+    parser.add_argument('--label', default='Product')
+    parser.add_argument('--embedding-property', default='textEmbedding')
+    parser.add_argument('--batch-size', type=int, default=1000, help='nodes per transaction')
+    parser.add_argument('--full', action='store_true', help='quantize every embedding again')
+    args = parser.parse_args()
+
+    registry = Neo4jDriverRegistry()
+    credentials = credentials_from_args(args)
+    print(refresh(registry.get_driver(credentials), credentials.database, args.method, args.label,
+                  args.embedding_property, args.batch_size, args.full))
+    registry.close()
@@ -0,0 +1,94 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.language_models import BaseChatModel
+
+MODEL_PROVIDER_ENV_VAR = 'GRAPHRAG_MODEL_PROVIDER'
+DEFAULT_MODEL_PROVIDER = 'openai'
+LOCAL_EMBEDDING_DIMENSION = 1536
+LOCAL_LLM_RESPONSE = 'This is a deterministic response from the local model provider.'
+LOCAL_T2C_RESPONSE = 'MATCH (n) RETURN n LIMIT 5'
+
+
+@dataclass(frozen=True)
+class ModelProvider:
+    """Factories for one model backend. `chat` gets the model name and whether it is used for Text2Cypher."""
+    embeddings: Callable[[str], 'Embeddings']
+    chat: Callable[[str, bool], 'BaseChatModel']
+
+
+_providers: Dict[str, ModelProvider] = {}
+# cache_clear functions of caches other modules build from the providers' models, e.g. graphrag's cached embeddings
+_dependent_cache_clears: List[Callable[[], None]] = []
+
+
+def register_dependent_cache(cache_clear: Callable[[], None]):
+    """Clears a cache of provider models whenever a provider is registered, like this module's own caches."""
+    _dependent_cache_clears.append(cache_clear)
+
+
+def register_provider(name: str, provider: ModelProvider):
+    _providers[name] = provider
+    _create_embeddings.cache_clear()
+    _create_chat_model.cache_clear()
+    for cache_clear in _dependent_cache_clears:
+        cache_clear()
+
+
+def get_provider_name() -> str:
+    return os.environ.get(MODEL_PROVIDER_ENV_VAR, DEFAULT_MODEL_PROVIDER)
+
+
+def get_provider(name: Optional[str] = None) -> ModelProvider:
+    name = name or get_provider_name()
+    if name not in _providers:
+        raise ValueError(f"Unknown model provider {name!r}, expected one of {sorted(_providers)}")
+    return _providers[name]
+
+
+@lru_cache(maxsize=None)
+def _create_embeddings(model: str, provider: str) -> 'Embeddings':
+    return get_provider(provider).embeddings(model)
+
+
+@lru_cache(maxsize=None)
+def _create_chat_model(model: str, text2cypher: bool, provider: str) -> 'BaseChatModel':
+    return get_provider(provider).chat(model, text2cypher)
+
+
+def get_embeddings(model: str, provider: Optional[str] = None) -> 'Embeddings':
+    """Memoized per provider and model, the provider defaults to `$GRAPHRAG_MODEL_PROVIDER` or openai."""
+    return _create_embeddings(model, provider or get_provider_name())
+
+
+def get_chat_model(model: str, text2cypher: bool = False, provider: Optional[str] = None) -> 'BaseChatModel':
+    return _create_chat_model(model, text2cypher, provider or get_provider_name())
+
+
+def _openai_embeddings(model: str) -> 'Embeddings':
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=model)
+
+
+def _openai_chat(model: str, text2cypher: bool) -> 'BaseChatModel':
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(temperature=0, model_name=model, streaming=True)
+
+
+def _local_embeddings(model: str) -> 'Embeddings':
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    return DeterministicFakeEmbedding(size=LOCAL_EMBEDDING_DIMENSION)
+
+
+def _local_chat(model: str, text2cypher: bool) -> 'BaseChatModel':
+    from langchain_core.language_models import FakeListChatModel
+    return FakeListChatModel(responses=[LOCAL_T2C_RESPONSE if text2cypher else LOCAL_LLM_RESPONSE])
+
+
+register_provider('openai', ModelProvider(embeddings=_openai_embeddings, chat=_openai_chat))
+# offline stand-ins: same text always embeds to the same vector, chat models answer with a fixed response
+register_provider('local', ModelProvider(embeddings=_local_embeddings, chat=_local_chat))
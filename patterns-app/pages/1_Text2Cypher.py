@@ -1,12 +1,14 @@
+from typing import Optional
+
 import streamlit as st
+from streamlit.delta_generator import DeltaGenerator
 
-from graphrag import GraphRAGChain, GraphRAGText2CypherChain
-from ui_utils import render_header_svg, get_neo4j_url_from_uri
+from cypher_guard import CypherGuardError
+from graphrag import GraphRAGResult
+from resources import northwind_text2cypher_chain, northwind_vector_only_chain
+from ui_utils import render_header_svg, get_neo4j_url_from_uri, render_context_stats, stream_concurrently
 
 NORTHWIND_NEO4J_URI = st.secrets['NORTHWIND_NEO4J_URI']
-NORTHWIND_NEO4J_USERNAME = st.secrets['NORTHWIND_NEO4J_USERNAME']
-NORTHWIND_NEO4J_PASSWORD = st.secrets['NORTHWIND_NEO4J_PASSWORD']
-NORTHWIND_NEO4J_DATABASE = st.secrets.get('NORTHWIND_NEO4J_DATABASE', 'neo4j')
 
 st.set_page_config(page_icon="images/logo-mark-fullcolor-RGB-transBG.svg", layout="wide")
 render_header_svg("images/graphrag.svg", 200)
@@ -21,103 +23,84 @@ with st.expander('Dataset Info:'):
     st.code('CALL db.schema.visualization()', language='cypher')
     st.code('''MATCH p=()-[]->()-[]->() RETURN p LIMIT 300''', language='cypher')
 
-prompt_instructions_with_schema = '''#Context 
-
-You have expertise in neo4j cypher query language and based on below graph data model schema, you are going to help me write cypher queries. 
-
-Node Labels and Properties
-
-["Customer"], ["country:String", "address:String", "contactTitle:String", "phone:String", "city:String", "contactName:String", "postalCode:String", "companyName:String", "customerID:String", "region:String", "fax:String"]
-["Supplier"], ["country:String", "address:String", "contactTitle:String", "supplierID:String", "phone:String", "city:String", "contactName:String", "postalCode:String", "companyName:String", "fax:String", "region:String", "homePage:String"]
-["Order"], ["orderID:String", "freight:String", "requiredDate:String", "employeeID:String", "shipVia:String", "customerID:String", "orderDate:String", "shippedDate:String"]
-["Category"], ["description:String", "categoryName:String", "picture:String", "categoryID:String"]
-["Product"], ["reorderLevel:Integer", "unitsInStock:Integer", "unitPrice:Float", "supplierID:String", "productID:String", "discontinued:String", "quantityPerUnit:String", "unitsOnOrder:Integer", "productName:String", "categoryID:String"]
-["Address"], ["addressID", "name", "address", "city", "region", "postalCode", "country"]
-
-Accepted graph traversal paths
-
-(:Customer)-[:ORDERED]->(:Order), 
-(:Product)-[:BELONGS_TO]->(:Category),
-(:Product)-[:SUPPLIED_BY]->(:Supplier), 
-(:Order)-[:ORDER_CONTAINS]->(:Product), 
-(:Order)-[:SHIPPED_TO]->(:Address)
-'''
-
-prompt_instructions_vector_only = """You are a product and retail expert who can answer questions based only on the context below.
-* Answer the question STRICTLY based on the context provided in JSON below.
-* Do not assume or retrieve any information outside of the context 
-* Think step by step before answering.
-* Do not return helpful or extra text or apologies
-* List the results in rich text format if there are more than one results"""
-
-top_k_vector_only = 5
-vector_index_name = 'product_text_embeddings'
-
-vector_only_rag_chain = GraphRAGChain(
-    neo4j_uri=NORTHWIND_NEO4J_URI,
-    neo4j_username=NORTHWIND_NEO4J_USERNAME,
-    neo4j_password=NORTHWIND_NEO4J_PASSWORD,
-    neo4j_database=NORTHWIND_NEO4J_DATABASE,
-    vector_index_name=vector_index_name,
-    prompt_instructions=prompt_instructions_vector_only,
-    k=top_k_vector_only)
-
-graphrag_t2c_chain = GraphRAGText2CypherChain(
-    neo4j_uri=NORTHWIND_NEO4J_URI,
-    neo4j_username=NORTHWIND_NEO4J_USERNAME,
-    neo4j_password=NORTHWIND_NEO4J_PASSWORD,
-    neo4j_database=NORTHWIND_NEO4J_DATABASE,
-    prompt_instructions=prompt_instructions_with_schema,
-    properties_to_remove_from_cypher_res=['textEmbedding'])
+
+vector_only_rag_chain = northwind_vector_only_chain()
+graphrag_t2c_chain = northwind_text2cypher_chain()
+top_k_vector_only = vector_only_rag_chain.k
 
 prompt = st.text_input("submit a prompt:", value="")
 col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("Vector Only")
-    if prompt:
-        with st.spinner('Running Vector Only RAG...'):
-            with st.expander('__Response:__', True):
-                st.markdown(vector_only_rag_chain.invoke(prompt))
-            with st.expander("__Context used to answer this prompt:__"):
-                st.json(vector_only_rag_chain.last_used_context)
-            with st.expander("__Query used to retrieve context:__"):
-                vector_rag_query = vector_only_rag_chain.get_full_retrieval_query(prompt)
-                st.markdown(f"""
-                This query only uses vector search.  The vector search will return the highest ranking `nodes` based on the vector similarity `score`(for this example we chose `{top_k_vector_only}` nodes)
-                """)
-                st.code(vector_rag_query, language='cypher')
-                st.markdown('### Visualize Retrieval in Neo4j')
-                st.markdown('To explore the results in Neo4j do the following:\n' +
-                            f'* Go to [Neo4j Browser]({get_neo4j_url_from_uri(NORTHWIND_NEO4J_URI)}) and enter your credentials\n' +
-                            '* Run the above queries')
-                st.link_button("Try in Neo4j Browser!", get_neo4j_url_from_uri(NORTHWIND_NEO4J_URI))
-
-            st.success('Done!')
-
 with col2:
     st.subheader("Text2Cypher")
 
-    if prompt:
-        with st.spinner('Running GraphRAG...'):
-            with st.expander('__Response:__', True):
-                st.markdown(graphrag_t2c_chain.invoke(prompt))
 
+def render_vector_only_details(result: GraphRAGResult, error: Optional[Exception]):
+    if error is not None:
+        raise error
+    with col1:
+        with st.expander("__Context used to answer this prompt:__"):
+            st.json(result.context)
+            render_context_stats(result.context_stats)
+        with st.expander("__Query used to retrieve context:__"):
+            vector_rag_query = vector_only_rag_chain.get_full_retrieval_query(prompt)
+            st.markdown(f"""
+            This query only uses vector search.  The vector search will return the highest ranking `nodes` based on the vector similarity `score`(for this example we chose `{top_k_vector_only}` nodes)
+            """)
+            st.code(vector_rag_query, language='cypher')
+            st.markdown('### Visualize Retrieval in Neo4j')
+            st.markdown('To explore the results in Neo4j do the following:\n' +
+                        f'* Go to [Neo4j Browser]({get_neo4j_url_from_uri(NORTHWIND_NEO4J_URI)}) and enter your credentials\n' +
+                        '* Run the above queries')
+            st.link_button("Try in Neo4j Browser!", get_neo4j_url_from_uri(NORTHWIND_NEO4J_URI))
+
+        st.success('Done!')
+
+
+def render_t2c_details(result: GraphRAGResult, response: DeltaGenerator, error: Optional[Exception]):
+    if error is not None and not isinstance(error, CypherGuardError):
+        raise error
+    with col2:
+        if error is not None:
+            response.error(f'The generated query was rejected: {error}')
+        else:
             with st.expander("__Context used to answer this prompt:__"):
-                st.json(graphrag_t2c_chain.last_used_context)
-
-            with st.expander("__Query used to retrieve context:__"):
-                graph_rag_query = graphrag_t2c_chain.last_retrieval_query
-                st.markdown(f"""
-                """)
-                st.code(graph_rag_query, language='cypher')
-                st.markdown('### Visualize Retrieval in Neo4j')
-                st.markdown('To explore the results in Neo4j do the following:\n' +
-                            f'* Go to [Neo4j Browser]({get_neo4j_url_from_uri(NORTHWIND_NEO4J_URI)}) and enter your credentials\n' +
-                            '* Run the above queries')
-                st.link_button("Try in Neo4j Browser!", get_neo4j_url_from_uri(NORTHWIND_NEO4J_URI))
-
-            st.success('Done!')
+                st.json(result.context)
+                render_context_stats(result.context_stats)
+
+        with st.expander("__Query used to retrieve context:__"):
+            graph_rag_query = result.retrieval_query
+            st.markdown(f"""
+            """)
+            st.code(graph_rag_query, language='cypher')
+            if result.guard_report is not None and result.guard_report.changes:
+                st.caption('Query guard: ' + '; '.join(result.guard_report.changes))
+            st.markdown('### Visualize Retrieval in Neo4j')
+            st.markdown('To explore the results in Neo4j do the following:\n' +
+                        f'* Go to [Neo4j Browser]({get_neo4j_url_from_uri(NORTHWIND_NEO4J_URI)}) and enter your credentials\n' +
+                        '* Run the above queries')
+            st.link_button("Try in Neo4j Browser!", get_neo4j_url_from_uri(NORTHWIND_NEO4J_URI))
+
+        st.success('Done!')
+
+
+if prompt:
+    vector_only_result = GraphRAGResult()
+    t2c_result = GraphRAGResult()
+    with col1:
+        vector_only_response = st.expander('__Response:__', True).empty()
+        vector_only_response.caption('Running Vector Only RAG...')
+    with col2:
+        t2c_response = st.expander('__Response:__', True).empty()
+        t2c_response.caption('Running GraphRAG...')
+    stream_concurrently([
+        (lambda: vector_only_rag_chain.stream(prompt, result=vector_only_result), vector_only_response,
+         lambda error: render_vector_only_details(vector_only_result, error)),
+        (lambda: graphrag_t2c_chain.stream(prompt, result=t2c_result), t2c_response,
+         lambda error: render_t2c_details(t2c_result, t2c_response, error)),
+    ])
 
 st.markdown("---")
 
@@ -1,12 +1,14 @@
+from typing import Optional
+
 import streamlit as st
+from streamlit.delta_generator import DeltaGenerator
 
-from graphrag import DynamicGraphRAGChain
-from ui_utils import render_header_svg, get_neo4j_url_from_uri
+from graphrag import GraphRAGResult
+from queries import HM_PAIRING_EXAMPLES, hm_pairing_prompt
+from resources import hm_graph_vector_chain, hm_vector_only_chain
+from ui_utils import render_header_svg, get_neo4j_url_from_uri, render_context_stats, stream_concurrently
 
 HM_NEO4J_URI = st.secrets['HM_NEO4J_URI']
-HM_NEO4J_USERNAME = st.secrets['HM_NEO4J_USERNAME']
-HM_NEO4J_PASSWORD = st.secrets['HM_NEO4J_PASSWORD']
-HM_NEO4J_DATABASE = st.secrets.get('HM_NEO4J_DATABASE', 'neo4j')
 
 st.set_page_config(page_icon="images/logo-mark-fullcolor-RGB-transBG.svg", layout="wide")
 render_header_svg("images/graphrag.svg", 200)
@@ -22,74 +24,11 @@ with st.expander('Dataset Info:'):
 st.markdown('''### Task: Generate fashion recommendations to pair with customer's recent purchases and interests given time of year.''')
 
 
-vector_index_name = 'product_text_embeddings'
-
-graph_retrieval_query = """WITH node AS searchProduct, score AS searchScore
-MATCH(searchProduct)<-[:VARIANT_OF]-(searchArticle:Article)
-WHERE  searchArticle.graphEmbedding IS NOT NULL
-CALL db.index.vector.queryNodes('article_graph_embeddings', 10, searchArticle.graphEmbedding) YIELD node, score
-WHERE score < 1.0
-MATCH (node)-[:VARIANT_OF]->(product)
-RETURN product.`text` AS text, 
-    max(score) AS score, 
-    product {.*, `text`: Null, `textEmbedding`: Null, id: Null} AS metadata
-ORDER by score DESC LIMIT 20"""
-
-graph_vector_chain = DynamicGraphRAGChain(neo4j_uri=HM_NEO4J_URI,
-                                          neo4j_username=HM_NEO4J_USERNAME,
-                                          neo4j_password=HM_NEO4J_PASSWORD,
-                                          neo4j_database=HM_NEO4J_DATABASE,
-                                          vector_index_name='product_text_embeddings',
-                                          graph_retrieval_query=graph_retrieval_query,
-                                          k=10)
-
-vector_only_chain = DynamicGraphRAGChain(neo4j_uri=HM_NEO4J_URI,
-                                         neo4j_username=HM_NEO4J_USERNAME,
-                                         neo4j_password=HM_NEO4J_PASSWORD,
-                                         neo4j_database=HM_NEO4J_DATABASE,
-                                         vector_index_name='product_text_embeddings',
-                                         k=10)
-
-
-def generate_prompt(cstmr_name_input, time_of_year_input, cstmr_interests_input):
-    return f'''
-    You are a personal assistant named Sally for a fashion, home, and beauty company called HRM.
-    write an email to {cstmr_name_input}, one of your customers, to recommend and summarize products that pair well with their 
-    recent purchases and searches given: 
-    - the current season / time of year: {time_of_year_input} 
-    - Recent purchases / searches: {cstmr_interests_input}
-    
-    Please only mention the products listed in the context below. Do not come up with or add any new products to the list.
-    The below candidates are recommended based on the purchase patterns of other customers in the HRM database.
-    Select the best 4 to 5 product subset from the context that best match the time of year: {time_of_year_input} and to pair with recent purchases.
-    Each product comes with an https `url` field. Make sure to provide that https url with descriptive name text in markdown for each product.
-    '''
-
-
-examples = [
-    [
-        'Alex Smith',
-        'Oversized Sweaters',
-        'Feb, 2024',
-    ],
-    [
-        'Robin Fischer',
-        'Oversized Sweaters',
-        'Feb, 2024'
-    ],
-    [
-        'Chris Johnson',
-        'Oversized Sweaters',
-        'Feb, 2024'
-    ],
-    [
-        'Robin Fischer',
-        'denim jeans',
-        'Feb, 2024'
-    ]
-]
-
-preset_example = st.selectbox("select an example case:", examples)
+graph_vector_chain = hm_graph_vector_chain()
+vector_only_chain = hm_vector_only_chain()
+
+
+preset_example = st.selectbox("select an example case:", HM_PAIRING_EXAMPLES)
 
 with st.form('input_form'):
     customer_name = st.text_input("customer name:", value=preset_example[0], key='customer_name_input')
@@ -99,51 +38,52 @@ with st.form('input_form'):
 
 if gen_content:
     st.markdown('### Initial Prompt: ')
-    st.markdown(generate_prompt(customer_name, time_of_year, customer_interests))
+    st.markdown(hm_pairing_prompt(customer_name, time_of_year, customer_interests))
 
 col1, col2 = st.columns(2)
 with col1:
     st.subheader("Vector Only")
-    if gen_content:
-        with st.spinner('Running Vector Only RAG...'):
-            with st.expander('__Response:__', True):
-                st.markdown(vector_only_chain.invoke(generate_prompt(customer_name, time_of_year, customer_interests),
-                                                     retrieval_search_text=customer_interests)
-                            )
-            with st.expander("__Context used to answer this prompt:__"):
-                st.json(vector_only_chain.last_used_context)
-
-            with st.expander("__Query used to retrieve context:__"):
-                vector_only_queries = vector_only_chain.get_last_browser_queries()
-                st.code(vector_only_queries['params_query'], language='cypher')
-                st.code(vector_only_queries['query_body'], language='cypher')
-                st.markdown('### Visualize Retrieval in Neo4j')
-                st.markdown('To explore the results in Neo4j do the following:\n' +
-                            f'* Go to [Neo4j Browser]({get_neo4j_url_from_uri(HM_NEO4J_URI)}) and enter your credentials\n' +
-                            '* Run the above queries')
-                st.link_button("Try in Neo4j Browser!", get_neo4j_url_from_uri(HM_NEO4J_URI))
-
-            st.success('Done!')
-
 with col2:
     st.subheader("GraphRAG With Graph Vectors")
-    if gen_content:
-        with st.spinner('Running GraphRAG...'):
-            with st.expander('__Response:__', True):
-                st.markdown(graph_vector_chain.invoke(generate_prompt(customer_name, time_of_year, customer_interests),
-                                                      retrieval_search_text=customer_interests)
-                            )
-            with st.expander("__Context used to answer this prompt:__"):
-                st.json(graph_vector_chain.last_used_context)
-
-            with st.expander("__Query used to retrieve context:__"):
-                graph_vector_queries = graph_vector_chain.get_last_browser_queries()
-                st.code(graph_vector_queries['params_query'], language='cypher')
-                st.code(graph_vector_queries['query_body'], language='cypher')
-                st.markdown('### Visualize Retrieval in Neo4j')
-                st.markdown('To explore the results in Neo4j do the following:\n' +
-                            f'* Go to [Neo4j Browser]({get_neo4j_url_from_uri(HM_NEO4J_URI)}) and enter your credentials\n' +
-                            '* Run the above queries')
-                st.link_button("Try in Neo4j Browser!", get_neo4j_url_from_uri(HM_NEO4J_URI))
-
-            st.success('Done!')
+
+
+def render_details(column: DeltaGenerator, result: GraphRAGResult, error: Optional[Exception]):
+    if error is not None:
+        raise error
+    with column:
+        with st.expander("__Context used to answer this prompt:__"):
+            st.json(result.context)
+            render_context_stats(result.context_stats)
+
+        with st.expander("__Query used to retrieve context:__"):
+            browser_queries = result.get_browser_queries()
+            st.code(browser_queries['params_query'], language='cypher')
+            st.code(browser_queries['query_body'], language='cypher')
+            st.markdown('### Visualize Retrieval in Neo4j')
+            st.markdown('To explore the results in Neo4j do the following:\n' +
+                        f'* Go to [Neo4j Browser]({get_neo4j_url_from_uri(HM_NEO4J_URI)}) and enter your credentials\n' +
+                        '* Run the above queries')
+            st.link_button("Try in Neo4j Browser!", get_neo4j_url_from_uri(HM_NEO4J_URI))
+
+        st.success('Done!')
+
+
+if gen_content:
+    prompt = hm_pairing_prompt(customer_name, time_of_year, customer_interests)
+    vector_only_result = GraphRAGResult()
+    graph_vector_result = GraphRAGResult()
+    with col1:
+        vector_only_response = st.expander('__Response:__', True).empty()
+        vector_only_response.caption('Running Vector Only RAG...')
+    with col2:
+        graph_vector_response = st.expander('__Response:__', True).empty()
+        graph_vector_response.caption('Running GraphRAG...')
+    stream_concurrently([
+        (lambda: vector_only_chain.stream(prompt, retrieval_search_text=customer_interests, result=vector_only_result),
+         vector_only_response,
+         lambda error: render_details(col1, vector_only_result, error)),
+        (lambda: graph_vector_chain.stream(prompt, retrieval_search_text=customer_interests,
+                                           result=graph_vector_result),
+         graph_vector_response,
+         lambda error: render_details(col2, graph_vector_result, error)),
+    ])
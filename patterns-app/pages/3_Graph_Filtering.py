@@ -1,12 +1,14 @@
+from typing import Optional
+
 import streamlit as st
+from streamlit.delta_generator import DeltaGenerator
 
-from graphrag import GraphRAGPreFilterChain, DynamicGraphRAGChain
-from ui_utils import render_header_svg, get_neo4j_url_from_uri
+from graphrag import GraphRAGResult
+from queries import HM_FILTERING_EXAMPLES, hm_seasonal_prompt
+from resources import hm_postfilter_chain, hm_prefilter_chain
+from ui_utils import render_header_svg, get_neo4j_url_from_uri, render_context_stats, stream_concurrently
 
 HM_NEO4J_URI = st.secrets['HM_NEO4J_URI']
-HM_NEO4J_USERNAME = st.secrets['HM_NEO4J_USERNAME']
-HM_NEO4J_PASSWORD = st.secrets['HM_NEO4J_PASSWORD']
-HM_NEO4J_DATABASE = st.secrets.get('HM_NEO4J_DATABASE', 'neo4j')
 
 st.set_page_config(page_icon="images/logo-mark-fullcolor-RGB-transBG.svg", layout="wide")
 st.markdown(' ')
@@ -23,82 +25,11 @@ with st.expander('Dataset Info:'):
 st.markdown('''### Task: Generate email content for personalized product recommendations based of customer interests, purchase history, and time of year.''')
 
 
-top_k = 20
-vector_index_name = 'product_text_embeddings'
-
-prefilter_graph_retrieval_query = """
-MATCH (:Customer {customerId:$customerId})-[:PURCHASED]->(:Article)
-<-[:PURCHASED]-(:Customer)-[:PURCHASED]->(recArticle:Article)-[:VARIANT_OF]->(product:Product)
-WITH count(recArticle) AS recommendationScore, product
-ORDER BY recommendationScore DESC LIMIT 100
-WITH product AS node, {recommendationScore:recommendationScore} AS prefilterMetadata"""
-
-postfilter_graph_retrieval_query = """WITH node AS product, score AS searchScore
-OPTIONAL MATCH(product)<-[:VARIANT_OF]-(:Article)<-[:PURCHASED]-(:Customer)
--[:PURCHASED]->(a:Article)<-[:PURCHASED]-(:Customer {customerId: $customerId})
-
-WITH count(a) AS purchaseScore, product.text AS text, searchScore, product.productCode AS productCode
-RETURN text,
-    (1+purchaseScore)*searchScore AS score,
-    {productCode: productCode, purchaseScore:purchaseScore, searchScore:searchScore} AS metadata
-ORDER BY purchaseScore DESC, searchScore DESC LIMIT 20"""
-
-graphrag_prefilter_chain = GraphRAGPreFilterChain(neo4j_uri=HM_NEO4J_URI,
-                                                  neo4j_username=HM_NEO4J_USERNAME,
-                                                  neo4j_password=HM_NEO4J_PASSWORD,
-                                                  neo4j_database=HM_NEO4J_DATABASE,
-                                                  vector_index_name='product_text_embeddings',
-                                                  graph_prefilter_query=prefilter_graph_retrieval_query,
-                                                  k=top_k)
-
-graphrag_postfilter_chain = DynamicGraphRAGChain(neo4j_uri=HM_NEO4J_URI,
-                                                 neo4j_username=HM_NEO4J_USERNAME,
-                                                 neo4j_password=HM_NEO4J_PASSWORD,
-                                                 neo4j_database=HM_NEO4J_DATABASE,
-                                                 vector_index_name='product_text_embeddings',
-                                                 graph_retrieval_query=postfilter_graph_retrieval_query,
-                                                 k=100)
-
-
-def generate_prompt(cstmr_name_input, time_of_year_input):
-    return f'''
-    You are a personal assistant named Sally for a fashion, home, and beauty company called HRM.
-    write an email to {cstmr_name_input}, one of your customers, to promote and summarize products relevant for them 
-    given the current season / time of year: {time_of_year_input}. 
-    Please only mention the products listed in the context below. Do not come up with or add any new products to the list.
-    Select the best 4 to 5 product subset from the context that best match the time of year: {time_of_year_input}.
-    Each product comes with an https `url` field. Make sure to provide that https url with descriptive name text in markdown for each product.
-    '''
-
-
-examples = [
-    [
-        'Alex Smith',
-        'Oversized Sweaters',
-        'daae10780ecd14990ea190a1e9917da33fe96cd8cfa5e80b67b4600171aa77e0',
-        'Feb, 2024',
-    ],
-    [
-        'Robin Fischer',
-        'Oversized Sweaters',
-        '819f4eab1fd76b932fd403ae9f427de8eb9c5b64411d763bb26b5c8c3c30f16f',
-        'Feb, 2024'
-    ],
-    [
-        'Chris Johnson',
-        'Oversized Sweaters',
-        '44b0898ecce6cc1268dfdb0f91e053db014b973f67e34ed8ae28211410910693',
-        'Feb, 2024'
-    ],
-    [
-        'Robin Fischer',
-        'denim jeans',
-        '819f4eab1fd76b932fd403ae9f427de8eb9c5b64411d763bb26b5c8c3c30f16f',
-        'Feb, 2024'
-    ]
-]
-
-preset_example = st.selectbox("select an example case:", examples)
+graphrag_prefilter_chain = hm_prefilter_chain()
+graphrag_postfilter_chain = hm_postfilter_chain()
+
+
+preset_example = st.selectbox("select an example case:", HM_FILTERING_EXAMPLES)
 
 with st.form('input_form'):
     input_col1, input_col2 = st.columns(2)
@@ -116,56 +47,59 @@ with st.form('input_form'):
 
 if gen_content:
     st.markdown('### Initial Prompt: ')
-    st.markdown(generate_prompt(customer_name, time_of_year))
+    st.markdown(hm_seasonal_prompt(customer_name, time_of_year))
 
 col1, col2 = st.columns(2)
-
 with col1:
     st.subheader("Graph Post-Filtering")
-    if gen_content:
-        with st.spinner('Running GraphRAG...'):
-            with st.expander('__Response:__', True):
-                st.markdown(graphrag_postfilter_chain.invoke(
-                    generate_prompt(customer_name, time_of_year),
-                    retrieval_search_text=customer_interests,
-                    query_params={"customerId": customer_id})
-                )
-            with st.expander("__Context used to answer this prompt:__"):
-                st.json(graphrag_postfilter_chain.last_used_context)
-
-            with st.expander("__Query used to retrieve context:__"):
-                graphrag_post_filter_queries = graphrag_postfilter_chain.get_last_browser_queries()
-                st.code(graphrag_post_filter_queries['params_query'], language='cypher')
-                st.code(graphrag_post_filter_queries['query_body'], language='cypher')
-                st.markdown('### Visualize Retrieval in Neo4j')
-                st.markdown('To explore the results in Neo4j do the following:\n' +
-                            f'* Go to [Neo4j Browser]({get_neo4j_url_from_uri(HM_NEO4J_URI)}) and enter your credentials\n' +
-                            '* Run the above queries')
-                st.link_button("Try in Neo4j Browser!", get_neo4j_url_from_uri(HM_NEO4J_URI))
-
-            st.success('Done!')
-
 with col2:
     st.subheader("Graph Pre-Filtering")
-    if gen_content:
-        with st.spinner('Running GraphRAG...'):
-            with st.expander('__Response:__', True):
-                st.markdown(graphrag_prefilter_chain.invoke(
-                    generate_prompt(customer_name, time_of_year),
-                    retrieval_search_text=customer_interests,
-                    query_params={"customerId": customer_id})
-                )
-            with st.expander("__Context used to answer this prompt:__"):
-                st.json(graphrag_prefilter_chain.last_used_context)
-
-            with st.expander("__Query used to retrieve context:__"):
-                graphrag_prefilter_queries = graphrag_prefilter_chain.get_last_browser_queries()
-                st.code(graphrag_prefilter_queries['params_query'], language='cypher')
-                st.code(graphrag_prefilter_queries['query_body'], language='cypher')
-                st.markdown('### Visualize Retrieval in Neo4j')
-                st.markdown('To explore the results in Neo4j do the following:\n' +
-                            f'* Go to [Neo4j Browser]({get_neo4j_url_from_uri(HM_NEO4J_URI)}) and enter your credentials\n' +
-                            '* Run the above queries')
-                st.link_button("Try in Neo4j Browser!", get_neo4j_url_from_uri(HM_NEO4J_URI))
-
-            st.success('Done!')
+
+
+def render_details(column: DeltaGenerator, result: GraphRAGResult, error: Optional[Exception]):
+    if error is not None:
+        raise error
+    with column:
+        with st.expander("__Context used to answer this prompt:__"):
+            st.json(result.context)
+            render_context_stats(result.context_stats)
+            if result.k is not None:
+                st.caption(f'Expanded {result.k} vector search candidates in the graph')
+                if result.k < graphrag_postfilter_chain.k:
+                    st.caption(f'Stopped before all {graphrag_postfilter_chain.k} candidates: products found later '
+                               'in the vector search were not ranked, even if bought more often')
+
+        with st.expander("__Query used to retrieve context:__"):
+            browser_queries = result.get_browser_queries()
+            st.code(browser_queries['params_query'], language='cypher')
+            st.code(browser_queries['query_body'], language='cypher')
+            st.markdown('### Visualize Retrieval in Neo4j')
+            st.markdown('To explore the results in Neo4j do the following:\n' +
+                        f'* Go to [Neo4j Browser]({get_neo4j_url_from_uri(HM_NEO4J_URI)}) and enter your credentials\n' +
+                        '* Run the above queries')
+            st.link_button("Try in Neo4j Browser!", get_neo4j_url_from_uri(HM_NEO4J_URI))
+
+        st.success('Done!')
+
+
+if gen_content:
+    prompt = hm_seasonal_prompt(customer_name, time_of_year)
+    query_params = {"customerId": customer_id}
+    postfilter_result = GraphRAGResult()
+    prefilter_result = GraphRAGResult()
+    with col1:
+        postfilter_response = st.expander('__Response:__', True).empty()
+        postfilter_response.caption('Running GraphRAG...')
+    with col2:
+        prefilter_response = st.expander('__Response:__', True).empty()
+        prefilter_response.caption('Running GraphRAG...')
+    stream_concurrently([
+        (lambda: graphrag_postfilter_chain.stream(prompt, retrieval_search_text=customer_interests,
+                                                  query_params=query_params, result=postfilter_result),
+         postfilter_response,
+         lambda error: render_details(col1, postfilter_result, error)),
+        (lambda: graphrag_prefilter_chain.stream(prompt, retrieval_search_text=customer_interests,
+                                                 query_params=query_params, result=prefilter_result),
+         prefilter_response,
+         lambda error: render_details(col2, prefilter_result, error)),
+    ])
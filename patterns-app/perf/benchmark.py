@@ -0,0 +1,308 @@
+"""Offline benchmark for the retrieval pattern chains.
+
+Drives the same chains and queries as the pages against locally loaded Northwind and H&M databases, with
+deterministic fake embeddings and chat models so only retrieval, context encoding and chain overhead are measured.
+Run it from the patterns-app directory, e.g. `python -m perf.benchmark --save-baseline perf/baseline.json`.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+from neo4j import RoutingControl
+
+from caching import LRUCache, SemanticCache, TransactionAwareCache
+from cypher_guard import CypherGuard, walk_plan
+from graphrag import (DynamicGraphRAGChain, GraphRAGChain, GraphRAGPreFilterChain, GraphRAGText2CypherChain,
+                      Neo4jCredentials, Neo4jDriverRegistry)
+from instrumentation import Instrumentation
+from jobs import add_neo4j_arguments, credentials_from_args
+from jobs.hm_article_similarity import SIMILAR_TO_RETRIEVAL_QUERY
+from jobs.northwind_copurchase import COPURCHASE_RETRIEVAL_QUERY
+from models import MODEL_PROVIDER_ENV_VAR, ModelProvider, register_provider
+from queries import (HM_FILTERING_EXAMPLES, HM_GRAPH_VECTOR_RETRIEVAL_QUERY, HM_PAIRING_EXAMPLES,
+                     HM_POSTFILTER_RETRIEVAL_QUERY, HM_PREFILTER_QUERY, NORTHWIND_GRAPH_RETRIEVAL_QUERY,
+                     NORTHWIND_PROMPT_INSTRUCTIONS, NORTHWIND_T2C_PROMPT_INSTRUCTIONS, NORTHWIND_T2C_SAMPLE_QUESTIONS,
+                     hm_pairing_prompt, hm_postfilter_accept, hm_seasonal_prompt)
+
+BENCHMARK_PROVIDER = 'benchmark'
+BENCHMARK_EMBEDDING_DIMENSION = 1536
+BENCHMARK_LLM_RESPONSE = 'Benchmark response.'
+DEFAULT_ITERATIONS = 20
+DEFAULT_WARMUP = 1
+DEFAULT_TOLERANCE = 0.2
+# latency changes smaller than this are noise, whatever the relative change
+MIN_REGRESSION_MS = 1.0
+# dataset name -> environment variable prefix of its connection options
+DATASETS = {'northwind': 'NORTHWIND_NEO4J', 'hm': 'HM_NEO4J'}
+
+# what the Text2Cypher model answers for NORTHWIND_T2C_SAMPLE_QUESTIONS, in the same order
+NORTHWIND_T2C_CYPHER = [
+    '''MATCH (c:Customer)-[:ORDERED]->(o:Order)
+WITH c, count(o) AS orders ORDER BY orders DESC LIMIT 10
+MATCH (c)-[:ORDERED]->(:Order)-[:ORDER_CONTAINS]->(p:Product)
+RETURN p.productName AS product, count(*) AS purchases ORDER BY purchases DESC LIMIT 5''',
+    '''MATCH (p1:Product)<-[:ORDER_CONTAINS]-(:Order)-[:ORDER_CONTAINS]->(p2:Product)
+WHERE elementId(p1) < elementId(p2)
+RETURN p1.productName AS product1, p2.productName AS product2, count(*) AS orders ORDER BY orders DESC LIMIT 10''',
+    '''MATCH (c:Customer {country: 'USA'})-[:ORDERED]->(o:Order)-[:ORDER_CONTAINS]->(:Product)
+-[:BELONGS_TO]->(:Category {categoryName: 'Beverages'})
+RETURN c.companyName AS customer, count(DISTINCT o) AS orders ORDER BY orders DESC LIMIT 1''',
+    '''MATCH (:Product {productName: "Sir Rodney's Marmalade"})<-[:ORDER_CONTAINS]-(:Order)-[:ORDER_CONTAINS]->(p:Product)
+RETURN p.productName AS product, count(*) AS orders ORDER BY orders DESC LIMIT 4''',
+]
+
+NORTHWIND_VECTOR_QUESTIONS = [
+    'What are good sweet spreads to pair with bread?',
+    'Recommend a strong dark beer',
+    'Which seafood products are popular?',
+    'I need cheese for a party',
+]
+
+
+def _benchmark_embeddings(model: str):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    return DeterministicFakeEmbedding(size=BENCHMARK_EMBEDDING_DIMENSION)
+
+
+def _benchmark_chat(model: str, text2cypher: bool):
+    from langchain_core.language_models import FakeListChatModel
+    # FakeListChatModel cycles through its responses, so the Text2Cypher answers follow the question order
+    return FakeListChatModel(responses=NORTHWIND_T2C_CYPHER if text2cypher else [BENCHMARK_LLM_RESPONSE])
+
+
+def use_benchmark_models():
+    """Switches chains built from now on to deterministic fake embeddings and chat models."""
+    register_provider(BENCHMARK_PROVIDER, ModelProvider(embeddings=_benchmark_embeddings, chat=_benchmark_chat))
+    # the chains resolve their models when they are built, so this applies to every chain created after it
+    os.environ[MODEL_PROVIDER_ENV_VAR] = BENCHMARK_PROVIDER
+
+
+@dataclass
+class BenchmarkCase:
+    """One page chain. `inputs` are (args, kwargs) for `invoke`."""
+    name: str
+    dataset: str
+    build: Callable[..., object]
+    inputs: List[Tuple[tuple, Dict]]
+
+
+def _hm_pairing_inputs() -> List[Tuple[tuple, Dict]]:
+    return [((hm_pairing_prompt(name, time_of_year, interests),), {'retrieval_search_text': interests})
+            for name, interests, time_of_year in HM_PAIRING_EXAMPLES]
+
+
+def _hm_filtering_inputs() -> List[Tuple[tuple, Dict]]:
+    return [((hm_seasonal_prompt(name, time_of_year),),
+             {'retrieval_search_text': interests, 'query_params': {'customerId': customer_id}})
+            for name, interests, customer_id, time_of_year in HM_FILTERING_EXAMPLES]
+
+
+def benchmark_cases() -> List[BenchmarkCase]:
+    """The chains as the pages configure them. Build functions take connection kwargs and the cache options."""
+    northwind_questions = [((q,), dict()) for q in NORTHWIND_VECTOR_QUESTIONS]
+    return [
+        BenchmarkCase('northwind_vector_only', 'northwind',
+                      lambda caches, **kw: GraphRAGChain(vector_index_name='product_text_embeddings',
+                                                         prompt_instructions=NORTHWIND_PROMPT_INSTRUCTIONS,
+                                                         k=5, retrieval_cache=caches.get('retrieval'), **kw),
+                      northwind_questions),
+        BenchmarkCase('northwind_graph_context', 'northwind',
+                      lambda caches, **kw: GraphRAGChain(vector_index_name='product_text_embeddings',
+                                                         prompt_instructions=NORTHWIND_PROMPT_INSTRUCTIONS,
+                                                         graph_retrieval_query=NORTHWIND_GRAPH_RETRIEVAL_QUERY,
+                                                         k=5, retrieval_cache=caches.get('retrieval'), **kw),
+                      northwind_questions),
+        BenchmarkCase('northwind_copurchase', 'northwind',
+                      lambda caches, **kw: GraphRAGChain(vector_index_name='product_text_embeddings',
+                                                         prompt_instructions=NORTHWIND_PROMPT_INSTRUCTIONS,
+                                                         graph_retrieval_query=COPURCHASE_RETRIEVAL_QUERY,
+                                                         k=5, retrieval_cache=caches.get('retrieval'), **kw),
+                      northwind_questions),
+        BenchmarkCase('northwind_text2cypher', 'northwind',
+                      lambda caches, **kw: GraphRAGText2CypherChain(
+                          prompt_instructions=NORTHWIND_T2C_PROMPT_INSTRUCTIONS,
+                          properties_to_remove_from_cypher_res=['textEmbedding'],
+                          cypher_guard=CypherGuard(),
+                          cypher_cache=caches.get('cypher'),
+                          semantic_cache=caches.get('semantic'),
+                          result_cache=caches.get('result'), **kw),
+                      [((q,), dict()) for q in NORTHWIND_T2C_SAMPLE_QUESTIONS]),
+        BenchmarkCase('hm_vector_only', 'hm',
+                      lambda caches, **kw: DynamicGraphRAGChain(vector_index_name='product_text_embeddings', k=10,
+                                                                retrieval_cache=caches.get('retrieval'), **kw),
+                      _hm_pairing_inputs()),
+        BenchmarkCase('hm_graph_vectors', 'hm',
+                      lambda caches, **kw: DynamicGraphRAGChain(vector_index_name='product_text_embeddings',
+                                                                graph_retrieval_query=HM_GRAPH_VECTOR_RETRIEVAL_QUERY,
+                                                                k=10, retrieval_cache=caches.get('retrieval'), **kw),
+                      _hm_pairing_inputs()),
+        BenchmarkCase('hm_similar_to', 'hm',
+                      lambda caches, **kw: DynamicGraphRAGChain(vector_index_name='product_text_embeddings',
+                                                                graph_retrieval_query=SIMILAR_TO_RETRIEVAL_QUERY,
+                                                                k=10, retrieval_cache=caches.get('retrieval'), **kw),
+                      _hm_pairing_inputs()),
+        BenchmarkCase('hm_prefilter', 'hm',
+                      lambda caches, **kw: GraphRAGPreFilterChain(vector_index_name='product_text_embeddings',
+                                                                  graph_prefilter_query=HM_PREFILTER_QUERY, k=20,
+                                                                  retrieval_cache=caches.get('retrieval'),
+                                                                  candidate_cache=caches.get('candidates'), **kw),
+                      _hm_filtering_inputs()),
+        BenchmarkCase('hm_postfilter', 'hm',
+                      lambda caches, **kw: DynamicGraphRAGChain(vector_index_name='product_text_embeddings',
+                                                                graph_retrieval_query=HM_POSTFILTER_RETRIEVAL_QUERY,
+                                                                k=100, initial_k=25, min_rows=20,
+                                                                accept_row=hm_postfilter_accept,
+                                                                retrieval_cache=caches.get('retrieval'), **kw),
+                      _hm_filtering_inputs()),
+    ]
+
+
+def create_caches(enabled: bool) -> Dict[str, object]:
+    """Fresh caches per case so one case never warms another. Disabled caches are None, which the chains skip."""
+    if not enabled:
+        return {'retrieval': None, 'cypher': None, 'semantic': None, 'result': None, 'candidates': None}
+    return {'retrieval': TransactionAwareCache(), 'cypher': LRUCache(), 'semantic': SemanticCache(),
+            'result': TransactionAwareCache(), 'candidates': TransactionAwareCache()}
+
+
+def build_chain(case: BenchmarkCase, registry: Neo4jDriverRegistry, credentials: Neo4jCredentials, caches: bool,
+                instrumentation: Instrumentation):
+    return case.build(create_caches(caches),
+                      neo4j_uri=credentials.uri, neo4j_username=credentials.username,
+                      neo4j_password=credentials.password, neo4j_database=credentials.database,
+                      neo4j_driver_registry=registry, name=case.name, instrumentation=instrumentation)
+
+
+def add_dataset_arguments(parser: argparse.ArgumentParser):
+    """`--northwind-uri`, `--hm-uri` and so on, falling back to the `NORTHWIND_NEO4J_*` and `HM_NEO4J_*` env vars."""
+    for dataset, env_prefix in DATASETS.items():
+        add_neo4j_arguments(parser, env_prefix=env_prefix, option_prefix=f'{dataset}-')
+
+
+def dataset_credentials(args: argparse.Namespace) -> Dict[str, Neo4jCredentials]:
+    return {dataset: credentials_from_args(args, f'{dataset}-') for dataset in DATASETS}
+
+
+def profile(registry: Neo4jDriverRegistry, credentials: Neo4jCredentials, query: str, params: Dict) -> Dict:
+    """Runs the query with PROFILE and sums database hits and rows over all plan operators."""
+    _, summary, _ = registry.get_driver(credentials).execute_query(f'PROFILE {query}', parameters_=params,
+                                                                   database_=credentials.database,
+                                                                   routing_=RoutingControl.READ)
+    operators = list(walk_plan(summary.profile or {}))
+    return {'dbHits': sum(o.get('dbHits', 0) for o in operators),
+            'rowsScanned': sum(o.get('rows', 0) for o in operators)}
+
+
+def _mean(values: List[float]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def run_case(case: BenchmarkCase, registry: Neo4jDriverRegistry, credentials: Neo4jCredentials,
+             iterations: int, warmup: int, caches: bool) -> Dict:
+    instrumentation = Instrumentation()
+    chain = build_chain(case, registry, credentials, caches, instrumentation)
+
+    # whole passes over the inputs keep the Text2Cypher answers in step with their questions
+    for args, kwargs in case.inputs * warmup:
+        chain.invoke(*args, **kwargs)
+    # profile every input once, outside the timed loop. With a candidate cache, the recorded query is the scoring
+    # of the cached candidates the chain ran rather than the full pre-filter query
+    profiles = []
+    for args, kwargs in case.inputs:
+        result = chain.invoke(*args, **kwargs, return_result=True)
+        profiles.append(profile(registry, credentials, result.retrieval_query, result.retrieval_query_params or dict()))
+    instrumentation.reset()
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        args, kwargs = case.inputs[i % len(case.inputs)]
+        chain.invoke(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    summary = instrumentation.summary().get(case.name, dict())
+    return {'throughput': iterations / elapsed if elapsed else 0.0,
+            'stages': {stage: {'p50': metrics['ms']['p50'], 'p95': metrics['ms']['p95']}
+                       for stage, metrics in summary.items() if 'ms' in metrics},
+            'rows': summary.get('retrieval', dict()).get('rows', dict()).get('mean', 0.0),
+            'contextBytes': summary.get('context', dict()).get('bytes', dict()).get('mean', 0.0),
+            'contextTokens': summary.get('context', dict()).get('tokens', dict()).get('mean', 0.0),
+            'dbHits': _mean([p['dbHits'] for p in profiles]),
+            'rowsScanned': _mean([p['rowsScanned'] for p in profiles])}
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of more than `tolerance` (relative) against the baseline, for cases present in both."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput']:.1f}/s, "
+                               f"baseline {previous['throughput']:.1f}/s")
+        for metric in ['dbHits', 'rowsScanned']:
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f'{name}: {metric} {current[metric]:,.0f}, baseline {previous[metric]:,.0f}')
+        for stage, latencies in current['stages'].items():
+            for p in ['p50', 'p95']:
+                before = previous['stages'].get(stage, dict()).get(p)
+                if before is not None and latencies[p] > before * (1 + tolerance) \
+                        and latencies[p] - before > MIN_REGRESSION_MS:
+                    regressions.append(f'{name}: {stage} {p} {latencies[p]:.1f} ms, baseline {before:.1f} ms')
+    return regressions
+
+
+def report(results: Dict):
+    for name, r in results.items():
+        print(f"{name:<26} {r['throughput']:>8.1f}/s  rows {r['rows']:>6.1f}  context {r['contextBytes']:>8.0f} B "
+              f"{r['contextTokens']:>6.0f} tok  dbHits {r['dbHits']:>10,.0f}  rowsScanned {r['rowsScanned']:>10,.0f}")
+        for stage, latencies in r['stages'].items():
+            print(f"    {stage:<22} p50 {latencies['p50']:>8.1f} ms  p95 {latencies['p95']:>8.1f} ms")
+
+
+if __name__ == '__main__':
+    cases = benchmark_cases()
+    parser = argparse.ArgumentParser(description='Benchmark the retrieval pattern chains against local databases.')
+    add_dataset_arguments(parser)
+    parser.add_argument('cases', nargs='*', help=f"cases to run, all by default: {', '.join(c.name for c in cases)}")
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS, help='timed invocations per case')
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help='untimed passes over the inputs per case')
+    parser.add_argument('--caches', action='store_true', help='enable the retrieval and Text2Cypher caches')
+    parser.add_argument('--baseline', help='fail if results regress against this baseline file')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed relative regression against the baseline')
+    parser.add_argument('--save-baseline', help='write results to this file')
+    args = parser.parse_args()
+    unknown = set(args.cases) - {c.name for c in cases}
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    use_benchmark_models()
+    registry = Neo4jDriverRegistry()
+    credentials = dataset_credentials(args)
+    results = dict()
+    for case in cases:
+        if args.cases and case.name not in args.cases:
+            continue
+        if not credentials[case.dataset].uri:
+            print(f'skipping {case.name}, no {case.dataset} database configured')
+            continue
+        results[case.name] = run_case(case, registry, credentials[case.dataset], args.iterations, args.warmup,
+                                      args.caches)
+    registry.close()
+    report(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION: {regression}')
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,77 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules the pages import, pages themselves need a running Streamlit app and its secrets
+PAGE_MODULES = ['graphrag', 'resources', 'models', 'caching', 'context_encoders', 'cypher_guard', 'quantization',
+                'reranking', 'ui_utils', 'embedding_mirror']
+# heavy imports that must stay deferred until a model or vector store is actually created
+DEFERRED_MODULES = ['langchain_openai', 'langchain_neo4j', 'openai', 'tiktoken']
+
+_IMPORT_TIME_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def measure(module: str) -> Dict:
+    """Imports `module` in a fresh interpreter with `-X importtime` and parses the trace."""
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         cwd=APP_DIR, capture_output=True, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(f'importing {module} failed:\n{res.stderr}')
+    imports = []
+    for line in res.stderr.splitlines():
+        m = _IMPORT_TIME_PATTERN.match(line)
+        if m:
+            imports.append({'module': m.group(4),
+                            'selfMs': int(m.group(1)) / 1000,
+                            'cumulativeMs': int(m.group(2)) / 1000,
+                            'depth': len(m.group(3)) // 2})
+    # children are listed before their parent, so the module's own imports are the deeper lines right above it
+    end = max((n for n, i in enumerate(imports) if i['module'] == module), default=None)
+    if end is None:
+        return {'module': module, 'ms': 0.0, 'depth': 0, 'imports': []}
+    start = end
+    while start > 0 and imports[start - 1]['depth'] > imports[end]['depth']:
+        start -= 1
+    return {'module': module, 'ms': imports[end]['cumulativeMs'], 'depth': imports[end]['depth'],
+            'imports': imports[start:end]}
+
+
+def best_of(module: str, repeat: int) -> Dict:
+    return min((measure(module) for _ in range(repeat)), key=lambda r: r['ms'])
+
+
+def report(results: List[Dict], top: int):
+    for r in results:
+        print(f"{r['module']:<20} {r['ms']:>9.1f} ms")
+        heaviest = sorted((i for i in r['imports'] if i['depth'] == r['depth'] + 1),
+                          key=lambda i: -i['cumulativeMs'])[:top]
+        for i in heaviest:
+            print(f"    {i['module']:<36} {i['cumulativeMs']:>9.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure cold import time of the modules the Streamlit pages use.')
+    parser.add_argument('modules', nargs='*', default=PAGE_MODULES)
+    parser.add_argument('--repeat', type=int, default=3, help='report the fastest of this many runs')
+    parser.add_argument('--top', type=int, default=5, help='heaviest direct imports to list per module')
+    parser.add_argument('--max-ms', type=float, help='exit non-zero if any module takes longer to import')
+    args = parser.parse_args()
+
+    results = [best_of(module, args.repeat) for module in args.modules]
+    report(results, args.top)
+
+    failures = []
+    for r in results:
+        eager = sorted({i['module'] for i in r['imports']} & set(DEFERRED_MODULES))
+        if eager:
+            failures.append(f"{r['module']} eagerly imports {', '.join(eager)}")
+        if args.max_ms is not None and r['ms'] > args.max_ms:
+            failures.append(f"{r['module']} took {r['ms']:.1f} ms, more than {args.max_ms:.1f} ms")
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,279 @@
+"""Concurrent-user load test for the retrieval pattern chains.
+
+Simulated users replay the page 2 and 3 examples, plus free-text searches, against shared chain instances, the same
+way concurrent Streamlit sessions share one app process. Chat models are stubbed with a fixed latency, so results
+show how many users retrieval and the Neo4j connection pool sustain. Run it from the patterns-app directory, e.g.
+`python -m perf.load_test --users 50 --ramp-up 10 --duration 60 --mode async`.
+"""
+import argparse
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from graphrag import Neo4jCredentials, Neo4jDriverRegistry
+from instrumentation import Histogram, Instrumentation
+from models import MODEL_PROVIDER_ENV_VAR, ModelProvider, register_provider
+from perf.benchmark import (BENCHMARK_EMBEDDING_DIMENSION, BENCHMARK_LLM_RESPONSE, NORTHWIND_T2C_CYPHER, BenchmarkCase,
+                            add_dataset_arguments, benchmark_cases, build_chain, dataset_credentials)
+
+LOAD_TEST_PROVIDER = 'load_test'
+DEFAULT_CASES = ['hm_vector_only', 'hm_graph_vectors', 'hm_prefilter', 'hm_postfilter']
+DEFAULT_USERS = 10
+DEFAULT_RAMP_UP_SECONDS = 5.0
+DEFAULT_DURATION_SECONDS = 30.0
+DEFAULT_LLM_LATENCY_MS = 800.0
+DEFAULT_SAMPLE_INTERVAL_SECONDS = 0.1
+
+# searches nobody picked from the examples, so retrieval caches see the long tail too
+FREE_TEXT_SEARCHES = [
+    'linen summer dress',
+    'running shoes',
+    'warm winter coat',
+    'kids pyjamas',
+    'gold hoop earrings',
+    'black office trousers',
+]
+
+
+class StubLatencyChatModel(FakeListChatModel):
+    """Answers like FakeListChatModel after `latency` seconds. Async calls sleep on the event loop, not a thread."""
+    latency: float = 0.0
+
+    def _call(self, *args: Any, **kwargs: Any) -> str:
+        time.sleep(self.latency)
+        return super()._call(*args, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        message = AIMessage(content=super()._call(messages, stop, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def use_stub_models(llm_latency_ms: float):
+    """Switches chains built from now on to fake embeddings and chat models answering after `llm_latency_ms`."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    def chat(model: str, text2cypher: bool) -> StubLatencyChatModel:
+        return StubLatencyChatModel(responses=NORTHWIND_T2C_CYPHER if text2cypher else [BENCHMARK_LLM_RESPONSE],
+                                    latency=llm_latency_ms / 1000)
+
+    def embeddings(model: str) -> DeterministicFakeEmbedding:
+        return DeterministicFakeEmbedding(size=BENCHMARK_EMBEDDING_DIMENSION)
+
+    register_provider(LOAD_TEST_PROVIDER, ModelProvider(embeddings=embeddings, chat=chat))
+    os.environ[MODEL_PROVIDER_ENV_VAR] = LOAD_TEST_PROVIDER
+
+
+def with_free_text(case: BenchmarkCase) -> List[Tuple[tuple, Dict]]:
+    """The case's example inputs plus one input per free-text search, reusing the example prompts and filters."""
+    inputs = list(case.inputs)
+    for i, search in enumerate(FREE_TEXT_SEARCHES):
+        args, kwargs = case.inputs[i % len(case.inputs)]
+        if 'retrieval_search_text' in kwargs:
+            inputs.append((args, {**kwargs, 'retrieval_search_text': search}))
+        else:
+            inputs.append(((search,), kwargs))
+    return inputs
+
+
+def pool_usage(driver) -> Optional[Dict[str, int]]:
+    """Connections in use and open in a driver's pool. Reads driver internals, so returns None if they change."""
+    try:
+        pool = driver._pool
+        connections = [c for address in list(pool.connections) for c in list(pool.connections.get(address, ()))]
+        return {'inUse': sum(c.in_use for c in connections),
+                'open': len(connections),
+                'max': pool.pool_config.max_connection_pool_size}
+    except (AttributeError, RuntimeError):
+        return None
+
+
+class LoadStats:
+    """Thread-safe request latencies, errors, and connection pool samples for one run."""
+
+    def __init__(self, ramp_up: float):
+        self.start = time.perf_counter()
+        self.steady_start = self.start + ramp_up
+        self.latency = Histogram()
+        self.steady_requests = 0
+        self.errors = Counter()
+        self.pool_samples: Dict[str, List[Dict[str, int]]] = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, started: float):
+        now = time.perf_counter()
+        with self._lock:
+            self.latency.observe((now - started) * 1000)
+            if started >= self.steady_start:
+                self.steady_requests += 1
+
+    def error(self, e: Exception):
+        with self._lock:
+            self.errors[type(e).__name__] += 1
+
+    def sample_pools(self, drivers: Dict[str, Any]):
+        for name, driver in drivers.items():
+            usage = pool_usage(driver)
+            if usage is not None:
+                self.pool_samples.setdefault(name, []).append(usage)
+
+
+def run_threads(workload: List[Tuple[Any, tuple, Dict]], users: int, ramp_up: float, duration: float,
+                stats: LoadStats, seed: int):
+    deadline = stats.start + duration
+
+    def user(i: int):
+        time.sleep(i * ramp_up / users)
+        rnd = random.Random(seed + i)
+        while time.perf_counter() < deadline:
+            chain, args, kwargs = rnd.choice(workload)
+            started = time.perf_counter()
+            try:
+                chain.invoke(*args, **kwargs)
+                stats.observe(started)
+            except Exception as e:
+                stats.error(e)
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+async def run_async(workload: List[Tuple[Any, tuple, Dict]], users: int, ramp_up: float, duration: float,
+                    stats: LoadStats, seed: int):
+    deadline = stats.start + duration
+
+    async def user(i: int):
+        await asyncio.sleep(i * ramp_up / users)
+        rnd = random.Random(seed + i)
+        while time.perf_counter() < deadline:
+            chain, args, kwargs = rnd.choice(workload)
+            started = time.perf_counter()
+            try:
+                await chain.ainvoke(*args, **kwargs)
+                stats.observe(started)
+            except Exception as e:
+                stats.error(e)
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+
+
+def sample_pools_until(stop: threading.Event, stats: LoadStats, drivers: Dict[str, Any], interval: float):
+    while not stop.wait(interval):
+        stats.sample_pools(drivers)
+
+
+def summarize(stats: LoadStats, duration: float, ramp_up: float, instrumentation: Instrumentation) -> Dict:
+    pools = dict()
+    for name, samples in stats.pool_samples.items():
+        in_use = [s['inUse'] for s in samples]
+        pools[name] = {'maxSize': samples[-1]['max'],
+                       'peakInUse': max(in_use),
+                       'meanInUse': sum(in_use) / len(in_use),
+                       'peakOpen': max(s['open'] for s in samples),
+                       'saturatedFraction': sum(s['inUse'] >= s['max'] for s in samples) / len(samples)}
+    steady_seconds = duration - ramp_up
+    return {'requests': stats.latency.count,
+            'errors': dict(stats.errors),
+            'throughput': stats.latency.count / duration,
+            'steadyThroughput': stats.steady_requests / steady_seconds if steady_seconds > 0 else None,
+            'latencyMs': stats.latency.summary(),
+            'chains': {chain: stages['total']['ms'] for chain, stages in instrumentation.summary().items()
+                       if 'total' in stages},
+            'pools': pools}
+
+
+def report(summary: Dict):
+    latency = summary['latencyMs']
+    steady = summary['steadyThroughput']
+    print(f"requests {summary['requests']}  errors {sum(summary['errors'].values())}  "
+          f"throughput {summary['throughput']:.1f}/s  steady state "
+          f"{f'{steady:.1f}/s' if steady is not None else 'n/a'}")
+    print(f"latency p50 {latency['p50']:.0f} ms  p95 {latency['p95']:.0f} ms  p99 {latency['p99']:.0f} ms  "
+          f"max {latency['max']:.0f} ms")
+    for error, count in summary['errors'].items():
+        print(f'    {error:<36} {count:>6}')
+    for chain, ms in summary['chains'].items():
+        print(f"    {chain:<22} {ms['count']:>6} req  p50 {ms['p50']:>7.0f} ms  p95 {ms['p95']:>7.0f} ms  "
+              f"p99 {ms['p99']:>7.0f} ms")
+    for name, pool in summary['pools'].items():
+        print(f"pool {name}: peak {pool['peakInUse']}/{pool['maxSize']} in use, mean {pool['meanInUse']:.1f}, "
+              f"peak open {pool['peakOpen']}, saturated {pool['saturatedFraction']:.0%} of the time")
+    if not summary['pools']:
+        print('pool usage unavailable for this driver version')
+
+
+if __name__ == '__main__':
+    cases = benchmark_cases()
+    parser = argparse.ArgumentParser(description='Load test the retrieval pattern chains with concurrent users.')
+    add_dataset_arguments(parser)
+    parser.add_argument('cases', nargs='*', default=DEFAULT_CASES,
+                        help=f"cases to mix, default {' '.join(DEFAULT_CASES)}, "
+                             f"available: {', '.join(c.name for c in cases)}")
+    parser.add_argument('--mode', choices=['threads', 'async'], default='threads',
+                        help='one thread per user calling invoke, or one task per user calling ainvoke')
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS, help='concurrent users at full load')
+    parser.add_argument('--ramp-up', type=float, default=DEFAULT_RAMP_UP_SECONDS,
+                        help='seconds over which users start, evenly spaced')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION_SECONDS,
+                        help='seconds from the start of the run until users stop issuing requests')
+    parser.add_argument('--llm-latency-ms', type=float, default=DEFAULT_LLM_LATENCY_MS,
+                        help='how long every stubbed chat model call takes')
+    parser.add_argument('--max-pool-size', type=int, default=100, help='Neo4j driver connection pool size')
+    parser.add_argument('--caches', action='store_true', help='enable the retrieval and Text2Cypher caches')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the order users pick inputs in')
+    args = parser.parse_args()
+    unknown = set(args.cases) - {c.name for c in cases}
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    use_stub_models(args.llm_latency_ms)
+    registry = Neo4jDriverRegistry(max_connection_pool_size=args.max_pool_size)
+    credentials: Dict[str, Neo4jCredentials] = dataset_credentials(args)
+    instrumentation = Instrumentation()
+    workload, used = [], dict()
+    for case in cases:
+        if case.name not in args.cases:
+            continue
+        if not credentials[case.dataset].uri:
+            print(f'skipping {case.name}, no {case.dataset} database configured')
+            continue
+        chain = build_chain(case, registry, credentials[case.dataset], args.caches, instrumentation)
+        workload.extend((chain, a, kw) for a, kw in with_free_text(case))
+        used[case.dataset] = credentials[case.dataset]
+    if not workload:
+        parser.error('no case has a database configured')
+
+    async def main():
+        drivers = {dataset: registry.get_driver(c) for dataset, c in used.items()}
+        if args.mode == 'async':
+            drivers.update({f'{dataset} async': registry.get_async_driver(c) for dataset, c in used.items()})
+        stats = LoadStats(args.ramp_up)
+        stop = threading.Event()
+        sampler = threading.Thread(target=sample_pools_until, daemon=True,
+                                   args=(stop, stats, drivers, DEFAULT_SAMPLE_INTERVAL_SECONDS))
+        sampler.start()
+        if args.mode == 'async':
+            await run_async(workload, args.users, args.ramp_up, args.duration, stats, args.seed)
+        else:
+            await asyncio.to_thread(run_threads, workload, args.users, args.ramp_up, args.duration, stats,
+                                    args.seed)
+        elapsed = time.perf_counter() - stats.start
+        stop.set()
+        sampler.join()
+        await registry.aclose()
+        return summarize(stats, elapsed, args.ramp_up, instrumentation)
+
+    summary = asyncio.run(main())
+    registry.close()
+    report(summary)
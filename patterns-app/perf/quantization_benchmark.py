@@ -0,0 +1,137 @@
+"""Recall and memory benchmark for two-phase vector search on quantized embeddings.
+
+Holds out some embeddings as queries, finds the exact top k for each against the rest at float32 precision, and
+compares that with a shortlist found on int8 or binary codes and rescored exactly. Everything runs in-process, so it
+measures the search methods rather than the database. Run it from the patterns-app directory, e.g.
+`python -m perf.quantization_benchmark` against the H&M database, or `--synthetic 50000` without one.
+"""
+import argparse
+import json
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from neo4j import RoutingControl
+
+from graphrag import Neo4jDriverRegistry
+from jobs import add_neo4j_arguments, credentials_from_args
+from quantization import QUANTIZATION_METHODS, QuantizedEmbeddingIndex
+
+DEFAULT_K = 10
+DEFAULT_QUERIES = 200
+DEFAULT_SHORTLIST_FACTORS = [1, 2, 4, 10]
+SYNTHETIC_DIMENSION = 1536
+SYNTHETIC_CLUSTERS = 500
+
+
+def load_embeddings(registry: Neo4jDriverRegistry, args: argparse.Namespace) -> np.ndarray:
+    credentials = credentials_from_args(args)
+    records, _, _ = registry.get_driver(credentials).execute_query(
+        f"MATCH (n:`{args.label}`) WHERE n.`{args.embedding_property}` IS NOT NULL "
+        f"RETURN n.`{args.embedding_property}` AS embedding",
+        database_=credentials.database, routing_=RoutingControl.READ)
+    return np.array([r['embedding'] for r in records], dtype=np.float32)
+
+
+def synthetic_embeddings(count: int, rng: np.random.Generator) -> np.ndarray:
+    """Noisy copies of random cluster centres, a rough stand-in for text embeddings of related products."""
+    centres = rng.standard_normal((SYNTHETIC_CLUSTERS, SYNTHETIC_DIMENSION), dtype=np.float32)
+    noise = rng.standard_normal((count, SYNTHETIC_DIMENSION), dtype=np.float32)
+    return centres[rng.integers(0, SYNTHETIC_CLUSTERS, count)] + 0.8 * noise
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _timed(func, *args) -> Tuple[object, float]:
+    start = time.perf_counter()
+    value = func(*args)
+    return value, (time.perf_counter() - start) * 1000
+
+
+def _exact_top_k(catalog: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = catalog @ query
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def _rescored_top_k(catalog: np.ndarray, query: np.ndarray, shortlist: np.ndarray, k: int) -> np.ndarray:
+    return shortlist[np.argsort(-(catalog[shortlist] @ query))[:k]]
+
+
+def run(embeddings: np.ndarray, queries: int, k: int, shortlist_factors: List[int], methods: List[str],
+        seed: int) -> Dict:
+    embeddings = _normalize(embeddings)
+    order = np.random.default_rng(seed).permutation(len(embeddings))
+    query_vectors, catalog = embeddings[order[:queries]], embeddings[order[queries:]]
+    exact = [_timed(_exact_top_k, catalog, q, k) for q in query_vectors]
+    results = {'catalog': len(catalog), 'dimension': catalog.shape[1], 'queries': len(query_vectors), 'k': k,
+               'float32': {'bytes': catalog.nbytes, 'searchMs': float(np.mean([ms for _, ms in exact]))},
+               'methods': dict()}
+    ids = [str(i) for i in range(len(catalog))]
+    for method in methods:
+        index = QuantizedEmbeddingIndex.from_embeddings(ids, catalog, method)
+        shortlists = dict()
+        for factor in shortlist_factors:
+            recalls, shortlist_ms, rescore_ms = [], [], []
+            for query, (truth, _) in zip(query_vectors, exact):
+                shortlist, ms = _timed(index.top_k, query, k * factor)
+                shortlist_ms.append(ms)
+                top_k, ms = _timed(_rescored_top_k, catalog, query, shortlist, k)
+                rescore_ms.append(ms)
+                recalls.append(len(np.intersect1d(top_k, truth)) / k)
+            shortlists[k * factor] = {'recall': float(np.mean(recalls)),
+                                      'shortlistMs': float(np.mean(shortlist_ms)),
+                                      'rescoreMs': float(np.mean(rescore_ms))}
+        results['methods'][method] = {'bytes': index.nbytes,
+                                      'bytesPerVector': index.nbytes / len(index),
+                                      'memorySaved': 1 - index.nbytes / catalog.nbytes,
+                                      'shortlists': shortlists}
+    return results
+
+
+def report(results: Dict):
+    print(f"{results['catalog']} vectors x {results['dimension']} dims, {results['queries']} queries, "
+          f"recall@{results['k']} against exact float32 search")
+    full = results['float32']
+    print(f"{'float32':<8} {full['bytes'] / 2 ** 20:>9.1f} MiB  {full['bytes'] / results['catalog']:>6.0f} B/vector"
+          f"  exact search {full['searchMs']:.2f} ms")
+    for method, r in results['methods'].items():
+        print(f"{method:<8} {r['bytes'] / 2 ** 20:>9.1f} MiB  {r['bytesPerVector']:>6.0f} B/vector"
+              f"  {r['memorySaved']:.1%} saved")
+        for shortlist, s in r['shortlists'].items():
+            print(f"    shortlist {shortlist:>5}  recall {s['recall']:.3f}  shortlist {s['shortlistMs']:>6.2f} ms  "
+                  f"rescore {s['rescoreMs']:>6.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark recall and memory of two-phase search on quantized '
+                                                 'embeddings against exact search.')
+    add_neo4j_arguments(parser, env_prefix='HM_NEO4J')
+    parser.add_argument('--label', default='Product')
+    parser.add_argument('--embedding-property', default='textEmbedding')
+    parser.add_argument('--synthetic', type=int, help='benchmark this many synthetic vectors instead of the database')
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES, help='embeddings held out as queries')
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--shortlist-factors', type=int, nargs='+', default=DEFAULT_SHORTLIST_FACTORS,
+                        help='shortlist sizes to rescore, as multiples of k')
+    parser.add_argument('--methods', nargs='+', choices=QUANTIZATION_METHODS, default=list(QUANTIZATION_METHODS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = synthetic_embeddings(args.synthetic, np.random.default_rng(args.seed))
+    else:
+        registry = Neo4jDriverRegistry()
+        vectors = load_embeddings(registry, args)
+        registry.close()
+    if len(vectors) <= args.queries + args.k:
+        parser.error(f'{len(vectors)} embeddings are too few for {args.queries} queries and k={args.k}')
+    benchmark = run(vectors, args.queries, args.k, args.shortlist_factors, args.methods, args.seed)
+    report(benchmark)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(benchmark, f, indent=1)
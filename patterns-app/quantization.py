@@ -0,0 +1,202 @@
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from langchain_neo4j import Neo4jGraph
+
+    from caching import TransactionWatermark
+
+QUANTIZATION_METHODS = ('int8', 'binary')
+# rows scored per matrix product, so int8 codes are widened to float32 a cache-sized block at a time
+SCORING_CHUNK_ROWS = 256
+# codes fetched per query when loading an index from the graph
+LOAD_BATCH_SIZE = 5000
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def quantize(vectors, method: str) -> np.ndarray:
+    """int8 codes scale each vector so its largest component is ±127. Cosine similarity doesn't depend on a
+    vector's length, so the scale isn't kept. Binary codes are the sign bits, packed 8 per byte."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if method == 'int8':
+        max_abs = np.abs(vectors).max(axis=1, keepdims=True)
+        return np.round(vectors / np.where(max_abs == 0, 1, max_abs) * 127).astype(np.int8)
+    if method == 'binary':
+        return np.packbits(vectors > 0, axis=1)
+    raise ValueError(f"Unknown quantization method {method}, expected one of {', '.join(QUANTIZATION_METHODS)}")
+
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    if hasattr(np, 'bitwise_count') and codes.shape[1] % 8 == 0:
+        # numpy 2 counts bits natively, 64 at a time
+        words = np.bitwise_xor(codes.view(np.uint64), query_code.view(np.uint64))
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.int64)
+
+
+def code_dtype(method: str) -> np.dtype:
+    return np.dtype(np.int8) if method == 'int8' else np.dtype(np.uint8)
+
+
+def compact_property(embedding_property: str, method: str) -> str:
+    """Node property holding the compact copy of `embedding_property` as a byte array, e.g. `textEmbeddingInt8`."""
+    return embedding_property + method.capitalize()
+
+
+class QuantizedEmbeddingIndex:
+    """In-memory int8 or binary codes of node embeddings, keyed by `elementId`, for two-phase vector search.
+
+    `shortlist` finds candidates on the codes only, which take 1 byte (int8) or 1 bit (binary) per dimension instead
+    of 4 for float32. The caller then rescores that shortlist exactly against the full vectors, e.g. with
+    `vector.similarity.cosine` in Cypher. int8 codes are ranked by their cosine similarity with the float query, binary
+    codes by the Hamming distance between their sign bits and the query's.
+    """
+
+    def __init__(self, ids: List[str], codes: np.ndarray, method: str, dimension: int = 1536,
+                 hashes: Optional[List[str]] = None):
+        if method not in QUANTIZATION_METHODS:
+            raise ValueError(f"Unknown quantization method {method}, expected one of {', '.join(QUANTIZATION_METHODS)}")
+        self.ids = ids
+        self.codes = codes
+        self.method = method
+        self.dimension = dimension
+        # fingerprints of the embeddings the codes were made from, to reload only changed codes from the graph
+        self.hashes = hashes
+        if method == 'int8':
+            norms = np.linalg.norm(codes.astype(np.float32), axis=1) if len(codes) else np.zeros(0, np.float32)
+            self.inverse_norms = 1 / np.where(norms == 0, 1, norms)
+
+    @classmethod
+    def from_embeddings(cls, ids: List[str], embeddings, method: str) -> 'QuantizedEmbeddingIndex':
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        return cls(ids, quantize(embeddings, method), method, embeddings.shape[1])
+
+    @classmethod
+    def from_graph(cls,
+                   graph: 'Neo4jGraph',
+                   method: str,
+                   label: str = 'Product',
+                   embedding_property: str = 'textEmbedding',
+                   dimension: int = 1536,
+                   previous: Optional['QuantizedEmbeddingIndex'] = None) -> 'QuantizedEmbeddingIndex':
+        """Loads the compact copies stored by `python -m jobs.product_embedding_quantization`.
+
+        Codes whose embedding fingerprint matches the one they have in `previous` are reused from it rather than
+        fetched again."""
+        prop = compact_property(embedding_property, method)
+        records = graph.query(f"MATCH (n:`{label}`) WHERE n.`{prop}` IS NOT NULL "
+                              f"RETURN elementId(n) AS id, n.`{prop}Hash` AS hash")
+        previous_rows: Dict[str, int] = dict()
+        if previous is not None and previous.hashes is not None and previous.method == method:
+            previous_rows = {element_id: row for row, element_id in enumerate(previous.ids)}
+        width = dimension if method == 'int8' else (dimension + 7) // 8
+        codes = np.empty((len(records), width), dtype=code_dtype(method))
+        to_fetch: Dict[str, int] = dict()
+        for row, record in enumerate(records):
+            previous_row = previous_rows.get(record['id'])
+            if (previous_row is not None and record['hash'] is not None
+                    and previous.hashes[previous_row] == record['hash']):
+                codes[row] = previous.codes[previous_row]
+            else:
+                to_fetch[record['id']] = row
+        fetch_ids = list(to_fetch)
+        for start in range(0, len(fetch_ids), LOAD_BATCH_SIZE):
+            for record in graph.query(f"MATCH (n) WHERE elementId(n) IN $ids AND n.`{prop}` IS NOT NULL "
+                                      f"RETURN elementId(n) AS id, n.`{prop}` AS code",
+                                      params={'ids': fetch_ids[start:start + LOAD_BATCH_SIZE]}):
+                codes[to_fetch.pop(record['id'])] = np.frombuffer(record['code'], dtype=code_dtype(method))
+        # nodes whose code was removed between the two queries
+        keep = np.setdiff1d(np.arange(len(records)), list(to_fetch.values()))
+        return cls([records[i]['id'] for i in keep], codes[keep], method, dimension,
+                   [records[i]['hash'] for i in keep])
+
+    def scores(self, query_vector: List[float]) -> np.ndarray:
+        """Approximate similarity of every row to the query, higher is closer."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        if self.method == 'binary':
+            return 1 - hamming_distances(self.codes, quantize(query, 'binary')[0]) / self.dimension
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), SCORING_CHUNK_ROWS):
+            chunk = self.codes[start:start + SCORING_CHUNK_ROWS]
+            scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+        return scores * self.inverse_norms / (np.linalg.norm(query) or 1)
+
+    def top_k(self, query_vector: List[float], k: int) -> np.ndarray:
+        """Row positions of the `k` best scoring codes, best first."""
+        scores = self.scores(query_vector)
+        if k < len(scores):
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+    def shortlist(self, query_vector: List[float], k: int) -> List[str]:
+        """Element ids of the `k` nearest nodes by their codes, to be rescored against the full vectors."""
+        return [self.ids[i] for i in self.top_k(query_vector, k)]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.inverse_norms.nbytes if self.method == 'int8' else 0)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class RefreshingQuantizedEmbeddingIndex:
+    """A `QuantizedEmbeddingIndex` loaded from the graph that follows changes to the stored codes.
+
+    Before shortlisting, the index is reloaded when the database has committed a transaction since it was loaded (or,
+    without a watermark, on every interval), at most once per `refresh_interval` seconds. A reload only fetches codes
+    whose embedding fingerprint changed, and runs on the first caller's thread while others keep using the current
+    index, which is then swapped in whole. New or changed products are shortlisted once the quantization job has
+    stored their codes and the next reload has run.
+    """
+
+    def __init__(self,
+                 graph: 'Neo4jGraph',
+                 method: str,
+                 label: str = 'Product',
+                 embedding_property: str = 'textEmbedding',
+                 dimension: int = 1536,
+                 watermark: Optional['TransactionWatermark'] = None,
+                 refresh_interval: float = 60.0):
+        self.graph = graph
+        self.method = method
+        self.label = label
+        self.embedding_property = embedding_property
+        self.dimension = dimension
+        self.watermark = watermark
+        self.refresh_interval = refresh_interval
+        self._tx_id = watermark.current() if watermark is not None else None
+        self._index = QuantizedEmbeddingIndex.from_graph(graph, method, label, embedding_property, dimension)
+        self._loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def refresh_if_changed(self) -> QuantizedEmbeddingIndex:
+        """The current index, reloaded first if it may be out of date."""
+        if time.monotonic() - self._loaded_at < self.refresh_interval or not self._lock.acquire(blocking=False):
+            return self._index
+        try:
+            tx_id = self.watermark.current() if self.watermark is not None else None
+            if tx_id is None or tx_id != self._tx_id:
+                self._index = QuantizedEmbeddingIndex.from_graph(self.graph, self.method, self.label,
+                                                                 self.embedding_property, self.dimension, self._index)
+                self._tx_id = tx_id
+            self._loaded_at = time.monotonic()
+        finally:
+            self._lock.release()
+        return self._index
+
+    def shortlist(self, query_vector: List[float], k: int) -> List[str]:
+        return self.refresh_if_changed().shortlist(query_vector, k)
+
+    @property
+    def nbytes(self) -> int:
+        return self._index.nbytes
+
+    def __len__(self) -> int:
+        return len(self._index)
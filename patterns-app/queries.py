@@ -0,0 +1,203 @@
+"""Retrieval queries, prompts and example inputs shared by the pages, benchmarks and load tests."""
+
+NORTHWIND_GRAPH_RETRIEVAL_QUERY = """WITH node AS product, score 
+MATCH (product)<-[:ORDER_CONTAINS]-(o:Order)<-[:ORDERED]-(c:Customer)
+MATCH (product)-[:SUPPLIED_BY]->(s:Supplier)
+WITH product, s, c, count(*) AS orderCount, score
+WITH product, 
+    score,
+    s.companyName AS productSupplierName, 
+    orderCount,
+    {customerName:c.companyName, orderCount:orderCount} AS customerData
+WITH product, 
+    score,
+    productSupplierName,
+    collect(customerData) AS customerData,
+    sum(orderCount) as totalOrders
+MATCH (product)<-[:ORDER_CONTAINS]-(o:Order)-[:ORDER_CONTAINS]->(recommendedProduct:Product)
+WITH product, 
+    score, 
+    productSupplierName, 
+    totalOrders, 
+    customerData, 
+    recommendedProduct, count(*) AS copurchaseCount
+WHERE copurchaseCount > 2
+WITH product, 
+    score, 
+    productSupplierName, 
+    totalOrders, 
+    customerData, 
+    collect({recommendedProduct:recommendedProduct.productName, copurchaseCount:copurchaseCount}) AS recommendedProducts
+RETURN  product.text AS text, 
+    score,
+    {
+        productSupplierName: productSupplierName, 
+        totalOrders: totalOrders, 
+        customerData: customerData, 
+        recommendedProducts: recommendedProducts
+    } AS metadata
+"""
+
+NORTHWIND_PROMPT_INSTRUCTIONS = """You are a product and retail expert who can answer questions based only on the context below.
+* Answer the question STRICTLY based on the context provided in JSON below.
+* Do not assume or retrieve any information outside of the context 
+* Think step by step before answering.
+* Do not return helpful or extra text or apologies
+* List the results in rich text format if there are more than one results"""
+
+NORTHWIND_T2C_PROMPT_INSTRUCTIONS = '''#Context 
+
+You have expertise in neo4j cypher query language and based on below graph data model schema, you are going to help me write cypher queries. 
+
+Node Labels and Properties
+
+["Customer"], ["country:String", "address:String", "contactTitle:String", "phone:String", "city:String", "contactName:String", "postalCode:String", "companyName:String", "customerID:String", "region:String", "fax:String"]
+["Supplier"], ["country:String", "address:String", "contactTitle:String", "supplierID:String", "phone:String", "city:String", "contactName:String", "postalCode:String", "companyName:String", "fax:String", "region:String", "homePage:String"]
+["Order"], ["orderID:String", "freight:String", "requiredDate:String", "employeeID:String", "shipVia:String", "customerID:String", "orderDate:String", "shippedDate:String"]
+["Category"], ["description:String", "categoryName:String", "picture:String", "categoryID:String"]
+["Product"], ["reorderLevel:Integer", "unitsInStock:Integer", "unitPrice:Float", "supplierID:String", "productID:String", "discontinued:String", "quantityPerUnit:String", "unitsOnOrder:Integer", "productName:String", "categoryID:String"]
+["Address"], ["addressID", "name", "address", "city", "region", "postalCode", "country"]
+
+Accepted graph traversal paths
+
+(:Customer)-[:ORDERED]->(:Order), 
+(:Product)-[:BELONGS_TO]->(:Category),
+(:Product)-[:SUPPLIED_BY]->(:Supplier), 
+(:Order)-[:ORDER_CONTAINS]->(:Product), 
+(:Order)-[:SHIPPED_TO]->(:Address)
+'''
+
+NORTHWIND_T2C_SAMPLE_QUESTIONS = [
+    'Find the top 10 customers by orders and get the 5 most common products among those orders',
+    'What are the products purchased often together? Provide only the top 10',
+    'Who is the top customer in USA with highest number of orders with the Beverages product category?',
+    'A customer is purchasing "Sir Rodney\'s Marmalade". What top 4 products can we recommend based on past customer transactions?'
+]
+
+HM_GRAPH_VECTOR_RETRIEVAL_QUERY = """WITH node AS searchProduct, score AS searchScore
+MATCH(searchProduct)<-[:VARIANT_OF]-(searchArticle:Article)
+WHERE  searchArticle.graphEmbedding IS NOT NULL
+CALL db.index.vector.queryNodes('article_graph_embeddings', 10, searchArticle.graphEmbedding) YIELD node, score
+WHERE score < 1.0
+MATCH (node)-[:VARIANT_OF]->(product)
+RETURN product.`text` AS text, 
+    max(score) AS score, 
+    product {.*, `text`: Null, `textEmbedding`: Null, id: Null} AS metadata
+ORDER by score DESC LIMIT 20"""
+
+
+# re-ranking inputs for the products an H&M chain retrieved, by productCode: the cosine between the query and the
+# product's stored text embedding and how often its articles were purchased. Kept out of the retrieval queries above,
+# so the patterns shown on the pages stay as they are
+HM_RERANK_SIGNALS_QUERY = """UNWIND $keys AS key
+MATCH (product:Product {productCode: key})
+RETURN key,
+    vector.similarity.cosine($embedding, product.textEmbedding) AS similarity,
+    COUNT { (product)<-[:VARIANT_OF]-(:Article)<-[:PURCHASED]-(:Customer) } AS purchases"""
+
+
+def hm_pairing_prompt(cstmr_name_input, time_of_year_input, cstmr_interests_input):
+    return f'''
+    You are a personal assistant named Sally for a fashion, home, and beauty company called HRM.
+    write an email to {cstmr_name_input}, one of your customers, to recommend and summarize products that pair well with their 
+    recent purchases and searches given: 
+    - the current season / time of year: {time_of_year_input} 
+    - Recent purchases / searches: {cstmr_interests_input}
+    
+    Please only mention the products listed in the context below. Do not come up with or add any new products to the list.
+    The below candidates are recommended based on the purchase patterns of other customers in the HRM database.
+    Select the best 4 to 5 product subset from the context that best match the time of year: {time_of_year_input} and to pair with recent purchases.
+    Each product comes with an https `url` field. Make sure to provide that https url with descriptive name text in markdown for each product.
+    '''
+
+
+HM_PAIRING_EXAMPLES = [
+    [
+        'Alex Smith',
+        'Oversized Sweaters',
+        'Feb, 2024',
+    ],
+    [
+        'Robin Fischer',
+        'Oversized Sweaters',
+        'Feb, 2024'
+    ],
+    [
+        'Chris Johnson',
+        'Oversized Sweaters',
+        'Feb, 2024'
+    ],
+    [
+        'Robin Fischer',
+        'denim jeans',
+        'Feb, 2024'
+    ]
+]
+
+HM_PREFILTER_QUERY = """
+MATCH (:Customer {customerId:$customerId})-[:PURCHASED]->(:Article)
+<-[:PURCHASED]-(:Customer)-[:PURCHASED]->(recArticle:Article)-[:VARIANT_OF]->(product:Product)
+WITH count(recArticle) AS recommendationScore, product
+ORDER BY recommendationScore DESC LIMIT 100
+WITH product AS node, {recommendationScore:recommendationScore} AS prefilterMetadata"""
+
+HM_POSTFILTER_RETRIEVAL_QUERY = """WITH node AS product, score AS searchScore
+OPTIONAL MATCH(product)<-[:VARIANT_OF]-(:Article)<-[:PURCHASED]-(:Customer)
+-[:PURCHASED]->(a:Article)<-[:PURCHASED]-(:Customer {customerId: $customerId})
+
+WITH count(a) AS purchaseScore, product.text AS text, searchScore, product.productCode AS productCode
+RETURN text,
+    (1+purchaseScore)*searchScore AS score,
+    {productCode: productCode, purchaseScore:purchaseScore, searchScore:searchScore} AS metadata
+ORDER BY purchaseScore DESC, searchScore DESC LIMIT 20"""
+
+
+# customers with the longest purchase history, whose pre-filter candidates are worth computing ahead of requests
+HM_ACTIVE_CUSTOMERS_QUERY = """MATCH (c:Customer)
+WITH c, COUNT { (c)-[:PURCHASED]->() } AS purchases
+ORDER BY purchases DESC LIMIT $limit
+RETURN c.customerId AS customerId"""
+
+
+def hm_postfilter_accept(row):
+    """Rows of HM_POSTFILTER_RETRIEVAL_QUERY for products bought by customers with a similar purchase history."""
+    return row['metadata']['purchaseScore'] > 0
+
+
+def hm_seasonal_prompt(cstmr_name_input, time_of_year_input):
+    return f'''
+    You are a personal assistant named Sally for a fashion, home, and beauty company called HRM.
+    write an email to {cstmr_name_input}, one of your customers, to promote and summarize products relevant for them 
+    given the current season / time of year: {time_of_year_input}. 
+    Please only mention the products listed in the context below. Do not come up with or add any new products to the list.
+    Select the best 4 to 5 product subset from the context that best match the time of year: {time_of_year_input}.
+    Each product comes with an https `url` field. Make sure to provide that https url with descriptive name text in markdown for each product.
+    '''
+
+
+HM_FILTERING_EXAMPLES = [
+    [
+        'Alex Smith',
+        'Oversized Sweaters',
+        'daae10780ecd14990ea190a1e9917da33fe96cd8cfa5e80b67b4600171aa77e0',
+        'Feb, 2024',
+    ],
+    [
+        'Robin Fischer',
+        'Oversized Sweaters',
+        '819f4eab1fd76b932fd403ae9f427de8eb9c5b64411d763bb26b5c8c3c30f16f',
+        'Feb, 2024'
+    ],
+    [
+        'Chris Johnson',
+        'Oversized Sweaters',
+        '44b0898ecce6cc1268dfdb0f91e053db014b973f67e34ed8ae28211410910693',
+        'Feb, 2024'
+    ],
+    [
+        'Robin Fischer',
+        'denim jeans',
+        '819f4eab1fd76b932fd403ae9f427de8eb9c5b64411d763bb26b5c8c3c30f16f',
+        'Feb, 2024'
+    ]
+]
@@ -0,0 +1,105 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+# runs a Cypher query with parameters and returns its rows as dicts, e.g. `Neo4jGraph.query`
+QueryRunner = Callable[[str, Dict], List[Dict]]
+AsyncQueryRunner = Callable[[str, Dict], Awaitable[List[Dict]]]
+
+
+def metadata_signal(metadata: Any, key: str) -> float:
+    """Sum of every numeric `key` value in the metadata at any depth, e.g. `copurchaseCount` over the recommended
+    products of a Northwind record."""
+    if isinstance(metadata, dict):
+        return sum(float(v) if k == key and isinstance(v, (int, float)) else metadata_signal(v, key)
+                   for k, v in metadata.items())
+    if isinstance(metadata, list):
+        return sum(metadata_signal(v, key) for v in metadata)
+    return 0.0
+
+
+def min_max(values: np.ndarray) -> np.ndarray:
+    """Scales values to [0, 1]. Missing (NaN) values and values that are the same for every record count as 0."""
+    scaled = np.zeros(len(values), dtype=np.float64)
+    known = ~np.isnan(values)
+    if not known.any():
+        return scaled
+    low, high = values[known].min(), values[known].max()
+    if high > low:
+        scaled[known] = (values[known] - low) / (high - low)
+    return scaled
+
+
+class Reranker:
+    """Re-orders retrieved records and keeps the best `top_m` for the prompt.
+
+    A record's rank is the weighted sum of its retrieval `score` and graph signals given as `signal_weights`, such as
+    `recommendationScore`, `purchaseScore` or `copurchaseCount`. Each input is min-max scaled over the retrieved
+    records, and signals are log-scaled first since they are mostly counts.
+
+    Signals are read from the records' metadata unless a `signal_query` returns them. That query gets the `key`
+    metadata value of every record as `$keys` and the query vector as `$embedding`, and returns one row per key with
+    a `key` column and a column per signal. Its `similarity` column, the cosine between the query and the node's
+    stored embedding, is weighted by `similarity_weight`. It runs once per re-ranking, so the retrieval query shown
+    to users doesn't have to carry re-ranking inputs. Without a signal query there are no network calls.
+    """
+
+    def __init__(self,
+                 top_m: int,
+                 signal_weights: Optional[Dict[str, float]] = None,
+                 score_weight: float = 1.0,
+                 signal_query: Optional[str] = None,
+                 key: str = 'productCode',
+                 similarity_weight: float = 1.0):
+        self.top_m = top_m
+        self.signal_weights = signal_weights or dict()
+        self.score_weight = score_weight
+        self.signal_query = signal_query
+        self.key = key
+        self.similarity_weight = similarity_weight
+
+    def _signal_params(self, records: List[Dict], query_vector: Optional[List[float]]) -> Dict:
+        keys = [(r.get('metadata') or dict()).get(self.key) for r in records]
+        return {'keys': [k for k in keys if k is not None], 'embedding': query_vector}
+
+    def _signal(self, records: List[Dict], signal_rows: Dict[Any, Dict], column: str) -> np.ndarray:
+        """`column` of each record's signal row, or of its metadata for records the signal query didn't return."""
+        values = []
+        for r in records:
+            row = signal_rows.get((r.get('metadata') or dict()).get(self.key)) or dict()
+            value = row[column] if column in row else metadata_signal(r.get('metadata'), column)
+            values.append(np.nan if value is None else value)
+        return np.array(values, dtype=np.float64)
+
+    def scores(self, records: List[Dict], signal_rows: Optional[List[Dict]] = None) -> np.ndarray:
+        rows = {row['key']: row for row in signal_rows or []}
+        scores = self.score_weight * min_max(np.array([r.get('score', np.nan) for r in records], dtype=np.float64))
+        if rows:
+            scores += self.similarity_weight * min_max(self._signal(records, rows, 'similarity'))
+        for key, weight in self.signal_weights.items():
+            scores += weight * min_max(np.log1p(np.maximum(self._signal(records, rows, key), 0)))
+        return scores
+
+    def _best(self, records: List[Dict], signal_rows: Optional[List[Dict]]) -> List[Dict]:
+        best = np.argsort(-self.scores(records, signal_rows), kind='stable')[:self.top_m]
+        return [records[i] for i in best]
+
+    def rerank(self, records: List[Dict], query_vector: Optional[List[float]] = None,
+               run_query: Optional[QueryRunner] = None) -> List[Dict]:
+        """The `top_m` best records, best first. Ties keep their retrieval order. The `signal_query` is only run
+        with a `run_query` and a `query_vector`."""
+        if len(records) <= 1:
+            return records[:self.top_m]
+        signal_rows = None
+        if self.signal_query is not None and run_query is not None and query_vector is not None:
+            signal_rows = run_query(self.signal_query, self._signal_params(records, query_vector))
+        return self._best(records, signal_rows)
+
+    async def arerank(self, records: List[Dict], query_vector: Optional[List[float]] = None,
+                      run_query: Optional[AsyncQueryRunner] = None) -> List[Dict]:
+        if len(records) <= 1:
+            return records[:self.top_m]
+        signal_rows = None
+        if self.signal_query is not None and run_query is not None and query_vector is not None:
+            signal_rows = await run_query(self.signal_query, self._signal_params(records, query_vector))
+        return self._best(records, signal_rows)
@@ -0,0 +1,213 @@
+"""Chains shared by all pages for the lifetime of the Streamlit process.
+
+Streamlit reruns a page script on every interaction, so the chains are built once through `st.cache_resource`
+instead of at page top level. Drivers are shared through the default `Neo4jDriverRegistry`. `warm_up` is run from
+Home.py and builds a dataset's chains, verifies connectivity, checks the vector indexes are ONLINE and plans the
+retrieval queries with EXPLAIN, so the first request on a page costs no setup work either.
+"""
+import threading
+from typing import Callable, Dict, List, Optional
+
+import streamlit as st
+from neo4j import RoutingControl
+
+from context_encoders import CompactContextEncoder, ContextEncoder, JsonContextEncoder
+from cypher_guard import CypherGuard
+from embedding_mirror import EmbeddingMirror
+from graphrag import (DynamicGraphRAGChain, GraphRAGChain, GraphRAGPreFilterChain, GraphRAGText2CypherChain,
+                      Neo4jCredentials, driver_registry)
+from jobs.hm_article_similarity import ARTICLE_GRAPH_EMBEDDING_INDEX, SIMILAR_TO_RETRIEVAL_QUERY
+from jobs.northwind_copurchase import COPURCHASE_RETRIEVAL_QUERY
+from quantization import RefreshingQuantizedEmbeddingIndex
+from queries import (HM_ACTIVE_CUSTOMERS_QUERY, HM_GRAPH_VECTOR_RETRIEVAL_QUERY, HM_POSTFILTER_RETRIEVAL_QUERY,
+                     HM_PREFILTER_QUERY, HM_RERANK_SIGNALS_QUERY, NORTHWIND_GRAPH_RETRIEVAL_QUERY,
+                     NORTHWIND_PROMPT_INSTRUCTIONS, NORTHWIND_T2C_PROMPT_INSTRUCTIONS, hm_postfilter_accept)
+from reranking import Reranker
+
+PRODUCT_TEXT_EMBEDDING_INDEX = 'product_text_embeddings'
+VECTOR_INDEXES_QUERY = "SHOW INDEXES YIELD name, type, state WHERE type = 'VECTOR' RETURN name, state"
+
+
+def credentials(dataset: str) -> Neo4jCredentials:
+    """Credentials from the `NORTHWIND_NEO4J_*` or `HM_NEO4J_*` secrets."""
+    prefix = dataset.upper()
+    return Neo4jCredentials(uri=st.secrets[f'{prefix}_NEO4J_URI'],
+                            username=st.secrets[f'{prefix}_NEO4J_USERNAME'],
+                            password=st.secrets[f'{prefix}_NEO4J_PASSWORD'],
+                            database=st.secrets.get(f'{prefix}_NEO4J_DATABASE', 'neo4j'))
+
+
+def context_encoder() -> ContextEncoder:
+    # indented JSON by default. CONTEXT_ENCODER = "compact" switches to minified, columnar JSON, cut to the best
+    # scoring records that fit CONTEXT_MAX_TOKENS when that is set too
+    if st.secrets.get('CONTEXT_ENCODER', 'json') == 'compact':
+        return CompactContextEncoder(max_tokens=st.secrets.get('CONTEXT_MAX_TOKENS'))
+    return JsonContextEncoder()
+
+
+def _connection_kwargs(dataset: str) -> Dict:
+    c = credentials(dataset)
+    return {'neo4j_uri': c.uri, 'neo4j_username': c.username, 'neo4j_password': c.password,
+            'neo4j_database': c.database, 'neo4j_driver_registry': driver_registry}
+
+
+@st.cache_resource
+def northwind_vector_only_chain() -> GraphRAGChain:
+    return GraphRAGChain(vector_index_name=PRODUCT_TEXT_EMBEDDING_INDEX,
+                         prompt_instructions=NORTHWIND_PROMPT_INSTRUCTIONS,
+                         k=5,
+                         context_encoder=context_encoder(),
+                         name='vector_only_rag_chain',
+                         **_connection_kwargs('northwind'))
+
+
+@st.cache_resource
+def northwind_graph_context_chain() -> GraphRAGChain:
+    # set NORTHWIND_MATERIALIZED_COPURCHASE once `python -m jobs.northwind_copurchase` has materialized co-purchase data
+    graph_retrieval_query = (COPURCHASE_RETRIEVAL_QUERY if st.secrets.get('NORTHWIND_MATERIALIZED_COPURCHASE', False)
+                             else NORTHWIND_GRAPH_RETRIEVAL_QUERY)
+    return GraphRAGChain(vector_index_name=PRODUCT_TEXT_EMBEDDING_INDEX,
+                         prompt_instructions=NORTHWIND_PROMPT_INSTRUCTIONS,
+                         graph_retrieval_query=graph_retrieval_query,
+                         k=5,
+                         context_encoder=context_encoder(),
+                         name='graphrag_chain',
+                         **_connection_kwargs('northwind'))
+
+
+@st.cache_resource
+def northwind_text2cypher_chain() -> GraphRAGText2CypherChain:
+    return GraphRAGText2CypherChain(prompt_instructions=NORTHWIND_T2C_PROMPT_INSTRUCTIONS,
+                                    properties_to_remove_from_cypher_res=['textEmbedding'],
+                                    context_encoder=context_encoder(),
+                                    name='graphrag_t2c_chain',
+                                    cypher_guard=CypherGuard(),
+                                    **_connection_kwargs('northwind'))
+
+
+def _hm_materialized_similar_to() -> bool:
+    # set once `python -m jobs.hm_article_similarity` has materialized article neighbours in the database
+    return st.secrets.get('HM_MATERIALIZED_SIMILAR_TO', False)
+
+
+def _hm_reranker(signal_weights: Optional[Dict[str, float]] = None,
+                 signal_query: Optional[str] = None) -> Optional[Reranker]:
+    # number of re-ranked products kept in the H&M graph chains' prompts, e.g. 8 of the 20 retrieved. 0 keeps all
+    top_m = st.secrets.get('HM_RERANK_TOP_M', 0)
+    return Reranker(top_m=top_m, signal_weights=signal_weights, signal_query=signal_query) if top_m else None
+
+
+@st.cache_resource
+def hm_quantized_index() -> Optional[RefreshingQuantizedEmbeddingIndex]:
+    # set to int8 or binary once `python -m jobs.product_embedding_quantization` has stored that copy of the embeddings
+    method = st.secrets.get('HM_QUANTIZED_EMBEDDINGS')
+    if not method:
+        return None
+    hm = credentials('hm')
+    return RefreshingQuantizedEmbeddingIndex(driver_registry.get_graph(hm), method,
+                                             watermark=driver_registry.get_transaction_watermark(hm))
+
+
+@st.cache_resource
+def hm_vector_only_chain() -> DynamicGraphRAGChain:
+    return DynamicGraphRAGChain(vector_index_name=PRODUCT_TEXT_EMBEDDING_INDEX,
+                                k=10,
+                                context_encoder=context_encoder(),
+                                name='vector_only_chain',
+                                quantized_index=hm_quantized_index(),
+                                **_connection_kwargs('hm'))
+
+
+@st.cache_resource
+def hm_graph_vector_chain() -> DynamicGraphRAGChain:
+    graph_retrieval_query = (SIMILAR_TO_RETRIEVAL_QUERY if _hm_materialized_similar_to()
+                             else HM_GRAPH_VECTOR_RETRIEVAL_QUERY)
+    return DynamicGraphRAGChain(vector_index_name=PRODUCT_TEXT_EMBEDDING_INDEX,
+                                graph_retrieval_query=graph_retrieval_query,
+                                k=10,
+                                context_encoder=context_encoder(),
+                                name='graph_vector_chain',
+                                # the retrieval score is the graph embedding similarity between articles, so add the
+                                # text similarity to the question and the products' purchases
+                                reranker=_hm_reranker({'purchases': 1.0}, HM_RERANK_SIGNALS_QUERY),
+                                quantized_index=hm_quantized_index(),
+                                **_connection_kwargs('hm'))
+
+
+@st.cache_resource
+def hm_embedding_mirror() -> Optional[EmbeddingMirror]:
+    # path of a mirror synced with `python embedding_mirror.py <path>`, to score pre-filter candidates in-process
+    path = st.secrets.get('HM_EMBEDDING_MIRROR')
+    return EmbeddingMirror(path) if path else None
+
+
+def prefill_active_customers(chain: GraphRAGPreFilterChain, limit: int):
+    customers = chain.store.query(HM_ACTIVE_CUSTOMERS_QUERY, params={'limit': limit})
+    chain.prefill_candidates([{'customerId': c['customerId']} for c in customers])
+
+
+@st.cache_resource
+def hm_prefilter_chain() -> GraphRAGPreFilterChain:
+    chain = GraphRAGPreFilterChain(vector_index_name=PRODUCT_TEXT_EMBEDDING_INDEX,
+                                   graph_prefilter_query=HM_PREFILTER_QUERY,
+                                   k=20,
+                                   context_encoder=context_encoder(),
+                                   name='graphrag_prefilter_chain',
+                                   reranker=_hm_reranker({'recommendationScore': 1.0}),
+                                   embedding_mirror=hm_embedding_mirror(),
+                                   **_connection_kwargs('hm'))
+    # number of most active customers whose pre-filter candidates are computed in the background, once per process
+    prefill_customers = st.secrets.get('HM_PREFILL_CANDIDATE_CUSTOMERS', 0)
+    if prefill_customers:
+        threading.Thread(target=prefill_active_customers, args=(chain, prefill_customers), daemon=True).start()
+    return chain
+
+
+@st.cache_resource
+def hm_postfilter_chain() -> DynamicGraphRAGChain:
+    return DynamicGraphRAGChain(vector_index_name=PRODUCT_TEXT_EMBEDDING_INDEX,
+                                graph_retrieval_query=HM_POSTFILTER_RETRIEVAL_QUERY,
+                                k=100,
+                                # stops widening at the first 20 products with purchaseScore > 0, so a product bought
+                                # more often but found later in the vector search can be missed. 0 expands all k
+                                initial_k=st.secrets.get('HM_POSTFILTER_INITIAL_K', 25) or None,
+                                min_rows=20,
+                                accept_row=hm_postfilter_accept,
+                                context_encoder=context_encoder(),
+                                name='graphrag_postfilter_chain',
+                                # the score already weights the search score by purchaseScore
+                                reranker=_hm_reranker(),
+                                quantized_index=hm_quantized_index(),
+                                **_connection_kwargs('hm'))
+
+
+DATASET_CHAINS: Dict[str, List[Callable[[], object]]] = {
+    'northwind': [northwind_vector_only_chain, northwind_graph_context_chain, northwind_text2cypher_chain],
+    'hm': [hm_vector_only_chain, hm_graph_vector_chain, hm_prefilter_chain, hm_postfilter_chain],
+}
+
+
+def _vector_indexes(dataset: str) -> List[str]:
+    if dataset == 'hm' and not _hm_materialized_similar_to():
+        return [PRODUCT_TEXT_EMBEDDING_INDEX, ARTICLE_GRAPH_EMBEDDING_INDEX]
+    return [PRODUCT_TEXT_EMBEDDING_INDEX]
+
+
+@st.cache_resource(show_spinner=False)
+def warm_up(dataset: str) -> Dict:
+    """Builds the dataset's chains and checks its database. Failures raise and are retried on the next rerun, which
+    includes vector indexes that are not ONLINE yet."""
+    chains = [build() for build in DATASET_CHAINS[dataset]]
+    c = credentials(dataset)
+    driver = driver_registry.get_driver(c)
+    driver.verify_connectivity()
+    records, _, _ = driver.execute_query(VECTOR_INDEXES_QUERY, database_=c.database, routing_=RoutingControl.READ)
+    states = {record['name']: record['state'] for record in records}
+    not_online = [f"{name} ({states.get(name, 'MISSING')})" for name in _vector_indexes(dataset)
+                  if states.get(name) != 'ONLINE']
+    if not_online:
+        raise RuntimeError('Vector indexes not ONLINE: ' + ', '.join(not_online))
+    queries = list(dict.fromkeys(q for chain in chains for q in chain.retrieval_query_templates()))
+    for query in queries:
+        driver.execute_query(f'EXPLAIN {query}', database_=c.database, routing_=RoutingControl.READ)
+    return {'vectorIndexes': _vector_indexes(dataset), 'plannedQueries': len(queries)}
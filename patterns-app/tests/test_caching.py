@@ -0,0 +1,45 @@
+from neo4j.exceptions import Neo4jError, ServiceUnavailable, SessionExpired
+
+import caching
+from caching import TransactionWatermark
+
+
+class FlakyDriver:
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+
+    def execute_query(self, *args, **kwargs):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return [{'txId': result}], None, None
+
+
+def test_watermark_retries_after_backoff(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(caching.time, 'monotonic', lambda: now[0])
+    driver = FlakyDriver([Neo4jError(), Neo4jError(), 7])
+    watermark = TransactionWatermark(driver, 'neo4j', refresh_interval=1, retry_backoff=5, max_retry_backoff=8)
+    assert watermark.current() is None
+    now[0] = 4.9
+    assert watermark.current() is None and driver.calls == 1
+    now[0] = 5
+    assert watermark.current() is None and driver.calls == 2
+    now[0] = 12.9
+    assert watermark.current() is None and driver.calls == 2
+    now[0] = 13
+    assert watermark.current() == 7 and driver.calls == 3
+
+
+def test_watermark_treats_driver_errors_as_unknown(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(caching.time, 'monotonic', lambda: now[0])
+    driver = FlakyDriver([ServiceUnavailable(), SessionExpired(), 3])
+    watermark = TransactionWatermark(driver, 'neo4j', refresh_interval=1, retry_backoff=1)
+    assert watermark.current() is None
+    now[0] = 1
+    assert watermark.current() is None
+    now[0] = 3
+    assert watermark.current() == 3 and driver.calls == 3
@@ -0,0 +1,40 @@
+from context_encoders import CompactContextEncoder, JsonContextEncoder, estimate_tokens, to_columnar
+
+RECORDS = [{'text': 'a' * 40, 'score': 0.9}, {'text': 'b' * 40, 'score': 0.5}, {'text': 'c' * 40, 'score': 0.7}]
+
+
+def test_to_columnar():
+    assert to_columnar({'orders': [{'id': 1}, {'id': 2, 'x': 3}]}) == \
+        {'orders': {'columns': ['id', 'x'], 'rows': [[1, None], [2, 3]]}}
+
+
+def test_baseline_tokens_are_counted_only_when_read():
+    counted = []
+
+    def count_tokens(text):
+        counted.append(text)
+        return estimate_tokens(text)
+
+    encoded = CompactContextEncoder(count_tokens=count_tokens).encode(RECORDS)
+    assert len(counted) == 1
+    assert encoded.stats()['tokensSaved'] > 0
+    assert len(counted) == 2
+    encoded.stats()
+    assert len(counted) == 2
+
+
+def test_json_baseline_is_the_context_itself():
+    encoded = JsonContextEncoder(count_tokens=estimate_tokens).encode(RECORDS)
+    assert encoded.baseline_tokens == encoded.tokens
+
+
+def test_token_budget_keeps_best_scoring_records_in_order():
+    encoder = CompactContextEncoder(max_tokens=40, count_tokens=estimate_tokens)
+    encoded = encoder.encode(RECORDS)
+    assert (encoded.records, encoded.dropped_records) == (2, 1)
+    assert 'b' * 40 not in encoded.text and encoded.text.index('a' * 40) < encoded.text.index('c' * 40)
+
+
+def test_budget_below_the_empty_context_keeps_no_records():
+    encoded = CompactContextEncoder(max_tokens=0, count_tokens=estimate_tokens).encode(RECORDS)
+    assert (encoded.records, encoded.dropped_records) == (0, 3)
@@ -0,0 +1,150 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from cypher_guard import (CypherGuard, CypherGuardError, exclude_properties_from_returns, mask_literals,
+                          pattern_variables)
+
+EXCLUDE = ['textEmbedding']
+PROJECTION = '{.*, `textEmbedding`: Null}'
+
+
+def test_mask_literals_keeps_offsets():
+    query = "MATCH (p {name: 'RETURN p'}) // RETURN x\nRETURN p"
+    masked = mask_literals(query)
+    assert len(masked) == len(query)
+    assert masked.count('RETURN') == 1
+
+
+def test_pattern_variables():
+    assert pattern_variables('MATCH (p:Product)-[r:PART_OF]->(c) RETURN p') == {'p', 'r', 'c'}
+    assert pattern_variables("MATCH (p {name: '(q:Product)'}) RETURN p") == {'p'}
+
+
+def test_exclude_rewrites_returned_nodes_and_collections():
+    query = 'MATCH (c:Customer)-[:ORDERED]->(o:Order) RETURN c, collect(o) AS orders, count(o) AS n'
+    assert exclude_properties_from_returns(query, EXCLUDE) == (
+        f'MATCH (c:Customer)-[:ORDERED]->(o:Order) RETURN c {PROJECTION} AS c, '
+        f'collect(o {PROJECTION}) AS orders, count(o) AS n')
+
+
+def test_exclude_keeps_alias_distinct_and_order_by():
+    query = 'MATCH (p:Product) RETURN DISTINCT p AS product ORDER BY p.name LIMIT 5'
+    assert exclude_properties_from_returns(query, EXCLUDE) == (
+        f'MATCH (p:Product) RETURN DISTINCT p {PROJECTION} AS product ORDER BY p.name LIMIT 5')
+
+
+def test_exclude_names_unaliased_collect_after_the_expression():
+    query = 'MATCH (p:Product) RETURN collect(DISTINCT p)'
+    assert exclude_properties_from_returns(query, EXCLUDE) == (
+        f'MATCH (p:Product) RETURN collect(DISTINCT p {PROJECTION}) AS `collect(DISTINCT p)`')
+
+
+def test_exclude_skips_variables_rebound_by_with():
+    query = 'MATCH (n:Product) WITH n.productName AS n RETURN n'
+    assert exclude_properties_from_returns(query, EXCLUDE) == query
+
+
+def test_exclude_skips_variables_rebound_by_unwind_and_yield():
+    unwound = 'MATCH (p:Product) WITH collect(p.productName) AS names UNWIND names AS p RETURN p'
+    assert exclude_properties_from_returns(unwound, EXCLUDE) == unwound
+    yielded = 'MATCH (p:Product) CALL db.labels() YIELD label, p RETURN p'
+    assert exclude_properties_from_returns(yielded, EXCLUDE) == yielded
+
+
+def test_exclude_keeps_variables_carried_through_with():
+    query = 'MATCH (p:Product) WITH p, count(*) AS c RETURN p, c'
+    assert exclude_properties_from_returns(query, EXCLUDE) == (
+        f'MATCH (p:Product) WITH p, count(*) AS c RETURN p {PROJECTION} AS p, c')
+
+
+def test_exclude_leaves_subqueries_and_other_items_alone():
+    query = 'MATCH (p:Product) CALL { WITH p MATCH (p)--(o) RETURN o } RETURN p.name, o.id'
+    assert exclude_properties_from_returns(query, EXCLUDE) == query
+    assert exclude_properties_from_returns('RETURN 1 AS x', EXCLUDE) == 'RETURN 1 AS x'
+    assert exclude_properties_from_returns('MATCH (p) RETURN p', []) == 'MATCH (p) RETURN p'
+
+
+def test_prepare_injects_limit():
+    report = CypherGuard(max_limit=100).prepare('MATCH (p:Product) RETURN p;')
+    assert report.query == 'MATCH (p:Product) RETURN p\nLIMIT 100'
+    assert report.changes == ['Injected LIMIT 100']
+
+
+def test_prepare_clamps_large_limit_and_keeps_small_one():
+    guard = CypherGuard(max_limit=100)
+    assert guard.prepare('MATCH (p) RETURN p LIMIT 5000').query == 'MATCH (p) RETURN p LIMIT 100'
+    report = guard.prepare('MATCH (p) RETURN p LIMIT 10')
+    assert report.query == 'MATCH (p) RETURN p LIMIT 10'
+    assert report.changes == []
+
+
+def test_prepare_only_looks_at_the_final_return():
+    query = 'MATCH (p) CALL { WITH p MATCH (p)--(o) RETURN o LIMIT 5 } RETURN p, o'
+    assert CypherGuard(max_limit=100).prepare(query).query == query + '\nLIMIT 100'
+
+
+def test_prepare_ignores_limit_inside_literals():
+    query = "MATCH (p) WHERE p.name = 'LIMIT 5' RETURN p"
+    assert CypherGuard(max_limit=100).prepare(query).query == query + '\nLIMIT 100'
+
+
+def test_prepare_leaves_parameter_limits_union_and_disabled_guard_alone():
+    guard = CypherGuard(max_limit=100)
+    report = guard.prepare('MATCH (p) RETURN p LIMIT $n')
+    assert report.query == 'MATCH (p) RETURN p LIMIT $n'
+    assert report.changes == ['LIMIT is not a literal and was left as is']
+    union = 'MATCH (a:A) RETURN a.x AS x UNION MATCH (b:B) RETURN b.x AS x'
+    assert guard.prepare(union).query == union
+    assert CypherGuard(max_limit=None).prepare('MATCH (p) RETURN p').query == 'MATCH (p) RETURN p'
+
+
+def plan(operator, estimated_rows, *children):
+    return {'operatorType': operator, 'arguments': {'EstimatedRows': estimated_rows}, 'children': list(children)}
+
+
+class ExplainDriver:
+    """Answers EXPLAIN with a fixed plan and query type, and records the queries it got."""
+
+    def __init__(self, plan, query_type='r'):
+        self.summary = SimpleNamespace(plan=plan, query_type=query_type)
+        self.queries = []
+
+    def execute_query(self, query, **kwargs):
+        self.queries.append(query)
+        return [], self.summary, []
+
+
+class AsyncExplainDriver(ExplainDriver):
+    async def execute_query(self, query, **kwargs):
+        return super().execute_query(query, **kwargs)
+
+
+def test_preflight_explains_the_prepared_query_and_reports_the_plan():
+    guard = CypherGuard(max_limit=100)
+    driver = ExplainDriver(plan('ProduceResults@neo4j', 100, plan('Limit@neo4j', 100, plan('NodeByLabelScan', 77))))
+    report = guard.preflight(driver, guard.prepare('MATCH (p:Product) RETURN p'), 'neo4j')
+    assert driver.queries == ['EXPLAIN MATCH (p:Product) RETURN p\nLIMIT 100']
+    assert report.stats() == {'estimatedRows': 100, 'cartesianProducts': 0, 'queryType': 'r',
+                              'changes': ['Injected LIMIT 100']}
+
+
+def test_preflight_rejects_writes_cartesian_products_and_large_estimates():
+    guard = CypherGuard(max_estimated_rows=1000, max_cartesian_products=0)
+    report = guard.prepare('MATCH (p) DETACH DELETE p')
+    with pytest.raises(CypherGuardError, match='Only read queries'):
+        guard.preflight(ExplainDriver(plan('DetachDelete', 1), query_type='w'), report, 'neo4j')
+    report = guard.prepare('MATCH (a), (b) RETURN a, b')
+    with pytest.raises(CypherGuardError, match='1 cartesian products') as error:
+        guard.preflight(ExplainDriver(plan('ProduceResults', 10, plan('CartesianProduct@neo4j', 10))), report, 'neo4j')
+    assert error.value.report is report
+    with pytest.raises(CypherGuardError, match='estimates 5,000 rows'):
+        guard.preflight(ExplainDriver(plan('ProduceResults', 10, plan('AllNodesScan', 5000))), report, 'neo4j')
+
+
+def test_apreflight_checks_the_plan_like_preflight():
+    guard = CypherGuard(max_estimated_rows=1000)
+    report = guard.prepare('MATCH (p) RETURN p')
+    with pytest.raises(CypherGuardError, match='estimates 5,000 rows'):
+        asyncio.run(guard.apreflight(AsyncExplainDriver(plan('AllNodesScan', 5000)), report, 'neo4j'))
@@ -0,0 +1,29 @@
+from embedding_mirror import EmbeddingMirror
+
+
+class FakeGraph:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def query(self, query, params=None):
+        if params is None:
+            return [{'id': i} for i in self.embeddings]
+        return [{'id': i, 'embedding': self.embeddings[i]} for i in params['ids'] if i in self.embeddings]
+
+
+def test_top_k_lists_ids_not_synced_yet_last(tmp_path):
+    mirror = EmbeddingMirror(str(tmp_path / 'mirror'), dimension=2, writable=True)
+    mirror.sync(FakeGraph({'a': [1, 0], 'b': [0, 1], 'c': [-1, 0]}))
+    assert mirror.top_k(['new', 'c', 'a', 'b'], [1, 0], 2) == [(2, 1.0), (3, 0.5), (0, None)]
+
+
+def test_readers_pick_up_a_sync(tmp_path):
+    path = str(tmp_path / 'mirror')
+    writer = EmbeddingMirror(path, dimension=2, writable=True)
+    writer.sync(FakeGraph({'a': [1, 0]}))
+    reader = EmbeddingMirror(path, dimension=2)
+    assert reader.top_k(['a', 'b'], [0, 1], 2) == [(0, 0.5), (1, None)]
+    writer.sync(FakeGraph({'b': [0, 1]}))
+    reader.reload_if_changed()
+    assert reader.top_k(['a', 'b'], [0, 1], 2) == [(1, 1.0), (0, None)]
+    assert len(reader) == 1
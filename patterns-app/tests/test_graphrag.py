@@ -0,0 +1,270 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import models
+from caching import SemanticCache, TransactionAwareCache
+from instrumentation import Instrumentation
+from cypher_guard import CypherGuard
+from graphrag import (DynamicGraphRAGChain, GraphRAGChain, GraphRAGPreFilterChain, GraphRAGResult,
+                      GraphRAGText2CypherChain, Neo4jCredentials, Neo4jDriverRegistry, build_batch_query,
+                      question_literals, run_config, split_batch_results)
+
+CONNECTION = {'neo4j_uri': 'neo4j://localhost:7687', 'neo4j_username': 'neo4j', 'neo4j_password': 'secret'}
+
+
+class FakeVectorStore:
+    embedding_node_property = 'textEmbedding'
+    text_node_property = 'text'
+
+    def __init__(self, index_name, embedding, graph, retrieval_query=None):
+        self.index_name = index_name
+        self.embedding = embedding
+        self.graph = graph
+        self.retrieval_query = retrieval_query
+
+    def query(self, query, params=None):
+        return self.graph.query(query, params)
+
+    def as_retriever(self, **kwargs):
+        return None
+
+
+class FakeGraph:
+    """Answers each query with `respond(query, params)` and records the queries that ran."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.queries = []
+
+    def query(self, query, params=None):
+        self.queries.append((query, params))
+        return self.respond(query, params)
+
+
+class FakeWatermark:
+    tx_id = 1
+
+    def current(self):
+        return self.tx_id
+
+
+class FakeRegistry:
+    def __init__(self, graph):
+        self.graph = graph
+        self.watermark = FakeWatermark()
+
+    def get_graph(self, credentials):
+        return self.graph
+
+    def get_transaction_watermark(self, credentials):
+        return self.watermark
+
+    async def async_query(self, credentials, query, params=None):
+        return self.graph.query(query, params)
+
+
+@pytest.fixture
+def offline_chains(monkeypatch):
+    """Chains can be built without a database or API keys."""
+    import langchain_neo4j
+    monkeypatch.setenv(models.MODEL_PROVIDER_ENV_VAR, 'local')
+    monkeypatch.setattr(langchain_neo4j.Neo4jVector, 'from_existing_index', lambda **kwargs: FakeVectorStore(**kwargs))
+
+
+def retrieve(chain, x, result):
+    return chain.retriever(x, run_config(result, chain.instrumentation, chain.name))
+
+
+def test_question_literals_numbers_and_quoted_strings():
+    assert question_literals('Find the top 10 customers and the 5 most common products') == ('10', '5')
+    assert question_literals('Who bought "Sir Rodney\'s Marmalade"?') == ("Sir Rodney's Marmalade",)
+    assert question_literals("Who bought 'Chai' in 1997?") == ('Chai', '1997')
+
+
+def test_question_literals_capitalized_names_but_not_sentence_starts():
+    assert question_literals('Who is the top customer in USA for Beverages?') == ('USA', 'Beverages')
+    assert question_literals('Sales of "Chai". What else sells?') == ('Chai',)
+
+
+def test_question_literals_tell_near_identical_questions_apart():
+    assert question_literals('top 5 products') != question_literals('top 10 products')
+    assert question_literals('What are the top 5 products?') == question_literals('Show the top 5 products')
+
+
+def test_semantic_cache_only_matches_within_namespace():
+    cache = SemanticCache(maxsize=4, threshold=0.97)
+    cache.put([1.0, 0.0], 'LIMIT 5', namespace=('model', ('5',)))
+    assert cache.get([1.0, 0.01], namespace=('model', ('5',))) == 'LIMIT 5'
+    assert cache.get([1.0, 0.01], namespace=('model', ('10',))) is None
+
+
+def test_build_batch_query_moves_per_prompt_params_onto_items():
+    template = ("CALL db.index.vector.queryNodes($index, $k, $embedding) YIELD node, score\n"
+                "WITH node AS product, score WHERE product.customerId = $customerId\n"
+                "RETURN product.text AS text, score, {} AS metadata")
+    query, params = build_batch_query(template, [{'customerId': 'a'}, {'customerId': 'b'}], [[0.1], [0.2]])
+    assert 'queryNodes($index, $k, item.`embedding`)' in query
+    assert 'WITH item, node AS product, score WHERE product.customerId = item.`customerId`' in query
+    assert query.startswith('UNWIND $batch AS item\nCALL {\nWITH item\n')
+    assert query.endswith('RETURN item.batchIndex AS batchIndex, text, score, metadata')
+    assert params == {'batch': [{'customerId': 'a', 'embedding': [0.1], 'batchIndex': 0},
+                                {'customerId': 'b', 'embedding': [0.2], 'batchIndex': 1}]}
+
+
+def test_build_batch_query_leaves_string_predicates_and_with_star_alone():
+    template = ("MATCH (node) WHERE node.name STARTS WITH 'a' AND node.name ENDS WITH 'z'\n"
+                "WITH DISTINCT node\nWITH *\nRETURN node.text AS text, 1 AS score, {} AS metadata")
+    query, _ = build_batch_query(template, [dict()], [[0.1]])
+    assert "STARTS WITH 'a'" in query and "ENDS WITH 'z'" in query
+    assert 'WITH DISTINCT item, node' in query
+    assert 'WITH *' in query
+
+
+def test_split_batch_results_groups_rows_by_batch_index():
+    rows = [{'batchIndex': 1, 'text': 'b'}, {'batchIndex': 0, 'text': 'a'}, {'batchIndex': 1, 'text': 'c'}]
+    assert split_batch_results(rows, 3) == [[{'text': 'a'}], [{'text': 'b'}, {'text': 'c'}], []]
+
+
+def test_async_drivers_are_per_event_loop():
+    registry = Neo4jDriverRegistry()
+    credentials = Neo4jCredentials(uri='neo4j://localhost:7687', username='neo4j', password='secret', database='neo4j')
+
+    async def get_twice():
+        driver = registry.get_async_driver(credentials)
+        assert registry.get_async_driver(credentials) is driver
+        return driver
+
+    first, second = asyncio.run(get_twice()), asyncio.run(get_twice())
+    assert first is not second
+    assert len(registry._async_drivers) <= 1
+
+
+def test_registering_a_provider_replaces_the_cached_embedding_model(monkeypatch):
+    from langchain_core.embeddings import FakeEmbeddings
+
+    import models
+    from graphrag import get_embedding_model
+    monkeypatch.setenv(models.MODEL_PROVIDER_ENV_VAR, 'test')
+    first, second = FakeEmbeddings(size=4), FakeEmbeddings(size=4)
+    models.register_provider('test', models.ModelProvider(embeddings=lambda model: first, chat=None))
+    assert get_embedding_model().embeddings is first
+    models.register_provider('test', models.ModelProvider(embeddings=lambda model: second, chat=None))
+    assert get_embedding_model().embeddings is second
+
+
+def prefilter_rows(query, params):
+    if 'RETURN elementId(node) AS id' in query:
+        return [{'id': 'n1', 'prefilterMetadata': {'recommendationScore': 3}}]
+    return [{'text': 'sweater', 'score': 0.9, 'metadata': {'recommendationScore': 3}}]
+
+
+def test_prefilter_cache_hit_reports_the_query_its_rows_came_from(offline_chains):
+    graph = FakeGraph(prefilter_rows)
+    chain = GraphRAGPreFilterChain('product_text_embeddings', neo4j_driver_registry=FakeRegistry(graph),
+                                   retrieval_cache=TransactionAwareCache(), candidate_cache=TransactionAwareCache(),
+                                   **CONNECTION)
+    x = {'searchPrompt': 'sweaters', 'queryParams': {'customerId': 'c1'}}
+    first, hit = GraphRAGResult(), GraphRAGResult()
+    rows = retrieve(chain, x, first)
+    assert retrieve(chain, x, hit) == rows
+    assert [query for query, _ in graph.queries] == [chain.candidate_ids_template, chain.candidate_scoring_template]
+    assert hit.retrieval_query == first.retrieval_query == chain.candidate_scoring_template
+    assert hit.retrieval_query_params == first.retrieval_query_params
+    assert hit.retrieval_query_params['candidates'] == prefilter_rows(chain.candidate_ids_template, None)
+
+
+def test_adaptive_k_stops_at_the_first_step_with_enough_accepted_rows(offline_chains):
+    # the row a larger k would have ranked first is never retrieved: stopping early trades recall for graph work
+    def rows(query, params):
+        found = [{'text': 'few purchases', 'score': 0.9, 'metadata': {'purchaseScore': 1}}]
+        if params['k'] > 2:
+            found.insert(0, {'text': 'many purchases', 'score': 0.5, 'metadata': {'purchaseScore': 500}})
+        return found
+
+    graph = FakeGraph(rows)
+    chain = DynamicGraphRAGChain('product_text_embeddings', k=8, initial_k=2, min_rows=1,
+                                 accept_row=lambda row: row['metadata']['purchaseScore'] > 0,
+                                 neo4j_driver_registry=FakeRegistry(graph), retrieval_cache=None, **CONNECTION)
+    result = GraphRAGResult()
+    res = retrieve(chain, {'searchPrompt': 'sweaters', 'queryParams': dict()}, result)
+    assert [r['text'] for r in res] == ['few purchases']
+    assert result.k == 2 and [params['k'] for _, params in graph.queries] == [2]
+
+    chain.min_rows = 2
+    result = GraphRAGResult()
+    res = retrieve(chain, {'searchPrompt': 'sweaters', 'queryParams': dict()}, result)
+    assert [r['text'] for r in res] == ['many purchases', 'few purchases']
+    assert result.k == 4
+
+
+def test_sync_and_async_retrieval_share_the_query_and_its_cache_entry(offline_chains):
+    graph = FakeGraph(lambda query, params: [{'text': 'Chai', 'score': 0.9, 'metadata': {'unitPrice': 18.0}}])
+    chain = GraphRAGChain('product_text_embeddings', '', neo4j_driver_registry=FakeRegistry(graph),
+                          retrieval_cache=TransactionAwareCache(), **CONNECTION)
+    sync_result, async_result = GraphRAGResult(), GraphRAGResult()
+    docs = chain._retrieve('tea', run_config(sync_result, chain.instrumentation, chain.name))
+    assert asyncio.run(chain._aretrieve('tea', run_config(async_result, chain.instrumentation, chain.name))) == docs
+    assert [query for query, _ in graph.queries] == [sync_result.retrieval_query]
+    assert async_result.retrieval_query == sync_result.retrieval_query == chain.get_full_retrieval_query_template()
+    assert docs[0].page_content == 'Chai' and docs[0].metadata == {'unitPrice': 18.0}
+
+
+class GuardedDriver:
+    """Plans every query as a small read and returns one product for everything else."""
+
+    def __init__(self):
+        self.queries = []
+
+    def execute_query(self, query, **kwargs):
+        text = getattr(query, 'text', query)
+        self.queries.append(text)
+        if text.startswith('EXPLAIN '):
+            summary = SimpleNamespace(plan={'operatorType': 'ProduceResults', 'arguments': {'EstimatedRows': 3}},
+                                      query_type='r')
+            return [], summary, []
+        return [SimpleNamespace(data=lambda: {'n': {'productName': 'Chai'}})], None, []
+
+
+def test_text2cypher_runs_the_rewritten_and_guarded_query(offline_chains):
+    driver = GuardedDriver()
+    registry = FakeRegistry(FakeGraph(lambda query, params: []))
+    registry.get_driver = lambda credentials: driver
+    chain = GraphRAGText2CypherChain('', properties_to_remove_from_cypher_res=['textEmbedding'],
+                                     cypher_guard=CypherGuard(max_limit=3), neo4j_driver_registry=registry,
+                                     cypher_cache=None, semantic_cache=None, result_cache=None, **CONNECTION)
+    result = chain.invoke('Which products are there?', return_result=True)
+    guarded = 'MATCH (n) RETURN n {.*, `textEmbedding`: Null} AS n LIMIT 3'
+    assert result.retrieval_query == guarded
+    assert driver.queries == [f'EXPLAIN {guarded}', guarded]
+    assert result.guard_report.original_query == models.LOCAL_T2C_RESPONSE
+    assert result.guard_report.changes == ['Excluded textEmbedding from returned nodes and relationships',
+                                           'Clamped LIMIT 5 to 3']
+    assert 'Chai' in result.context
+
+
+def test_result_trace_on_a_retrieval_cache_hit(offline_chains):
+    graph = FakeGraph(lambda query, params: [{'text': 'sweater', 'score': 0.9, 'metadata': {'productCode': 1}}])
+    registry = FakeRegistry(graph)
+    instrumentation = Instrumentation()
+    chain = DynamicGraphRAGChain('product_text_embeddings', k=10, neo4j_driver_registry=registry,
+                                 retrieval_cache=TransactionAwareCache(), instrumentation=instrumentation,
+                                 name='chain', **CONNECTION)
+    miss = chain.invoke('Email about sweaters', retrieval_search_text='sweaters', query_params={'customerId': 'c1'},
+                        return_result=True)
+    hit = chain.invoke('Email about sweaters', retrieval_search_text='sweaters', query_params={'customerId': 'c1'},
+                       return_result=True)
+    assert len(graph.queries) == 1 and hit is not miss
+    assert hit.answer == miss.answer == models.LOCAL_LLM_RESPONSE
+    assert hit.retrieval_query == miss.retrieval_query == chain.full_retrieval_query_template
+    assert hit.retrieval_query_params == miss.retrieval_query_params == graph.queries[0][1]
+    assert hit.retrieval_query_params['customerId'] == 'c1' and hit.k == 10
+    assert hit.context == miss.context and 'sweater' in hit.context
+    assert {'embedding', 'retrieval', 'context', 'llm', 'total'} <= set(hit.timings)
+    cache_hits = instrumentation.summary()['chain']['retrieval']['cacheHit']
+    assert cache_hits['count'] == 2 and cache_hits['mean'] == 0.5
+
+    registry.watermark.tx_id = 2
+    chain.invoke('Email about sweaters', retrieval_search_text='sweaters', query_params={'customerId': 'c1'})
+    assert len(graph.queries) == 2
@@ -0,0 +1,50 @@
+from uuid import uuid4
+
+import pytest
+
+from instrumentation import Histogram, Instrumentation, LLMTimingCallback, percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = [1.0, 2.0, 3.0, 4.0]
+    assert [percentile(values, p) for p in (0, 50, 95, 100)] == [1.0, 2.0, 4.0, 4.0]
+    assert percentile([], 50) == 0.0
+
+
+def test_histogram_summarizes_recent_samples_but_counts_all():
+    histogram = Histogram(max_samples=3)
+    for value in (100.0, 1.0, 2.0, 3.0):
+        histogram.observe(value)
+    assert histogram.summary() == {'count': 4, 'mean': 26.5, 'p50': 2.0, 'p95': 3.0, 'p99': 3.0, 'max': 3.0}
+
+
+def test_span_records_ms_sizes_and_invocation_timings_even_on_errors():
+    instrumentation = Instrumentation()
+    timings = dict()
+    with instrumentation.span('chain', 'retrieval', timings) as span:
+        span['rows'] = 20
+    with pytest.raises(RuntimeError):
+        with instrumentation.span('chain', 'retrieval'):
+            raise RuntimeError()
+    retrieval = instrumentation.summary()['chain']['retrieval']
+    assert retrieval['ms']['count'] == 2 and retrieval['rows']['count'] == 1 and retrieval['rows']['max'] == 20
+    assert set(timings) == {'retrieval'}
+    instrumentation.reset()
+    assert instrumentation.summary() == dict()
+
+
+def test_llm_callback_records_ttft_tokens_and_stage_by_tag():
+    instrumentation = Instrumentation()
+    timings = dict()
+    callback = LLMTimingCallback(instrumentation, 'chain', timings)
+    t2c, llm = uuid4(), uuid4()
+    callback.on_chat_model_start(None, [], run_id=t2c, tags=['text2cypher'])
+    callback.on_llm_end(None, run_id=t2c)
+    callback.on_llm_start(None, [], run_id=llm)
+    for token in ('a', 'b', 'c'):
+        callback.on_llm_new_token(token, run_id=llm)
+    callback.on_llm_end(None, run_id=llm)
+    summary = instrumentation.summary()['chain']
+    assert summary['llm']['tokens']['max'] == 3 and summary['llm']['ttftMs']['count'] == 1
+    assert summary['text2cypher']['tokens']['max'] == 0 and 'ttftMs' not in summary['text2cypher']
+    assert set(timings) == {'text2cypher', 'llm', 'llmTtft'}
@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from jobs import hm_article_similarity, northwind_copurchase, product_embedding_quantization
+from jobs.hm_article_similarity import SIMILAR_TO_TOP_N, UPDATE_SIMILAR_TO_QUERY
+from jobs.northwind_copurchase import COPURCHASE_RETRIEVAL_QUERY, COPURCHASE_WEIGHT_THRESHOLD
+from quantization import quantize
+from queries import HM_GRAPH_VECTOR_RETRIEVAL_QUERY, NORTHWIND_GRAPH_RETRIEVAL_QUERY
+
+
+class FakeResult(list):
+    def consume(self):
+        return self
+
+
+class FakeSession:
+    def __init__(self, orders):
+        # orderID -> whether the order has unprocessed line items
+        self.orders = orders
+        self.processed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def run(self, query, after=None, batchSize=None, **params):
+        assert query == northwind_copurchase.ORDER_PAGE_QUERY
+        page = sorted(order_id for order_id in self.orders if order_id > after)[:batchSize]
+        return FakeResult({'orderId': o, 'id': f'e{o}', 'pending': self.orders[o]} for o in page)
+
+    def execute_write(self, work, order_ids):
+        self.processed.append(order_ids)
+        for order_id in order_ids:
+            self.orders[order_id[1:]] = False
+
+
+class FakeDriver:
+    def __init__(self, session):
+        self._session = session
+
+    def session(self, database):
+        return self._session
+
+
+def test_copurchase_threshold_matches_the_page_query():
+    assert f'copurchaseCount > {COPURCHASE_WEIGHT_THRESHOLD}' in NORTHWIND_GRAPH_RETRIEVAL_QUERY
+    assert f'w.weight > {COPURCHASE_WEIGHT_THRESHOLD}' in COPURCHASE_RETRIEVAL_QUERY
+
+
+def test_copurchase_refresh_pages_through_orders_once():
+    session = FakeSession({'10248': False, '10249': True, '10250': True, '10251': False, '10252': True})
+    assert northwind_copurchase.refresh(FakeDriver(session), 'neo4j', batch_size=2)['orders'] == 3
+    assert session.processed == [['e10249'], ['e10250'], ['e10252']]
+    assert northwind_copurchase.refresh(FakeDriver(session), 'neo4j', batch_size=2)['orders'] == 0
+
+
+class RecordingSession:
+    """Answers queries containing a key of `responses` with its rows and records every query and its parameters."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.runs = []
+        self.writes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def run(self, query, **params):
+        self.runs.append((query, params))
+        rows = next((rows for key, rows in self.responses.items() if key in query), [])
+        result = FakeResult(rows)
+        result.counters = SimpleNamespace(properties_set=0, relationships_deleted=0)
+        return result
+
+    def execute_write(self, work, *args):
+        self.writes.append(args)
+
+
+def test_similar_to_keeps_the_page_2_neighbours():
+    # page 2 asks the index for 10 articles and drops the article itself, which scores 1.0
+    assert "queryNodes('article_graph_embeddings', 10," in HM_GRAPH_VECTOR_RETRIEVAL_QUERY
+    assert 'WHERE score < 1.0' in HM_GRAPH_VECTOR_RETRIEVAL_QUERY
+    assert SIMILAR_TO_TOP_N + 1 == 10
+    assert 'queryNodes($index, $topN + 1,' in UPDATE_SIMILAR_TO_QUERY
+    assert 'WHERE node <> a AND score < 1.0' in UPDATE_SIMILAR_TO_QUERY
+
+
+def test_similar_to_refresh_updates_pending_articles_in_batches():
+    session = RecordingSession({'RETURN elementId(a) AS id': [{'id': f'a{i}'} for i in range(5)]})
+    stats = hm_article_similarity.refresh(FakeDriver(session), 'neo4j', batch_size=2)
+    assert stats['articles'] == 5
+    assert session.writes == [(['a0', 'a1'], SIMILAR_TO_TOP_N), (['a2', 'a3'], SIMILAR_TO_TOP_N),
+                              (['a4'], SIMILAR_TO_TOP_N)]
+    assert not any(query in hm_article_similarity.RESET_QUERIES for query, _ in session.runs)
+    hm_article_similarity.refresh(FakeDriver(session), 'neo4j', full=True)
+    assert [query for query, _ in session.runs[3:5]] == hm_article_similarity.RESET_QUERIES
+
+
+def test_quantization_refresh_stores_codes_of_pending_embeddings():
+    embeddings = {'p1': [0.5, -1.0, 0.0], 'p2': [1.0, 1.0, -1.0]}
+    session = RecordingSession({
+        'AND ($full OR': [{'id': i} for i in embeddings],
+        'AS embedding': [{'id': i, 'embedding': e} for i, e in embeddings.items()],
+    })
+    stats = product_embedding_quantization.refresh(FakeDriver(session), 'neo4j', 'int8')
+    assert stats['quantized'] == 2 and stats['property'] == 'textEmbeddingInt8'
+    query, params = session.runs[-1]
+    assert 'SET n.`textEmbeddingInt8` = row.code, n.`textEmbeddingInt8Hash`' in query
+    assert params['rows'] == [{'id': i, 'code': quantize(e, 'int8')[0].tobytes()} for i, e in embeddings.items()]
+    assert np.frombuffer(params['rows'][0]['code'], dtype=np.int8).tolist() == [64, -127, 0]
@@ -0,0 +1,54 @@
+import numpy as np
+
+from quantization import QuantizedEmbeddingIndex, RefreshingQuantizedEmbeddingIndex, compact_property, quantize
+
+
+class FakeGraph:
+    def __init__(self, embeddings, method):
+        self.method = method
+        self.fetched = []
+        self.set(embeddings)
+
+    def set(self, embeddings):
+        self.codes = {i: (quantize(e, self.method)[0].tobytes(), str(e)) for i, e in embeddings.items()}
+
+    def query(self, query, params=None):
+        if params is None:
+            return [{'id': i, 'hash': h} for i, (_, h) in self.codes.items()]
+        self.fetched.extend(params['ids'])
+        return [{'id': i, 'code': self.codes[i][0]} for i in params['ids'] if i in self.codes]
+
+
+class FakeWatermark:
+    tx_id = 1
+
+    def current(self):
+        return self.tx_id
+
+
+def test_quantize_int8_and_binary():
+    assert quantize([[0.5, -1.0, 0.0]], 'int8').tolist() == [[64, -127, 0]]
+    assert quantize([[0.5, -1.0, 0.0] + [1.0] * 5], 'binary').tolist() == [[0b10011111]]
+    assert compact_property('textEmbedding', 'int8') == 'textEmbeddingInt8'
+
+
+def test_shortlist_ranks_by_codes():
+    index = QuantizedEmbeddingIndex.from_embeddings(['a', 'b', 'c'], np.eye(3, 16), 'int8')
+    assert index.shortlist(np.eye(1, 16, 1)[0], 2)[0] == 'b'
+
+
+def test_refreshing_index_reloads_changed_codes_only(monkeypatch):
+    import quantization
+    now = [0.0]
+    monkeypatch.setattr(quantization.time, 'monotonic', lambda: now[0])
+    graph = FakeGraph({'a': [1.0] * 8, 'b': [-1.0] * 8}, 'binary')
+    watermark = FakeWatermark()
+    index = RefreshingQuantizedEmbeddingIndex(graph, 'binary', dimension=8, watermark=watermark, refresh_interval=60)
+    assert graph.fetched == ['a', 'b']
+    graph.set({'a': [1.0] * 8, 'c': [-1.0] * 8})
+    watermark.tx_id = 2
+    assert index.shortlist([-1.0] * 8, 1) == ['b']
+    now[0] = 60
+    assert index.shortlist([-1.0] * 8, 1) == ['c']
+    assert graph.fetched == ['a', 'b', 'c']
+    assert len(index) == 2
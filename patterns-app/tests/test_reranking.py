@@ -0,0 +1,47 @@
+import asyncio
+
+from reranking import Reranker, metadata_signal
+
+
+def test_metadata_signal_sums_nested_values():
+    assert metadata_signal({'copurchaseCount': 2, 'recs': [{'copurchaseCount': 3}, {'other': 9}]},
+                           'copurchaseCount') == 5
+
+
+def test_rerank_combines_score_and_signals_and_keeps_top_m():
+    records = [{'text': 'a', 'score': 0.9, 'metadata': {'recommendationScore': 1}},
+               {'text': 'b', 'score': 0.8, 'metadata': {'recommendationScore': 50}},
+               {'text': 'c', 'score': 0.1, 'metadata': {'recommendationScore': 2}}]
+    assert [r['text'] for r in Reranker(top_m=2).rerank(records)] == ['a', 'b']
+    reranker = Reranker(top_m=2, signal_weights={'recommendationScore': 1.0})
+    assert [r['text'] for r in reranker.rerank(records)] == ['b', 'a']
+
+
+RECORDS = [{'text': 'a', 'score': 0.9, 'metadata': {'productCode': 1}},
+           {'text': 'b', 'score': 0.8, 'metadata': {'productCode': 2}},
+           {'text': 'c', 'score': 0.1, 'metadata': {'productCode': 3}}]
+SIGNAL_ROWS = [{'key': 1, 'similarity': 0.1, 'purchases': 0},
+               {'key': 2, 'similarity': 0.9, 'purchases': 0},
+               {'key': 3, 'similarity': 0.5, 'purchases': 500}]
+
+
+def test_rerank_adds_cosine_and_signals_from_the_signal_query():
+    calls = []
+
+    def run_query(query, params):
+        calls.append((query, params))
+        return SIGNAL_ROWS
+
+    reranker = Reranker(top_m=2, signal_weights={'purchases': 1.0}, signal_query='SIGNALS')
+    assert [r['text'] for r in reranker.rerank(RECORDS, [0.1, 0.2], run_query)] == ['b', 'c']
+    assert calls == [('SIGNALS', {'keys': [1, 2, 3], 'embedding': [0.1, 0.2]})]
+    # without a query runner only the retrieval score counts
+    assert [r['text'] for r in reranker.rerank(RECORDS)] == ['a', 'b']
+
+
+def test_arerank_runs_the_signal_query_asynchronously():
+    async def run_query(query, params):
+        return SIGNAL_ROWS
+
+    reranker = Reranker(top_m=1, score_weight=0.0, signal_query='SIGNALS')
+    assert asyncio.run(reranker.arerank(RECORDS, [0.1], run_query)) == [RECORDS[1]]
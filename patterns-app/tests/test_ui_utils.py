@@ -0,0 +1,39 @@
+import threading
+
+from ui_utils import stream_concurrently
+
+
+class FakePlaceholder:
+    def __init__(self):
+        self.texts = []
+        self.threads = set()
+
+    def markdown(self, text):
+        self.texts.append(text)
+        self.threads.add(threading.get_ident())
+
+
+def test_stream_concurrently_runs_streams_together_and_renders_on_the_calling_thread():
+    # each stream waits for the other one to start, so running them one after another would time out
+    barrier = threading.Barrier(2, timeout=5)
+
+    def stream(tokens):
+        barrier.wait()
+        yield from tokens
+
+    def failing():
+        barrier.wait()
+        yield 'partial'
+        raise RuntimeError('LLM unavailable')
+
+    left, right = FakePlaceholder(), FakePlaceholder()
+    done = []
+    stream_concurrently([
+        (lambda: stream(['Hello', ' world']), left, lambda error: done.append(('left', error, threading.get_ident()))),
+        (failing, right, lambda error: done.append(('right', error, threading.get_ident()))),
+    ])
+    assert left.texts == ['Hello', 'Hello world'] and right.texts == ['partial']
+    assert left.threads == right.threads == {threading.get_ident()}
+    errors = {name: error for name, error, _ in done}
+    assert errors['left'] is None and str(errors['right']) == 'LLM unavailable'
+    assert {thread for _, _, thread in done} == {threading.get_ident()}
@@ -1,7 +1,10 @@
 import base64
-from typing import Dict
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 import streamlit as st
+from streamlit.delta_generator import DeltaGenerator
 
 
 def render_centered_svg_from_str(svg: str, px):
@@ -21,3 +24,52 @@ def get_neo4j_url_from_uri(uri):
     if uri[5] == '+':
         return 'http' + uri[6:]
     return 'http' + uri[5:]
+
+
+def render_context_stats(stats: Dict):
+    if not stats:
+        return
+    caption = f"{stats['tokens']} context tokens, {stats['tokensSaved']} saved vs. indented JSON"
+    if stats['droppedRecords']:
+        caption += f", {stats['droppedRecords']} lowest scoring records dropped to fit the token budget"
+    st.caption(caption)
+
+
+def stream_concurrently(streams: List[Tuple[Callable[[], Iterator[str]], DeltaGenerator,
+                                            Callable[[Optional[Exception]], None]]]):
+    """Runs each `(stream, placeholder, on_done)` stream on its own thread, so a page waits for the slower of its
+    chains rather than the sum of them.
+
+    Streamlit elements can only be updated from the script thread, so the workers push tokens onto a queue and this
+    thread writes them into each stream's placeholder. `on_done(error)` runs here as soon as a stream finishes (error
+    is None on success), e.g. to render the context of that column.
+    """
+    events = queue.Queue()
+
+    def run(i: int, stream: Callable[[], Iterator[str]]):
+        try:
+            for chunk in stream():
+                events.put((i, chunk, None))
+        except Exception as e:
+            events.put((i, None, e))
+        else:
+            events.put((i, None, None))
+
+    texts = [''] * len(streams)
+    executor = ThreadPoolExecutor(max_workers=len(streams))
+    try:
+        for i, (stream, _, _) in enumerate(streams):
+            executor.submit(run, i, stream)
+        pending = len(streams)
+        while pending:
+            i, chunk, error = events.get()
+            _, placeholder, on_done = streams[i]
+            if chunk is not None:
+                texts[i] += chunk
+                placeholder.markdown(texts[i])
+            else:
+                pending -= 1
+                on_done(error)
+    finally:
+        # a rerun stops the script here, the workers then finish in the background instead of blocking it
+        executor.shutdown(wait=False)